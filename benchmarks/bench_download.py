@@ -0,0 +1,91 @@
+"""Benchmark del download: MB/s e CPU per dimensione di blocco, profondità della coda e ricezione.
+
+Ricezione "mmap": risposte scritte direttamente nel file mappato; "buffer": scrittura bufferizzata.
+
+Uso:
+    python benchmarks/bench_download.py --size-mb 64 --latency-ms 40
+    python benchmarks/bench_download.py --size-mb 256 --block-sizes 61440 --depths 8 --receive mmap,buffer
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from standin import LocalSMBServer, LatencyProxy, write_fixture  # noqa: E402
+from ssmbv1_client import SMBv1Client  # noqa: E402
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+RECEIVE_MODES = {'mmap': True, 'buffer': False}
+
+
+def parse_modes(value):
+    modes = [v for v in value.split(',') if v]
+    for mode in modes:
+        if mode not in RECEIVE_MODES:
+            raise argparse.ArgumentTypeError(f"Ricezione non valida: {mode}")
+    return modes
+
+
+def run(args):
+    logging.getLogger('SMBClient').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as share_dir, tempfile.TemporaryDirectory() as local_dir:
+        size = args.size_mb * 1024 * 1024
+        write_fixture(os.path.join(share_dir, 'blob.bin'), size)
+
+        with LocalSMBServer(share_dir) as server:
+            port = server.port
+            proxy = None
+            if args.latency_ms:
+                proxy = LatencyProxy(server.port, args.latency_ms).start()
+                port = proxy.port
+
+            client = SMBv1Client()
+            if not client.connect(server.netbios_name, '127.0.0.1', port=port) or not client.select_share(server.share_name):
+                raise SystemExit("Connessione al server locale fallita")
+            print(f"File {args.size_mb} MB, latenza {args.latency_ms} ms, "
+                  f"blocco negoziato {client.negotiated_read_size()} byte")
+            print(f"{'blocco':>8} {'coda':>5} {'ricezione':>9} {'MB/s':>9} {'secondi':>8} {'CPU s':>7}")
+
+            local_path = os.path.join(local_dir, 'blob.bin')
+            for block_size in args.block_sizes:
+                for depth in args.depths:
+                    for mode in args.receive:
+                        client.read_block_size = block_size
+                        client.mmap_downloads = RECEIVE_MODES[mode]
+                        # Il server gira in un thread dello stesso processo: la CPU include la sua
+                        cpu = time.process_time()
+                        start = time.perf_counter()
+                        ok = client.download_file('blob.bin', local_path, queue_depth=depth)
+                        elapsed = time.perf_counter() - start
+                        cpu = time.process_time() - cpu
+                        if not ok or os.path.getsize(local_path) != size:
+                            print(f"{block_size:>8} {depth:>5} {mode:>9} {'errore':>9}")
+                            continue
+                        print(f"{block_size:>8} {depth:>5} {mode:>9} {size / elapsed / 1e6:>9.1f} "
+                              f"{elapsed:>8.2f} {cpu:>7.2f}")
+
+            client.disconnect()
+            if proxy:
+                proxy.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark download SMBv1 su server locale")
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--block-sizes', type=parse_list, default=[8192, 16384, 32768, 61440])
+    parser.add_argument('--depths', type=parse_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--receive', type=parse_modes, default=['mmap'], help="mmap, buffer o entrambi")
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
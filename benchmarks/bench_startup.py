@@ -0,0 +1,72 @@
+"""Benchmark dell'avvio a freddo: import della libreria, della GUI e comandi CLI completi.
+
+Ogni misura lancia un nuovo interprete, come farebbe un cron job.
+
+Uso:
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from standin import LocalSMBServer, write_fixture  # noqa: E402
+
+
+def measure(argv, runs):
+    """Tempi in ms di runs esecuzioni di argv; None se il comando fallisce"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            print(result.stderr.decode(errors='replace').strip().splitlines()[-1:], file=sys.stderr)
+            return None
+        times.append(elapsed * 1000)
+    return times
+
+
+def run(args):
+    python = sys.executable
+    cases = [
+        ("interprete vuoto", [python, '-c', 'pass']),
+        ("import ssmbv1_client", [python, '-c', 'import ssmbv1_client']),
+        ("libreria senza tkinter", [python, '-c', "import sys, ssmbv1_client; sys.exit('tkinter' in sys.modules)"]),
+        ("import ssmbv1 (GUI)", [python, '-c', 'import ssmbv1']),
+        ("ssmbv1_cli.py --help", [python, 'ssmbv1_cli.py', '--help']),
+    ]
+
+    with tempfile.TemporaryDirectory() as share_dir, tempfile.TemporaryDirectory() as local_dir:
+        write_fixture(os.path.join(share_dir, 'small.bin'), 64 * 1024)
+        with LocalSMBServer(share_dir) as server:
+            cli = [python, 'ssmbv1_cli.py', '--ip', '127.0.0.1', '--name', server.netbios_name,
+                   '--port', str(server.port), '--share', server.share_name]
+            cases += [
+                ("cli ls", cli + ['ls']),
+                ("cli get 64 KB", cli + ['get', 'small.bin', local_dir]),
+            ]
+
+            print(f"{'caso':<26} {'mediana ms':>11} {'min ms':>8}")
+            for name, argv in cases:
+                times = measure(argv, args.runs)
+                if times is None:
+                    print(f"{name:<26} {'errore':>11}")
+                    continue
+                print(f"{name:<26} {statistics.median(times):>11.1f} {min(times):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
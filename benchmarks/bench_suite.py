@@ -0,0 +1,415 @@
+"""Suite di benchmark riproducibile: listing, ricerca, download e upload su alberi di prova, risultati in JSON.
+
+Il server SMBv1 locale (e il proxy di latenza e banda, se richiesto) gira in un
+processo separato, così CPU e picco di memoria misurati sono solo quelli del client.
+Gli alberi di prova sono generati in modo deterministico da --seed e --scale; con
+--fixtures vengono conservati e riusati finché i parametri non cambiano.
+
+Alberi: flat (una cartella enorme), deep (albero profondo), small (molti file
+piccoli), large (pochi file grandi).
+
+Uso:
+    python benchmarks/bench_suite.py --output base.json
+    python benchmarks/bench_suite.py --output nuovo.json --compare base.json --threshold 10
+    python benchmarks/bench_suite.py --latency-ms 20 --bandwidth-mbit 100 --only list_flat,download_large
+    python benchmarks/bench_suite.py --fixtures ~/.cache/ssmbv1/fixtures --scale 0.1 --runs 5
+
+Con --compare il codice di uscita è 1 se una metrica peggiora oltre --threshold percento.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from standin import LocalSMBServer, PeakRSS  # noqa: E402
+from ssmbv1_client import SMBv1Client  # noqa: E402
+
+SHARE_NAME = 'BENCH'
+RESULTS_VERSION = 1
+UPLOAD_DIR = '_upload'
+
+# Metriche in cui un valore più basso è migliore; per le altre vale il contrario
+LOWER_IS_BETTER = ('seconds', 'first_page_ms', 'cpu_s', 'rss_growth_mb')
+
+
+# --- Alberi di prova ---
+def fixture_params(scale):
+    """Parametri di ogni albero per il fattore di scala"""
+    return {
+        'flat': {'files': max(1, int(20000 * scale)), 'size': 64},
+        'deep': {'depth': 8, 'fanout': 2, 'files_per_dir': max(1, int(8 * scale)), 'size': 1024},
+        'small': {'files': max(1, int(4000 * scale)), 'per_dir': 100, 'size': 4096},
+        'large': {'files': 2, 'size': max(1, int(256 * scale)) << 20},
+    }
+
+
+def random_file(path, size, rng, chunk=1 << 20):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            n = min(chunk, remaining)
+            f.write(rng.randbytes(n))
+            remaining -= n
+
+
+def make_flat(root, params, rng):
+    for i in range(params['files']):
+        random_file(os.path.join(root, f"entry{i:06d}.dat"), params['size'], rng)
+
+
+def make_deep(root, params, rng):
+    def level(folder, depth):
+        for i in range(params['files_per_dir']):
+            random_file(os.path.join(folder, f"file{i:02d}.txt"), params['size'], rng)
+        if depth < params['depth']:
+            for j in range(params['fanout']):
+                child = os.path.join(folder, f"level{depth + 1}_{j}")
+                os.mkdir(child)
+                level(child, depth + 1)
+    level(root, 0)
+
+
+def make_small(root, params, rng):
+    for i in range(params['files']):
+        folder = os.path.join(root, f"dir{i // params['per_dir']:04d}")
+        os.makedirs(folder, exist_ok=True)
+        random_file(os.path.join(folder, f"file{i:06d}.bin"), params['size'], rng)
+
+
+def make_large(root, params, rng):
+    for i in range(params['files']):
+        random_file(os.path.join(root, f"blob{i}.bin"), params['size'], rng)
+
+
+FIXTURES = {'flat': make_flat, 'deep': make_deep, 'small': make_small, 'large': make_large}
+
+
+def tree_totals(root):
+    """(file, byte) sotto root"""
+    files = size = 0
+    for folder, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(folder, name))
+    return files, size
+
+
+def prepare_fixtures(base, names, scale, seed):
+    """Crea gli alberi che mancano o hanno parametri diversi; restituisce i parametri usati"""
+    manifest_path = os.path.join(base, 'manifest.json')
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    params = fixture_params(scale)
+    for name in names:
+        wanted = dict(params[name], seed=seed)
+        root = os.path.join(base, name)
+        if manifest.get(name) == wanted and os.path.isdir(root):
+            continue
+        print(f"Creazione albero {name}: {wanted}", file=sys.stderr)
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        FIXTURES[name](root, params[name], random.Random(f"{seed}:{name}"))
+        manifest[name] = wanted
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return {name: manifest[name] for name in names}
+
+
+# --- Scenari: funzione (client, contesto) -> metriche, contesto con fixtures e work ---
+def list_flat(client, ctx):
+    client.listing_cache.clear()
+    start = time.perf_counter()
+    page, cursor = client.list_files_page("\\flat", limit=100)
+    first_page = time.perf_counter() - start
+    if cursor is not None:
+        client.close_cursor(cursor)
+    client.listing_cache.clear()
+    start = time.perf_counter()
+    entries = client.list_files_paginated("\\flat", limit=ctx['params']['flat']['files'] + 1)
+    elapsed = time.perf_counter() - start
+    expected = ctx['params']['flat']['files']
+    if len(entries) != expected or len(page) != min(100, expected):
+        raise RuntimeError(f"Listing incompleto: {len(entries)} voci su {expected}")
+    return {'seconds': elapsed, 'first_page_ms': first_page * 1000, 'entries_per_s': len(entries) / elapsed}
+
+
+def find_deep(client, ctx):
+    start = time.perf_counter()
+    entries = list(client.find("\\deep", "*"))
+    elapsed = time.perf_counter() - start
+    files, _ = ctx['totals']['deep']
+    if sum(1 for e in entries if not e['is_directory']) != files:
+        raise RuntimeError(f"Ricerca incompleta: {len(entries)} voci")
+    return {'seconds': elapsed, 'entries_per_s': len(entries) / elapsed}
+
+
+def download_large(client, ctx):
+    size = 0
+    start = time.perf_counter()
+    for name in sorted(os.listdir(os.path.join(ctx['fixtures'], 'large'))):
+        local = os.path.join(ctx['work'], name)
+        if not client.download_file(f"\\large\\{name}", local):
+            raise RuntimeError(f"Download di {name} fallito")
+        size += os.path.getsize(local)
+    elapsed = time.perf_counter() - start
+    if size != ctx['totals']['large'][1]:
+        raise RuntimeError(f"Scaricati {size} byte su {ctx['totals']['large'][1]}")
+    return {'seconds': elapsed, 'mb_per_s': size / elapsed / 1e6}
+
+
+def upload_large(client, ctx):
+    if not client.create_directory(f"\\{UPLOAD_DIR}"):
+        raise RuntimeError("Cartella di upload non creata")
+    start = time.perf_counter()
+    for name in sorted(os.listdir(os.path.join(ctx['fixtures'], 'large'))):
+        if not client.upload_file(os.path.join(ctx['fixtures'], 'large', name), f"\\{UPLOAD_DIR}\\{name}",
+                                  resume=False):
+            raise RuntimeError(f"Upload di {name} fallito")
+    elapsed = time.perf_counter() - start
+    size = ctx['totals']['large'][1]
+    if tree_totals(os.path.join(ctx['fixtures'], UPLOAD_DIR))[1] != size:
+        raise RuntimeError("Upload incompleto")
+    return {'seconds': elapsed, 'mb_per_s': size / elapsed / 1e6}
+
+
+def download_tree(fixture):
+    def scenario(client, ctx):
+        stats = client.download_directory(f"\\{fixture}", ctx['work'])
+        if not stats or (stats.files, stats.bytes) != ctx['totals'][fixture]:
+            raise RuntimeError(f"Download incompleto: {stats.summary()}")
+        return {'seconds': stats.elapsed, 'mb_per_s': stats.mb_per_s, 'files_per_s': stats.files_per_s}
+    return scenario
+
+
+def upload_tree(fixture):
+    def scenario(client, ctx):
+        stats = client.upload_directory(os.path.join(ctx['fixtures'], fixture), f"\\{UPLOAD_DIR}\\{fixture}")
+        if not stats or (stats.files, stats.bytes) != ctx['totals'][fixture]:
+            raise RuntimeError(f"Upload incompleto: {stats.summary()}")
+        return {'seconds': stats.elapsed, 'mb_per_s': stats.mb_per_s, 'files_per_s': stats.files_per_s}
+    return scenario
+
+
+# nome -> (albero usato, funzione)
+SCENARIOS = {
+    'list_flat': ('flat', list_flat),
+    'find_deep': ('deep', find_deep),
+    'download_deep': ('deep', download_tree('deep')),
+    'upload_deep': ('deep', upload_tree('deep')),
+    'download_small': ('small', download_tree('small')),
+    'upload_small': ('small', upload_tree('small')),
+    'download_large': ('large', download_large),
+    'upload_large': ('large', upload_large),
+}
+
+
+def parse_scenarios(value):
+    names = [v for v in value.split(',') if v]
+    for name in names:
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Scenario non valido: {name} (disponibili: {', '.join(SCENARIOS)})")
+    return names
+
+
+# --- Esecuzione ---
+def start_server(share_dir, latency_ms, bandwidth_mbit):
+    """standin.py in un processo figlio: (processo, porta)"""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standin.py'), share_dir,
+               '--share', SHARE_NAME, '--latency-ms', str(latency_ms)]
+    if bandwidth_mbit:
+        command += ['--bandwidth-mbit', str(bandwidth_mbit)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("PORT "):
+        process.kill()
+        raise SystemExit("Avvio del server locale fallito")
+    return process, int(line.split()[1])
+
+
+def measure(client, scenario, ctx):
+    """Una esecuzione dello scenario con tempo CPU e crescita dell'RSS del client durante lo scenario"""
+    ctx['work'] = tempfile.mkdtemp(prefix='bench-')
+    cpu = time.process_time()
+    try:
+        with PeakRSS() as memory:
+            metrics = scenario(client, ctx)
+        metrics['cpu_s'] = time.process_time() - cpu
+        # Il processo esegue tutti gli scenari: l'RSS assoluto dipenderebbe da quelli eseguiti prima
+        if memory.growth is not None:
+            metrics['rss_growth_mb'] = memory.growth
+        return metrics
+    finally:
+        shutil.rmtree(ctx['work'], ignore_errors=True)
+        shutil.rmtree(os.path.join(ctx['fixtures'], UPLOAD_DIR), ignore_errors=True)
+
+
+def summarize(samples):
+    """Mediana, minimo e massimo di ogni metrica sulle esecuzioni riuscite"""
+    summary = {}
+    for key in samples[0]:
+        values = [s[key] for s in samples]
+        summary[key] = {'median': round(statistics.median(values), 4), 'min': round(min(values), 4),
+                        'max': round(max(values), 4)}
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    try:
+        from importlib.metadata import version
+        impacket = version('impacket')
+    except Exception:
+        impacket = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'cpus': os.cpu_count(), 'impacket': impacket, 'commit': git_commit()}
+
+
+def run(args, fixtures):
+    names = args.only or list(SCENARIOS)
+    params = prepare_fixtures(fixtures, sorted({SCENARIOS[n][0] for n in names}), args.scale, args.seed)
+    ctx = {'fixtures': fixtures, 'params': params,
+           'totals': {name: tree_totals(os.path.join(fixtures, name)) for name in params}}
+    shutil.rmtree(os.path.join(fixtures, UPLOAD_DIR), ignore_errors=True)
+
+    server, port = start_server(fixtures, args.latency_ms, args.bandwidth_mbit)
+    state_dir = tempfile.mkdtemp(prefix='bench-state-')
+    results = {}
+    try:
+        client = SMBv1Client(pool_size=args.pool_size)
+        client.resume_dir = os.path.join(state_dir, 'resume')
+        client.signature_dir = os.path.join(state_dir, 'signatures')
+        if not client.connect(LocalSMBServer.netbios_name, '127.0.0.1', port=port) or \
+                not client.select_share(SHARE_NAME):
+            raise SystemExit("Connessione al server locale fallita")
+        for name in names:
+            fixture, scenario = SCENARIOS[name]
+            samples = []
+            error = None
+            for _ in range(args.warmup + args.runs):
+                try:
+                    samples.append(measure(client, scenario, ctx))
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                    break
+            samples = samples[args.warmup:]
+            results[name] = {'fixture': fixture, 'runs': len(samples), 'error': error,
+                             'metrics': summarize(samples) if samples and not error else {},
+                             'samples': [{k: round(v, 4) for k, v in s.items()} for s in samples]}
+            print_result(name, results[name])
+        client.disconnect()
+    finally:
+        server.kill()
+        server.wait()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'environment': environment(),
+        'config': {'scale': args.scale, 'seed': args.seed, 'runs': args.runs, 'warmup': args.warmup,
+                   'latency_ms': args.latency_ms, 'bandwidth_mbit': args.bandwidth_mbit,
+                   'pool_size': args.pool_size},
+        'fixtures': params,
+        'results': results,
+    }
+
+
+def print_result(name, result):
+    if result['error']:
+        print(f"{name:<16} errore: {result['error']}")
+        return
+    metrics = "  ".join(f"{key} {value['median']:.2f}" for key, value in result['metrics'].items())
+    print(f"{name:<16} {metrics}")
+
+
+def compare(old, new, threshold):
+    """Stampa le variazioni delle mediane rispetto a old; restituisce le metriche peggiorate oltre threshold %"""
+    def config(report):
+        # Il numero di esecuzioni non cambia le condizioni della misura
+        return {k: v for k, v in report.get('config', {}).items() if k not in ('runs', 'warmup')}
+
+    old_fixtures, new_fixtures = old.get('fixtures', {}), new.get('fixtures', {})
+    common = old_fixtures.keys() & new_fixtures.keys()
+    if config(old) != config(new) or any(old_fixtures[k] != new_fixtures[k] for k in common):
+        print("Attenzione: configurazione o alberi diversi dal confronto", file=sys.stderr)
+    regressions = []
+    print(f"\n{'scenario':<16} {'metrica':<14} {'prima':>10} {'dopo':>10} {'var.':>8}")
+    for name, result in new['results'].items():
+        before = old.get('results', {}).get(name, {}).get('metrics', {})
+        for key, value in result['metrics'].items():
+            if key not in before or not before[key]['median']:
+                continue
+            previous, current = before[key]['median'], value['median']
+            change = (current - previous) / previous * 100
+            worse = change if key in LOWER_IS_BETTER else -change
+            flag = " !" if worse > threshold else ""
+            if flag:
+                regressions.append((name, key, change))
+            print(f"{name:<16} {key:<14} {previous:>10.2f} {current:>10.2f} {change:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', type=parse_scenarios, help=f"Scenari separati da virgola: {', '.join(SCENARIOS)}")
+    parser.add_argument('--scale', type=float, default=1.0, help="Fattore di dimensione degli alberi (default: 1)")
+    parser.add_argument('--seed', type=int, default=1, help="Seme del contenuto degli alberi")
+    parser.add_argument('--fixtures', help="Cartella in cui conservare gli alberi fra le esecuzioni "
+                                           "(default: temporanea)")
+    parser.add_argument('--runs', type=int, default=3, help="Esecuzioni misurate per scenario (default: 3)")
+    parser.add_argument('--warmup', type=int, default=1, help="Esecuzioni iniziali scartate (default: 1)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latenza aggiunta, andata e ritorno")
+    parser.add_argument('--bandwidth-mbit', type=float, help="Banda per direzione in Mbit/s")
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--output', help="File JSON dei risultati (default: solo a video)")
+    parser.add_argument('--compare', help="Risultati JSON di un'esecuzione precedente")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Peggioramento percentuale oltre cui --compare segnala una regressione (default: 10)")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs deve essere almeno 1")
+    logging.getLogger('SMBClient').setLevel(logging.WARNING)
+
+    if args.fixtures:
+        os.makedirs(args.fixtures, exist_ok=True)
+        report = run(args, args.fixtures)
+    else:
+        with tempfile.TemporaryDirectory(prefix='bench-fixtures-') as fixtures:
+            report = run(args, fixtures)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    failed = any(result['error'] for result in report['results'].values())
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metriche peggiorate oltre il {args.threshold:.0f}%", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
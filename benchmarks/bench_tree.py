@@ -0,0 +1,83 @@
+"""Benchmark del download ricorsivo: file/s e MB/s su un albero di file piccoli al variare dei worker.
+
+Uso:
+    python benchmarks/bench_tree.py --files 2000 --file-kb 4 --workers 1,3,7 --latency-ms 20
+"""
+import argparse
+import filecmp
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from standin import LocalSMBServer, LatencyProxy, write_fixture  # noqa: E402
+from ssmbv1_client import SMBv1Client  # noqa: E402
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def make_tree(root, files, file_size, per_dir=100):
+    """files file di file_size byte, per_dir per cartella, su due livelli"""
+    for i in range(files):
+        folder = os.path.join(root, f"dir{i // (per_dir * 10):03d}", f"sub{(i // per_dir) % 10:02d}")
+        os.makedirs(folder, exist_ok=True)
+        write_fixture(os.path.join(folder, f"file{i:06d}.log"), file_size, chunk=max(file_size, 1))
+
+
+def same_tree(a, b):
+    compare = filecmp.dircmp(a, b)
+    if compare.left_only or compare.right_only or compare.funny_files:
+        return False
+    _, mismatch, errors = filecmp.cmpfiles(a, b, compare.common_files, shallow=False)
+    if mismatch or errors:
+        return False
+    return all(same_tree(os.path.join(a, d), os.path.join(b, d)) for d in compare.common_dirs)
+
+
+def run(args):
+    logging.getLogger('SMBClient').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as share_dir, tempfile.TemporaryDirectory() as local_dir:
+        make_tree(os.path.join(share_dir, 'tree'), args.files, args.file_kb * 1024)
+
+        with LocalSMBServer(share_dir) as server:
+            port = server.port
+            proxy = None
+            if args.latency_ms:
+                proxy = LatencyProxy(server.port, args.latency_ms).start()
+                port = proxy.port
+
+            print(f"{args.files} file da {args.file_kb} KB, latenza {args.latency_ms} ms")
+            print(f"{'worker':>7} {'file/s':>8} {'MB/s':>7} {'secondi':>8} {'esito':>6}")
+            for workers in args.workers:
+                client = SMBv1Client(pool_size=workers + 1)
+                if not client.connect(server.netbios_name, '127.0.0.1', port=port) or \
+                        not client.select_share(server.share_name):
+                    raise SystemExit("Connessione al server locale fallita")
+                target = os.path.join(local_dir, f"w{workers}")
+                stats = client.download_directory('\\tree', target, workers=workers)
+                ok = bool(stats) and same_tree(os.path.join(share_dir, 'tree'), target)
+                print(f"{workers:>7} {stats.files_per_s:>8.1f} {stats.mb_per_s:>7.2f} "
+                      f"{stats.elapsed:>8.2f} {'ok' if ok else 'ERRORE':>6}")
+                client.disconnect()
+                shutil.rmtree(target, ignore_errors=True)
+
+            if proxy:
+                proxy.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--file-kb', type=int, default=4)
+    parser.add_argument('--workers', type=parse_list, default=[1, 3, 7])
+    parser.add_argument('--latency-ms', type=int, default=20)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
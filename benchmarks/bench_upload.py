@@ -0,0 +1,89 @@
+"""Benchmark dell'upload: MB/s, CPU e picco di memoria per sorgente locale (mmap o read).
+
+Il server gira in un processo separato, così la CPU misurata è solo quella del client.
+
+Uso:
+    python benchmarks/bench_upload.py --size-mb 512 --source mmap,read
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from standin import LocalSMBServer, PeakRSS, write_fixture, free_port  # noqa: E402
+from ssmbv1_client import SMBv1Client  # noqa: E402
+
+SOURCES = {'mmap': True, 'read': False}
+SHARE_NAME = 'BENCH'
+
+
+def parse_sources(value):
+    sources = [v for v in value.split(',') if v]
+    for source in sources:
+        if source not in SOURCES:
+            raise argparse.ArgumentTypeError(f"Sorgente non valida: {source}")
+    return sources
+
+
+def start_server(share_dir, port):
+    """LocalSMBServer in un processo figlio"""
+    code = (f"import sys, time; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+            f"from standin import LocalSMBServer; LocalSMBServer({share_dir!r}, {SHARE_NAME!r}, {port}).start(); "
+            f"time.sleep(86400)")
+    process = subprocess.Popen([sys.executable, '-c', code])
+    time.sleep(1.5)
+    return process
+
+
+def run(args):
+    logging.getLogger('SMBClient').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as share_dir, tempfile.TemporaryDirectory() as local_dir:
+        size = args.size_mb * 1024 * 1024
+        local_path = os.path.join(local_dir, 'blob.bin')
+        write_fixture(local_path, size)
+
+        port = free_port()
+        server = start_server(share_dir, port)
+        try:
+            client = SMBv1Client()
+            client.resume_dir = os.path.join(local_dir, 'resume')
+            if not client.connect(LocalSMBServer.netbios_name, '127.0.0.1', port=port) or \
+                    not client.select_share(SHARE_NAME):
+                raise SystemExit("Connessione al server locale fallita")
+            print(f"File {args.size_mb} MB, blocco negoziato {client.negotiated_write_size()} byte")
+            print(f"{'sorgente':>8} {'MB/s':>8} {'secondi':>8} {'CPU s':>7} {'RSS max MB':>11}")
+            for _ in range(args.runs):
+                for source in args.source:
+                    client.mmap_uploads = SOURCES[source]
+                    cpu = time.process_time()
+                    start = time.perf_counter()
+                    with PeakRSS() as memory:
+                        ok = client.upload_file(local_path, 'blob.bin')
+                    elapsed = time.perf_counter() - start
+                    cpu = time.process_time() - cpu
+                    if not ok or os.path.getsize(os.path.join(share_dir, 'blob.bin')) != size:
+                        print(f"{source:>8} {'errore':>8}")
+                        continue
+                    peak = f"{memory.peak:.0f}" if memory.peak is not None else "-"
+                    print(f"{source:>8} {size / elapsed / 1e6:>8.1f} {elapsed:>8.2f} {cpu:>7.2f} {peak:>11}")
+            client.disconnect()
+        finally:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--source', type=parse_sources, default=['mmap', 'read'], help="mmap, read o entrambi")
+    parser.add_argument('--runs', type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Server SMBv1 locale per i benchmark: impacket SimpleSMBServer su loopback,
+con un proxy opzionale che aggiunge latenza e limita la banda per simulare un link WAN.
+
+Da riga di comando serve una directory finché non viene terminato, e stampa
+"PORT <porta>" appena è pronto (la porta del proxy, se richiesto):
+    python benchmarks/standin.py /tmp/share --latency-ms 20 --bandwidth-mbit 100
+"""
+import argparse
+import heapq
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from impacket import nt_errors, smb, smbserver
+
+
+def find_next2(connId, smbServer, recvPacket, parameters, data, maxDataCount):
+    """TRANS2_FIND_NEXT2 con i record allineati a 8 byte come in FIND_FIRST2.
+
+    L'implementazione di impacket non allinea i record ma lascia NextEntryOffset
+    calcolato come se lo fossero, e conta una voce in più: con più di un blocco
+    di risultati un client conforme leggerebbe dati sfalsati.
+    """
+    connData = smbServer.getConnectionData(connId)
+    request = smb.SMBFindNext2_Parameters(flags=recvPacket['Flags2'], data=parameters)
+    sid = request['SID']
+    if recvPacket['Tid'] not in connData['ConnectedShares']:
+        return b'', b'', b'', smbserver.STATUS_SMB_BAD_TID
+    if sid not in connData['SIDs']:
+        return b'', b'', b'', nt_errors.STATUS_INVALID_HANDLE
+
+    results = connData['SIDs'][sid]
+    response = smb.SMBFindNext2Response_Parameters()
+    out = b''
+    count = 0
+    end_of_search = 1
+    for i, record in enumerate(results):
+        raw = record.getData()
+        if len(out) + len(raw) >= maxDataCount or count >= request['SearchCount']:
+            end_of_search = 0
+            connData['SIDs'][sid] = results[i:]
+            response['LastNameOffset'] = len(out)
+            break
+        out += raw + b'\xaa' * ((8 - len(raw) % 8) % 8)
+        count += 1
+    if end_of_search:
+        del connData['SIDs'][sid]
+    response['EndOfSearch'] = end_of_search
+    response['SearchCount'] = count
+    smbServer.setConnectionData(connId, connData)
+    return b'', response, out, nt_errors.STATUS_SUCCESS
+
+
+def free_port():
+    """Porta TCP libera su loopback"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalSMBServer:
+    """SimpleSMBServer in un thread, con una share che punta a una directory locale"""
+
+    # Nome NetBIOS esplicito: '*SMBSERVER' costringe il client a una node status query
+    netbios_name = 'BENCHSMB'
+
+    def __init__(self, share_dir, share_name='BENCH', port=None):
+        self.share_dir = share_dir
+        self.share_name = share_name
+        self.port = port or free_port()
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        logging.getLogger('impacket').setLevel(logging.WARNING)
+        self.server = smbserver.SimpleSMBServer(listenAddress='127.0.0.1', listenPort=self.port)
+        self.server.addShare(self.share_name, self.share_dir, 'benchmark')
+        self.server.setSMB2Support(False)
+        self.server.setSMBChallenge('')
+        self.server.setLogFile('')
+        self.server.getServer().daemon_threads = True
+        self.server.getServer().hookTransaction2(smb.SMB.TRANS2_FIND_NEXT2, find_next2)
+        self.thread = threading.Thread(target=self.server.start, daemon=True)
+        self.thread.start()
+        wait_for_port(self.port)
+        return self
+
+    def stop(self):
+        if self.server:
+            try:
+                self.server.stop()
+            except Exception:
+                pass
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LatencyProxy:
+    """Proxy TCP che ritarda ogni segmento di latency_ms/2 per direzione senza serializzare le richieste.
+
+    Con bandwidth_mbit ogni direzione si comporta come un link di quella capacità:
+    un segmento parte solo quando il link ha finito di trasmettere i precedenti.
+    """
+
+    def __init__(self, target_port, latency_ms, port=None, bandwidth_mbit=None):
+        self.target_port = target_port
+        self.delay = latency_ms / 2000.0
+        self.rate = bandwidth_mbit * 1e6 / 8 if bandwidth_mbit else None  # Byte al secondo
+        self.port = port or free_port()
+        self.listener = None
+        self.running = False
+
+    def start(self):
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', self.port))
+        self.listener.listen(16)
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream)
+            self._pipe(upstream, client)
+
+    def _pipe(self, src, dst):
+        pending = []  # heap di (istante di consegna, seq, dati)
+        cond = threading.Condition()
+        seq = [0]
+        link_free = [0.0]  # Istante in cui il link finisce di trasmettere i segmenti già accodati
+
+        def reader():
+            while True:
+                try:
+                    data = src.recv(262144)
+                except OSError:
+                    data = b''
+                with cond:
+                    seq[0] += 1
+                    sent = time.monotonic()
+                    if self.rate:
+                        sent = link_free[0] = max(sent, link_free[0]) + len(data) / self.rate
+                    heapq.heappush(pending, (sent + self.delay, seq[0], data))
+                    cond.notify()
+                if not data:
+                    return
+
+        def writer():
+            while True:
+                with cond:
+                    while not pending:
+                        cond.wait()
+                    due, _, data = pending[0]
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        cond.wait(wait)
+                        continue
+                    heapq.heappop(pending)
+                if not data:
+                    try:
+                        dst.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                try:
+                    dst.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+
+def rss_mb():
+    """RSS attuale in MB (solo Linux), None altrove"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakRSS:
+    """Campiona l'RSS in un thread finché il blocco with è in corso.
+
+    baseline è l'RSS all'ingresso nel blocco, growth il picco oltre baseline:
+    in un processo che esegue più misure di fila solo growth non dipende da
+    quanta memoria è rimasta occupata dalle misure precedenti.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+
+    @property
+    def growth(self):
+        if self.peak is None or self.baseline is None:
+            return None
+        return self.peak - self.baseline
+
+    def __enter__(self):
+        self.peak = self.baseline = rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        current = rss_mb()
+        if current is not None:
+            self.peak = max(self.peak or 0, current)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            current = rss_mb()
+            if current is not None:
+                self.peak = max(self.peak or 0, current)
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server SMB locale non raggiungibile sulla porta {port}")
+
+
+def write_fixture(path, size, chunk=1 << 20):
+    """Crea un file di dimensione size con contenuto pseudo-casuale"""
+    block = os.urandom(chunk)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            n = min(chunk, remaining)
+            f.write(block[:n])
+            remaining -= n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server SMBv1 locale per i benchmark")
+    parser.add_argument('share_dir')
+    parser.add_argument('--share', default='BENCH')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latenza aggiunta (andata e ritorno)")
+    parser.add_argument('--bandwidth-mbit', type=float, help="Banda per direzione in Mbit/s")
+    args = parser.parse_args()
+
+    server = LocalSMBServer(args.share_dir, args.share, args.port).start()
+    port = server.port
+    if args.latency_ms or args.bandwidth_mbit:
+        port = LatencyProxy(server.port, args.latency_ms, bandwidth_mbit=args.bandwidth_mbit).start().port
+    print(f"PORT {port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
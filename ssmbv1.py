@@ -1,264 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-from impacket.smbconnection import SMBConnection
-from impacket.smb import SessionError
 import threading
 import os
 import logging
 import time
 from queue import Queue, Empty
 
-# --- Logging ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger('SMBClient')
+from ssmbv1_client import SMBv1Client
+from ssmbv1_scheduler import TransferScheduler, DONE, FAILED, RUNNING, QUEUED, PAUSED
 
-# --- Classe client SMB ottimizzata ---
-class SMBv1Client:
-    def __init__(self):
-        self.conn = None
-        self.is_connected = False
-        self.current_share = None
-        self.timeout = 30
-
-    def connect(self, server_name, server_ip, username='', password='', domain='', port=139):
-        """Connette al server SMB con timeout"""
-        try:
-            logger.info(f"Connessione a {server_ip}, user={'<anonimo>' if not username else username}, port={port}")
-            self.conn = SMBConnection(remoteName=server_name, remoteHost=server_ip, sess_port=port)
-            self.conn.setTimeout(self.timeout)
-            self.conn.login(username, password, domain, lmhash='', nthash='', ntlmFallback=True)
-            self.is_connected = True
-            return True
-        except Exception as e:
-            logger.error(f"Errore connessione: {e}")
-            return False
-
-    def list_shares(self):
-        """Lista tutte le share disponibili"""
-        if not self.is_connected:
-            return []
-        
-        shares = []
-        try:
-            share_list = self.conn.listShares()
-            for share in share_list:
-                share_name = share['shi1_netname'][:-1]  # Rimuovi il null terminator
-                if share_name and not share_name.endswith('$'):  # Escludi share amministrative
-                    shares.append(share_name)
-            return shares
-        except Exception as e:
-            logger.error(f"Errore list_shares: {e}")
-            return self.try_common_shares()
-
-    def try_common_shares(self):
-        """Prova a connettersi a share comuni"""
-        common_shares = ['shared', 'Public', 'Files', 'Data', 'Share', 'Documents', 'Temp', 'IPC$']
-        available_shares = []
-        
-        for share in common_shares:
-            try:
-                tid = self.conn.connectTree(share)
-                self.conn.disconnectTree(tid)
-                available_shares.append(share)
-                logger.info(f"Share trovata: {share}")
-            except:
-                continue
-        
-        return available_shares
-
-    def select_share(self, share_name):
-        """Seleziona una share specifica"""
-        try:
-            tid = self.conn.connectTree(share_name)
-            self.conn.disconnectTree(tid)
-            self.current_share = share_name
-            logger.info(f"Share selezionata: {share_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Share {share_name} non accessibile: {e}")
-            return False
-
-    def list_files_paginated(self, path="\\", limit=1000, file_filter=None):
-        """Lista file con limite per performance e filtri"""
-        if not self.is_connected or not self.current_share:
-            return []
-
-        files = []
-        try:
-            tid = self.conn.connectTree(self.current_share)
-            
-            if path == "\\" or path == "":
-                search_path = "*"
-            else:
-                path = path.replace('/', '\\')
-                if path.endswith('\\'):
-                    search_path = path + "*"
-                else:
-                    search_path = path + "\\*"
-            
-            logger.debug(f"Search path: '{search_path}'")
-            
-            file_list = self.conn.listPath(self.current_share, search_path)
-            logger.info(f"Trovati {len(file_list)} elementi totali")
-            
-            count = 0
-            for f in file_list:
-                if count >= limit:
-                    break
-                    
-                try:
-                    name = f.get_longname()
-                    if name in ['.', '..']:
-                        continue
-                    
-                    is_directory = f.is_directory()
-                    
-                    # Applica filtro se specificato
-                    if file_filter:
-                        if file_filter == "folders" and not is_directory:
-                            continue
-                        elif file_filter == "files" and is_directory:
-                            continue
-                    
-                    files.append({
-                        'filename': name,
-                        'is_directory': is_directory,
-                        'size': f.get_filesize()
-                    })
-                    
-                    count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Errore processando file entry: {e}")
-                    continue
-
-            self.conn.disconnectTree(tid)
-            return files
-            
-        except SessionError as e:
-            logger.error(f"Errore SMB list_files: {e}")
-            return []
-        except Exception as e:
-            logger.error(f"Errore generico list_files: {e}")
-            return []
-
-    def download_file(self, remote_path, local_path, progress_callback=None):
-        """Scarica un file dalla share corrente con progresso"""
-        if not self.is_connected or not self.current_share:
-            return False
-        try:
-            remote_path = remote_path.replace('/', '\\')
-            if not remote_path.startswith('\\'):
-                remote_path = '\\' + remote_path
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-
-            tid = self.conn.connectTree(self.current_share)
-            fid = self.conn.openFile(tid, remote_path)
-            
-            # Ottieni dimensione file per progresso
-            file_size = self.conn.getFileSize(tid, fid)
-            downloaded = 0
-            
-            with open(local_path, 'wb') as f:
-                offset = 0
-                while True:
-                    try:
-                        data = self.conn.readFile(tid, fid, offset, 8192)
-                        if not data:
-                            break
-                        f.write(data)
-                        offset += len(data)
-                        downloaded += len(data)
-                        
-                        # Callback progresso
-                        if progress_callback and file_size > 0:
-                            progress = (downloaded / file_size) * 100
-                            progress_callback(progress)
-                            
-                    except Exception as e:
-                        logger.error(f"Errore durante la lettura: {e}")
-                        break
-
-            self.conn.closeFile(tid, fid)
-            self.conn.disconnectTree(tid)
-            logger.info(f"File scaricato: {remote_path} -> {local_path}")
-            return True
-        except Exception as e:
-            logger.error(f"Errore download_file: {e}")
-            return False
-
-    def upload_file(self, local_path, remote_path, progress_callback=None):
-        """Carica un file sulla share corrente con progresso"""
-        if not self.is_connected or not self.current_share:
-            return False
-        try:
-            remote_path = remote_path.replace('/', '\\')
-            if not remote_path.startswith('\\'):
-                remote_path = '\\' + remote_path
-
-            # Leggi il file locale
-            file_size = os.path.getsize(local_path)
-            uploaded = 0
-            
-            with open(local_path, 'rb') as f:
-                file_data = f.read()
-
-            tid = self.conn.connectTree(self.current_share)
-            
-            # Crea il file remoto
-            fid = self.conn.createFile(tid, remote_path)
-            
-            # Scrivi i dati
-            self.conn.writeFile(tid, fid, file_data)
-            
-            # Callback progresso
-            if progress_callback:
-                progress_callback(100)
-            
-            # Chiudi il file
-            self.conn.closeFile(tid, fid)
-            self.conn.disconnectTree(tid)
-            
-            logger.info(f"File caricato: {local_path} -> {remote_path}")
-            return True
-        except Exception as e:
-            logger.error(f"Errore upload_file: {e}")
-            return False
-
-    def create_directory(self, path):
-        """Crea una nuova directory"""
-        if not self.is_connected or not self.current_share:
-            return False
-        try:
-            path = path.replace('/', '\\')
-            if not path.startswith('\\'):
-                path = '\\' + path
-
-            tid = self.conn.connectTree(self.current_share)
-            self.conn.createDirectory(self.current_share, path)
-            self.conn.disconnectTree(tid)
-            
-            logger.info(f"Directory creata: {path}")
-            return True
-        except Exception as e:
-            logger.error(f"Errore create_directory: {e}")
-            return False
-
-    def disconnect(self):
-        """Disconnette in modo sicuro"""
-        if self.conn:
-            try:
-                self.conn.logoff()
-                logger.info("Disconnessione effettuata")
-            except Exception as e:
-                logger.error(f"Errore durante la disconnessione: {e}")
-            finally:
-                self.conn = None
-                self.is_connected = False
-                self.current_share = None
-        else:
-            self.is_connected = False
-            self.current_share = None
+logger = logging.getLogger('SMBClient')
 
 # --- GUI Ottimizzata ---
 class SMBClientGUI:
@@ -268,10 +19,42 @@ class SMBClientGUI:
         self.root.geometry("1200x800")
 
         self.smb_client = SMBv1Client()
+        # Coda dei trasferimenti di singoli file: notifica i cambi di stato al thread Tk
+        self.scheduler = TransferScheduler(max_running=3, on_change=self.on_transfer_changed)
+        self.queue_refresh_ms = 500  # Aggiornamento del pannello mentre ci sono trasferimenti attivi
+        self.queue_refresh_scheduled = False
+        self.queue_items = {}  # id job -> item del pannello
         self.current_path = "\\"
         self.connected = False
         self.file_limit = 1000  # Limite file visualizzati
-        self.current_files = []  # Cache file correnti
+        self.current_files = []  # Cache file correnti: listing completo del percorso, senza filtri
+        self.listing_path = None  # Percorso a cui si riferisce current_files
+        self.listing_time = None  # Istante di fine caricamento di current_files
+        self.listing_ttl = 60  # Secondi dopo cui i filtri ricaricano il listing dal server
+        self.filter_job = None  # Filtro di ricerca in attesa (debounce)
+        self.filter_debounce_ms = 250
+
+        # Rendering incrementale del listing
+        self.listing_queue = Queue()  # (generazione, blocco di file | riepilogo finale) dal worker
+        self.load_generation = 0
+        self.loading = False
+        self.listing_done = None
+        self.render_scheduled = False
+        self.render_slice = 0.015  # Secondi massimi di elaborazione della coda per ciclo del thread Tk
+        self.render_poll_ms = 20
+
+        # Lista virtuale: il listing resta in memoria, nella treeview solo le righe visibili
+        self.view_rows = []  # File filtrati e ordinati mostrati nella lista
+        self.header_rows = []  # Righe fisse in testa (es. "..")
+        self.footer_rows = []  # Righe informative in coda (caricamento, limite)
+        self.view_top = 0  # Indice della prima riga visibile
+        self.visible_rows = 25
+        self.row_margin = 2  # Righe materializzate oltre quelle visibili
+        self.row_items = []  # Item della treeview riutilizzati durante lo scorrimento
+        self.item_values = {}  # Item -> valori mostrati, per non riscrivere righe invariate
+        self.selected_index = None  # Riga selezionata nell'indice, anche se fuori vista
+        self.view_sorted = True
+        self.sort_live_limit = 20000  # Oltre questa soglia si ordina solo a fine caricamento
         
         # Variabili per filtri
         self.show_files_var = tk.BooleanVar(value=True)
@@ -369,17 +152,17 @@ class SMBClientGUI:
         
         # Filtro tipo
         ttk.Radiobutton(filter_frame, text="Tutto", variable=self.file_type_filter, 
-                       value="all", command=self.apply_filters_and_refresh).pack(side="left", padx=5)
+                       value="all", command=self.apply_filters).pack(side="left", padx=5)
         ttk.Radiobutton(filter_frame, text="Solo Cartelle", variable=self.file_type_filter, 
-                       value="folders", command=self.apply_filters_and_refresh).pack(side="left", padx=5)
+                       value="folders", command=self.apply_filters).pack(side="left", padx=5)
         ttk.Radiobutton(filter_frame, text="Solo File", variable=self.file_type_filter, 
-                       value="files", command=self.apply_filters_and_refresh).pack(side="left", padx=5)
+                       value="files", command=self.apply_filters).pack(side="left", padx=5)
         
         # Ricerca
         ttk.Label(filter_frame, text="Cerca:").pack(side="left", padx=(20,0))
         self.search_entry = ttk.Entry(filter_frame, textvariable=self.search_var, width=25)
         self.search_entry.pack(side="left", padx=5)
-        self.search_entry.bind('<KeyRelease>', lambda e: self.apply_filters_and_refresh())
+        self.search_entry.bind('<KeyRelease>', lambda e: self.schedule_filter())
         
         ttk.Button(filter_frame, text="Pulisci", command=self.clear_search).pack(side="left", padx=5)
 
@@ -387,7 +170,7 @@ class SMBClientGUI:
         files_frame = ttk.LabelFrame(main_frame, text="Contenuto", padding=10)
         files_frame.pack(fill="both", expand=True)
 
-        # Treeview con scorrimento virtuale
+        # Treeview con scorrimento virtuale: gli item vengono riutilizzati per le righe visibili
         columns = ("Nome", "Dimensione", "Tipo", "Ultima Modifica")
         self.files_tree = ttk.Treeview(files_frame, columns=columns, show="headings", selectmode="browse")
         
@@ -400,9 +183,10 @@ class SMBClientGUI:
         self.files_tree.column("Ultima Modifica", width=150, anchor="center")
 
         # Scrollbars
-        v_scrollbar = ttk.Scrollbar(files_frame, orient="vertical", command=self.files_tree.yview)
+        v_scrollbar = ttk.Scrollbar(files_frame, orient="vertical", command=self.on_virtual_scroll)
         h_scrollbar = ttk.Scrollbar(files_frame, orient="horizontal", command=self.files_tree.xview)
-        self.files_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.files_tree.configure(xscrollcommand=h_scrollbar.set)
+        self.v_scrollbar = v_scrollbar
 
         self.files_tree.grid(row=0, column=0, sticky="nsew")
         v_scrollbar.grid(row=0, column=1, sticky="ns")
@@ -412,17 +196,54 @@ class SMBClientGUI:
         files_frame.grid_columnconfigure(0, weight=1)
 
         self.files_tree.bind("<Double-1>", self.on_item_double_click)
+        self.files_tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.files_tree.bind("<Configure>", self.on_tree_resize)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.files_tree.bind(sequence, self.on_mouse_wheel)
+        for sequence in ("<Up>", "<Down>", "<Prior>", "<Next>", "<Home>", "<End>"):
+            self.files_tree.bind(sequence, self.on_tree_key)
 
         # Progress bar per operazioni lunghe
         self.progress = ttk.Progressbar(main_frame, mode='determinate')
         self.progress.pack(fill="x", pady=(5, 0))
 
+        # Coda trasferimenti
+        queue_frame = ttk.LabelFrame(main_frame, text="Trasferimenti", padding=5)
+        queue_frame.pack(fill="x", pady=(5, 0))
+        queue_columns = ("File", "Direzione", "Stato", "Progresso", "Velocità", "Tempo residuo")
+        self.queue_tree = ttk.Treeview(queue_frame, columns=queue_columns, show="headings", height=4,
+                                       selectmode="extended")
+        for col in queue_columns:
+            self.queue_tree.heading(col, text=col)
+            self.queue_tree.column(col, width=110, anchor="center")
+        self.queue_tree.column("File", width=360, anchor="w")
+        queue_scrollbar = ttk.Scrollbar(queue_frame, orient="vertical", command=self.queue_tree.yview)
+        self.queue_tree.configure(yscrollcommand=queue_scrollbar.set)
+        self.queue_tree.grid(row=0, column=0, sticky="ew")
+        queue_scrollbar.grid(row=0, column=1, sticky="ns")
+        queue_frame.grid_columnconfigure(0, weight=1)
+
+        queue_buttons = ttk.Frame(queue_frame)
+        queue_buttons.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(5, 0))
+        for text, action in (("⏸ Pausa", self.scheduler.pause), ("▶ Riprendi", self.scheduler.resume),
+                             ("✖ Annulla", self.scheduler.cancel), ("↻ Riprova", self.scheduler.retry)):
+            ttk.Button(queue_buttons, text=text,
+                       command=lambda action=action: self.queue_action(action)).pack(side="left", padx=5)
+        ttk.Button(queue_buttons, text="Pulisci completati",
+                   command=self.clear_finished_transfers).pack(side="left", padx=5)
+        self.queue_status_var = tk.StringVar(value="Nessun trasferimento")
+        ttk.Label(queue_buttons, textvariable=self.queue_status_var).pack(side="right", padx=5)
+
         # Azioni
         actions_frame = ttk.Frame(main_frame)
         actions_frame.pack(fill="x", pady=(10, 0))
         
         ttk.Button(actions_frame, text="📥 Scarica File", command=self.download_file).pack(side="left", padx=5)
         ttk.Button(actions_frame, text="📤 Carica File", command=self.upload_file).pack(side="left", padx=5)
+        ttk.Button(actions_frame, text="📤 Carica Cartella", command=self.upload_folder).pack(side="left", padx=5)
+        # Cartelle: trasferisce solo i file nuovi o con dimensione/data diverse
+        self.sync_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(actions_frame, text="Solo file modificati", variable=self.sync_var).pack(side="left", padx=5)
         
         # Controlli limite file
         limit_frame = ttk.Frame(actions_frame)
@@ -431,7 +252,7 @@ class SMBClientGUI:
         ttk.Label(limit_frame, text="Limite file:").pack(side="left")
         self.limit_var = tk.StringVar(value="1000")
         limit_combo = ttk.Combobox(limit_frame, textvariable=self.limit_var, 
-                                  values=["500", "1000", "2000", "5000"], 
+                                  values=["500", "1000", "2000", "5000", "Nessuno"], 
                                   width=8, state="readonly")
         limit_combo.pack(side="left", padx=5)
         limit_combo.bind('<<ComboboxSelected>>', self.on_limit_changed)
@@ -553,114 +374,330 @@ class SMBClientGUI:
             self.select_share_btn.config(state="normal")
             messagebox.showerror("Errore", f"Impossibile accedere alla share {share_name}")
 
-    def load_files(self):
-        """Carica i file dalla share con caricamento ottimizzato"""
+    def load_files(self, refresh=False):
+        """Carica i file dalla share: il worker invia blocchi in coda, il thread Tk li aggiunge all'indice"""
         if not self.connected:
             return
             
         self.clear_treeview()
         self.status_var.set(f"Caricamento da {self.smb_client.current_share}{self.current_path}...")
+
+        # Ogni caricamento ha un numero: i blocchi di caricamenti superati vengono scartati
+        self.load_generation += 1
+        generation = self.load_generation
+        self.current_files = []
+        self.listing_path = self.current_path
+        self.listing_time = None
+        self.listing_done = None
+        self.loading = True
+
+        # Aggiungi ".." per tornare su (se non siamo alla root)
+        if self.current_path != "\\":
+            self.header_rows = [("..", "", "📁 Cartella", "")]
         
         # Mostra indicatore di caricamento
-        loading_item = self.files_tree.insert("", "end", values=("⏳ Caricamento in corso...", "", "", ""))
+        self.footer_rows = [("⏳ Caricamento in corso...", "", "", "")]
+        self.refresh_view()
+
+        path = self.current_path
+        limit = self.current_limit()
         
         def thread_func():
+            start_time = time.time()
+            loaded = 0
             try:
-                start_time = time.time()
-                file_filter = self.file_type_filter.get() if self.file_type_filter.get() != "all" else None
-                files = self.smb_client.list_files_paginated(self.current_path, 
-                                                           limit=int(self.limit_var.get()),
-                                                           file_filter=file_filter)
-                elapsed_time = time.time() - start_time
-                logger.info(f"Caricamento completato in {elapsed_time:.2f}s - {len(files)} file")
-                self.root.after(0, lambda: self.on_files_loaded(files, loading_item, elapsed_time))
+                for batch in self.smb_client.iter_file_batches(path, limit=limit, refresh=refresh):
+                    if generation != self.load_generation:
+                        break  # Navigazione cambiata: chiude la ricerca sul server
+                    loaded += len(batch)
+                    self.listing_queue.put((generation, batch))
             except Exception as e:
                 logger.error(f"Errore durante il caricamento file: {e}")
-                self.root.after(0, lambda: self.on_files_loaded([], loading_item, 0))
+            elapsed_time = time.time() - start_time
+            logger.info(f"Caricamento completato in {elapsed_time:.2f}s - {loaded} file")
+            self.listing_queue.put((generation, (loaded, limit, elapsed_time)))
         
         threading.Thread(target=thread_func, daemon=True).start()
-
-    def on_files_loaded(self, files, loading_item, elapsed_time):
-        """Mostra i file nella treeview"""
-        if not self.connected:
-            return
-        
-        # Rimuovi indicatore di caricamento
-        if loading_item in self.files_tree.get_children():
-            self.files_tree.delete(loading_item)
-        
-        self.current_files = files  # Salva in cache per filtri
-        
-        # Applica filtri di ricerca
-        filtered_files = self.apply_search_filter(files)
-        
-        # Aggiungi ".." per tornare su (se non siamo alla root)
-        if self.current_path != "\\":
-            self.files_tree.insert("", "end", values=("..", "", "📁 Cartella", ""))
-
-        # Separa cartelle e file
-        folders = []
-        file_items = []
-        
-        for f in filtered_files:
-            filename = f['filename']
-            is_dir = f['is_directory']
-            size = f['size']
-            
-            file_type = "📁 Cartella" if is_dir else "📄 File"
-            size_str = "" if is_dir else self.format_size(size)
-            
-            if is_dir:
-                folders.append((filename, size_str, file_type, ""))
+        if not self.render_scheduled:
+            self.render_scheduled = True
+            self.root.after(0, self.render_listing)
+
+    def current_limit(self):
+        """Limite file selezionato, None se illimitato"""
+        value = self.limit_var.get()
+        return int(value) if value.isdigit() else None
+
+    def render_listing(self):
+        """Svuota la coda del listing nell'indice in blocchi di tempo limitato e aggiorna le righe visibili"""
+        deadline = time.perf_counter() + self.render_slice
+        added = False
+        while time.perf_counter() < deadline:
+            try:
+                generation, payload = self.listing_queue.get_nowait()
+            except Empty:
+                break
+            if generation != self.load_generation or not self.connected:
+                continue
+            if isinstance(payload, tuple):
+                self.listing_done = payload
+                continue
+            self.current_files.extend(payload)
+            self.view_rows.extend(self.filter_files(payload))
+            added = True
+
+        if added:
+            # Listing piccoli restano ordinati durante il caricamento, quelli enormi a fine caricamento
+            if len(self.view_rows) <= self.sort_live_limit:
+                self.sort_view_rows()
             else:
-                file_items.append((filename, size_str, file_type, ""))
-
-        # Inserisci prima le cartelle, poi i file (ordinati)
-        for folder in sorted(folders, key=lambda x: x[0].lower()):
-            self.files_tree.insert("", "end", values=folder)
-        
-        for file_item in sorted(file_items, key=lambda x: x[0].lower()):
-            self.files_tree.insert("", "end", values=file_item)
+                self.view_sorted = False
+            self.status_var.set(f"Caricamento... {len(self.view_rows)} elementi")
+            self.refresh_view()
+
+        if not self.listing_queue.empty():
+            self.root.after(1, self.render_listing)
+        elif self.listing_done is not None:
+            self.on_files_loaded(*self.listing_done)
+            self.listing_done = None
+            self.render_scheduled = False
+        elif self.loading and self.connected:
+            # Il worker è in attesa del server: ricontrolla la coda a breve
+            self.root.after(self.render_poll_ms, self.render_listing)
+        else:
+            self.render_scheduled = False
+
+    @staticmethod
+    def file_sort_key(f):
+        """Cartelle prima dei file, in ordine alfabetico"""
+        return (not f['is_directory'], f['filename'].lower())
+
+    def sort_view_rows(self):
+        """Ordina le righe mostrate"""
+        self.view_rows.sort(key=self.file_sort_key)
+        self.view_sorted = True
+
+    def on_files_loaded(self, loaded, limit, elapsed_time):
+        """Completa il caricamento: ordina l'indice, rimuove l'indicatore e aggiorna lo stato"""
+        self.loading = False
+        self.listing_time = time.monotonic()
+        # La cache resta ordinata: i filtri successivi non devono riordinare
+        self.current_files.sort(key=self.file_sort_key)
+        self.view_rows = self.filter_files(self.current_files)
+        self.view_sorted = True
+        self.footer_rows = []
         
         # Messaggio informativo se raggiunto il limite
-        total_loaded = len(filtered_files)
-        if total_loaded >= int(self.limit_var.get()):
-            self.files_tree.insert("", "end", values=(
-                f"⚠️ Visualizzati {total_loaded} elementi (limite raggiunto)", 
-                "", "Info", ""))
+        if limit and loaded >= limit:
+            self.footer_rows = [(f"⚠️ Visualizzati {loaded} elementi (limite raggiunto)", "", "Info", "")]
+        self.refresh_view()
         
         self.status_var.set(
             f"{self.smb_client.current_share}{self.current_path} - "
-            f"{total_loaded} elementi - {elapsed_time:.2f}s"
+            f"{len(self.view_rows)} elementi - {elapsed_time:.2f}s"
         )
 
-    def apply_search_filter(self, files):
-        """Applica filtro di ricerca alla lista file"""
+    def row_count(self):
+        """Numero di righe della lista virtuale"""
+        return len(self.header_rows) + len(self.view_rows) + len(self.footer_rows)
+
+    def row_values(self, index):
+        """Valori mostrati per la riga index della lista virtuale"""
+        if index < len(self.header_rows):
+            return self.header_rows[index]
+        index -= len(self.header_rows)
+        if index < len(self.view_rows):
+            f = self.view_rows[index]
+            if f['is_directory']:
+                return (f['filename'], "", "📁 Cartella", self.format_mtime(f.get('mtime')))
+            return (f['filename'], self.format_size(f['size']), "📄 File", self.format_mtime(f.get('mtime')))
+        return self.footer_rows[index - len(self.view_rows)]
+
+    def refresh_view(self):
+        """Riscrive gli item della treeview con le righe a partire da view_top"""
+        total = self.row_count()
+        self.view_top = max(0, min(self.view_top, total - self.visible_rows))
+        needed = min(self.visible_rows + self.row_margin, total - self.view_top)
+
+        # Item creati o eliminati solo quando cambia il numero di righe visibili
+        while len(self.row_items) < needed:
+            self.row_items.append(self.files_tree.insert("", "end", values=("", "", "", "")))
+        if len(self.row_items) > needed:
+            surplus = self.row_items[needed:]
+            self.files_tree.delete(*surplus)
+            for item in surplus:
+                self.item_values.pop(item, None)
+            del self.row_items[needed:]
+
+        for pos, item in enumerate(self.row_items):
+            values = self.row_values(self.view_top + pos)
+            if self.item_values.get(item) != values:
+                self.files_tree.item(item, values=values)
+                self.item_values[item] = values
+
+        # La selezione segue la riga dell'indice, non l'item
+        target = ()
+        if self.selected_index is not None:
+            pos = self.selected_index - self.view_top
+            if 0 <= pos < len(self.row_items):
+                target = (self.row_items[pos],)
+        if self.files_tree.selection() != target:
+            self.files_tree.selection_set(target)
+
+        self.files_tree.yview_moveto(0)
+        if total > self.visible_rows:
+            self.v_scrollbar.set(self.view_top / total, (self.view_top + self.visible_rows) / total)
+        else:
+            self.v_scrollbar.set(0, 1)
+
+    def on_virtual_scroll(self, *args):
+        """Comando della scrollbar verticale: sposta la finestra di righe visibili"""
+        if args[0] == "moveto":
+            self.view_top = int(float(args[1]) * self.row_count())
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.view_top += int(args[1]) * step
+        self.refresh_view()
+
+    def on_mouse_wheel(self, event):
+        """Scorrimento con la rotella (MouseWheel su Windows/macOS, Button-4/5 su Linux)"""
+        if event.num == 4 or event.delta > 0:
+            self.view_top -= 3
+        else:
+            self.view_top += 3
+        self.refresh_view()
+        return "break"
+
+    def on_tree_key(self, event):
+        """Navigazione da tastiera sull'indice virtuale invece che sugli item della treeview"""
+        total = self.row_count()
+        if not total:
+            return "break"
+        current = self.view_top if self.selected_index is None else self.selected_index
+        if event.keysym == "Home":
+            index = 0
+        elif event.keysym == "End":
+            index = total - 1
+        else:
+            moves = {"Up": -1, "Down": 1, "Prior": -self.visible_rows, "Next": self.visible_rows}
+            index = current + moves[event.keysym]
+        self.selected_index = max(0, min(index, total - 1))
+
+        # Porta la riga selezionata nell'area visibile
+        if self.selected_index < self.view_top:
+            self.view_top = self.selected_index
+        elif self.selected_index >= self.view_top + self.visible_rows:
+            self.view_top = self.selected_index - self.visible_rows + 1
+        self.refresh_view()
+        return "break"
+
+    def on_tree_resize(self, event):
+        """Ricalcola quante righe entrano nell'area visibile"""
+        header, row_height = 25, 20
+        if self.row_items:
+            bbox = self.files_tree.bbox(self.row_items[0])
+            if bbox:
+                header, row_height = bbox[1], bbox[3]
+        self.visible_rows = max(1, (event.height - header) // row_height)
+        self.refresh_view()
+
+    def on_tree_select(self, event=None):
+        """Registra la riga selezionata come posizione nell'indice"""
+        selection = self.files_tree.selection()
+        if selection and selection[0] in self.row_items:
+            self.selected_index = self.view_top + self.row_items.index(selection[0])
+
+    def selected_entry(self):
+        """Voce del listing della riga selezionata, o None per righe speciali"""
+        self.on_tree_select()
+        if self.selected_index is None:
+            return None
+        index = self.selected_index - len(self.header_rows)
+        if 0 <= index < len(self.view_rows):
+            return self.view_rows[index]
+        return None
+
+    def selected_values(self):
+        """Valori della riga selezionata, o None"""
+        self.on_tree_select()
+        if self.selected_index is None or self.selected_index >= self.row_count():
+            return None
+        return self.row_values(self.selected_index)
+
+    def filter_files(self, files):
+        """Applica filtro per tipo e ricerca alla lista file"""
+        file_filter = self.file_type_filter.get()
         search_term = self.search_var.get().lower().strip()
-        if not search_term:
-            return files
+        if file_filter == "all" and not search_term:
+            return list(files)
         
         filtered = []
         for f in files:
-            if search_term in f['filename'].lower():
-                filtered.append(f)
+            if file_filter == "folders" and not f['is_directory']:
+                continue
+            if file_filter == "files" and f['is_directory']:
+                continue
+            if search_term and search_term not in f['filename'].lower():
+                continue
+            filtered.append(f)
         return filtered
 
-    def apply_filters_and_refresh(self):
-        """Applica tutti i filtri e ricarica"""
-        if self.connected:
+    def listing_expired(self):
+        """True se current_files non è utilizzabile per il percorso corrente"""
+        if self.loading:
+            return self.listing_path != self.current_path
+        return (self.listing_path != self.current_path or self.listing_time is None or
+                time.monotonic() - self.listing_time > self.listing_ttl)
+
+    def schedule_filter(self):
+        """Applica la ricerca solo quando la digitazione si ferma per filter_debounce_ms"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(self.filter_debounce_ms, self.apply_filters)
+
+    def apply_filters(self):
+        """Applica i filtri al listing in cache; il server viene interrogato solo se la cache è scaduta"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+            self.filter_job = None
+        if not self.connected:
+            return
+        if self.listing_expired():
             self.load_files()
+            return
+
+        self.view_rows = self.filter_files(self.current_files)
+        if not self.loading:
+            self.view_sorted = True  # current_files è già ordinata
+        elif len(self.view_rows) <= self.sort_live_limit:
+            self.sort_view_rows()
+        else:
+            self.view_sorted = False
+        self.view_top = 0
+        self.selected_index = None
+        self.refresh_view()
+        if not self.loading:
+            self.status_var.set(
+                f"{self.smb_client.current_share}{self.current_path} - "
+                f"{len(self.view_rows)} di {len(self.current_files)} elementi"
+            )
 
     def clear_search(self):
         """Pulisce la ricerca"""
         self.search_var.set("")
-        self.apply_filters_and_refresh()
+        self.apply_filters()
 
     def on_limit_changed(self, event=None):
         """Gestisce il cambio del limite file"""
         if self.connected:
             self.load_files()
 
+    @staticmethod
+    def format_mtime(mtime):
+        """Data di modifica in ora locale, vuota se il server non la riporta"""
+        if mtime is None:
+            return ""
+        return time.strftime("%d/%m/%Y %H:%M", time.localtime(mtime))
+
     def format_size(self, size):
         """Formatta la dimensione del file in modo leggibile"""
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -670,9 +707,19 @@ class SMBClientGUI:
         return f"{size:.1f} TB"
 
     def clear_treeview(self):
-        """Svuota la treeview"""
-        for item in self.files_tree.get_children():
-            self.files_tree.delete(item)
+        """Svuota la lista virtuale ed elimina gli item in un'unica chiamata"""
+        self.view_rows = []
+        self.header_rows = []
+        self.footer_rows = []
+        self.view_top = 0
+        self.selected_index = None
+        self.view_sorted = True
+        items = self.files_tree.get_children()
+        if items:
+            self.files_tree.delete(*items)
+        self.row_items = []
+        self.item_values = {}
+        self.refresh_view()
 
     def go_root(self):
         """Torna alla radice"""
@@ -698,9 +745,9 @@ class SMBClientGUI:
         self.load_files()
 
     def refresh_files(self):
-        """Aggiorna la lista"""
+        """Aggiorna la lista rileggendola dal server"""
         if self.connected:
-            self.load_files()
+            self.load_files(refresh=True)
 
     def create_folder(self):
         """Crea una nuova cartella"""
@@ -730,18 +777,17 @@ class SMBClientGUI:
         if not self.connected:
             return
             
-        selection = self.files_tree.selection()
-        if not selection:
+        values = self.selected_values()
+        if not values:
             return
         
-        item = self.files_tree.item(selection[0])
-        name = item['values'][0]
+        name = values[0]
         
         # Ignora messaggi informativi
         if name.startswith("⚠️") or name.startswith("⏳"):
             return
 
-        if "Cartella" in item['values'][2]:
+        if "Cartella" in values[2]:
             if name == "..":
                 self.go_up()
             else:
@@ -759,20 +805,22 @@ class SMBClientGUI:
             messagebox.showwarning("Attenzione", "Non connesso al server")
             return
             
-        selection = self.files_tree.selection()
-        if not selection:
+        values = self.selected_values()
+        if not values:
             messagebox.showwarning("Attenzione", "Seleziona un file da scaricare")
             return
         
-        item = self.files_tree.item(selection[0])
-        filename = item['values'][0]
+        filename = values[0]
         
         # Ignora elementi speciali
         if filename.startswith("⚠️") or filename.startswith("⏳"):
             return
             
-        if "Cartella" in item['values'][2]:
-            messagebox.showwarning("Attenzione", "Seleziona un file, non una cartella")
+        if "Cartella" in values[2]:
+            if filename == "..":
+                messagebox.showwarning("Attenzione", "Seleziona un file o una cartella")
+                return
+            self.download_folder(filename)
             return
 
         local_path = filedialog.asksaveasfilename(
@@ -784,28 +832,62 @@ class SMBClientGUI:
         if not local_path:
             return
 
-        self.status_var.set(f"Download {filename}...")
-        self.progress['value'] = 0
+        entry = self.selected_entry()
+        remote_path = os.path.join(self.current_path, filename).replace("/", "\\")
+        self.scheduler.submit(self.smb_client, 'download', remote_path, local_path,
+                              size=entry['size'] if entry else None)
+        self.status_var.set(f"Download {filename} in coda")
+
+    def download_folder(self, folder_name):
+        """Scarica ricorsivamente una cartella con download paralleli"""
+        target_dir = filedialog.askdirectory(
+            title="Cartella di destinazione",
+            initialdir=os.path.expanduser("~/Downloads")
+        )
         
-        def progress_callback(progress):
-            self.root.after(0, lambda: self.progress.config(value=progress))
+        if not target_dir:
+            return
+
+        local_dir = os.path.join(target_dir, folder_name)
+        remote_path = os.path.join(self.current_path, folder_name).replace("/", "\\")
+        self.status_var.set(f"Download cartella {folder_name}...")
+        self.progress['value'] = 0
+        progress_callback = self.folder_progress_callback(f"Download {folder_name}")
+        sync = self.sync_var.get()
 
         def thread_func():
-            try:
-                remote_path = os.path.join(self.current_path, filename).replace("/", "\\")
-                success = self.smb_client.download_file(remote_path, local_path, progress_callback)
-                self.root.after(0, lambda: self.on_download_result(success, filename))
-            except Exception as e:
-                logger.error(f"Errore durante il download: {e}")
-                self.root.after(0, lambda: self.on_download_result(False, filename))
+            stats = self.smb_client.download_directory(remote_path, local_dir, progress_callback=progress_callback,
+                                                       sync=sync)
+            self.root.after(0, lambda: self.on_folder_download_result(stats, folder_name))
         
         threading.Thread(target=thread_func, daemon=True).start()
 
-    def on_download_result(self, success, filename):
+    def folder_progress_callback(self, label):
+        """Callback per download/upload di cartelle: stato e barra (il client limita già la frequenza)"""
+
+        def progress_callback(progress):
+            text = (f"{label}: {progress.files_done}/{progress.files_total} file - "
+                    f"{progress.rate / 1e6:.1f} MB/s, {progress.files_per_s:.0f} file/s")
+            percent = progress.percent
+            self.root.after(0, lambda: (self.status_var.set(text), self.progress.config(value=percent)))
+        return progress_callback
+
+    def on_folder_download_result(self, stats, folder_name):
         self.progress['value'] = 0
+        summary = (f"{stats.files} file, {self.format_size(stats.bytes)} in {stats.elapsed:.1f}s "
+                   f"({stats.mb_per_s:.1f} MB/s, {stats.files_per_s:.0f} file/s)")
+        if stats.skipped:
+            summary += f", {stats.skipped} invariati"
+        if stats:
+            messagebox.showinfo("Successo", f"Cartella scaricata: {folder_name}\n{summary}")
+            self.status_var.set(f"Download completato - {summary}")
+        else:
+            messagebox.showerror("Errore", f"Download di {folder_name} incompleto: {len(stats.failed)} errori\n{summary}")
+            self.status_var.set("Errore download")
+
+    def on_download_result(self, success, filename):
         if success:
-            messagebox.showinfo("Successo", f"File scaricato: {filename}")
-            self.status_var.set("Download completato")
+            self.status_var.set(f"Download completato: {filename}")
         else:
             messagebox.showerror("Errore", f"Errore download: {filename}")
             self.status_var.set("Errore download")
@@ -826,32 +908,128 @@ class SMBClientGUI:
 
         filename = os.path.basename(local_path)
         remote_path = os.path.join(self.current_path, filename).replace("/", "\\")
+        self.scheduler.submit(self.smb_client, 'upload', remote_path, local_path)
+        self.status_var.set(f"Upload {filename} in coda")
 
-        self.status_var.set(f"Upload {filename}...")
-        self.progress['value'] = 0
+    def on_upload_result(self, success, filename, remote_dir=None):
+        if success:
+            self.status_var.set(f"Upload completato: {filename}")
+            if remote_dir is None or remote_dir == self.current_path.rstrip("\\"):
+                self.load_files()  # Ricarica la lista
+        else:
+            messagebox.showerror("Errore", f"Errore upload: {filename}")
+            self.status_var.set("Errore upload")
+
+    def upload_folder(self):
+        """Carica ricorsivamente una cartella locale nel percorso corrente"""
+        if not self.connected:
+            messagebox.showwarning("Attenzione", "Non connesso al server")
+            return
+            
+        local_dir = filedialog.askdirectory(
+            title="Seleziona cartella da caricare",
+            initialdir=os.path.expanduser("~")
+        )
         
-        def progress_callback(progress):
-            self.root.after(0, lambda: self.progress.config(value=progress))
+        if not local_dir:
+            return
+
+        folder_name = os.path.basename(os.path.normpath(local_dir))
+        remote_path = os.path.join(self.current_path, folder_name).replace("/", "\\")
+        self.status_var.set(f"Upload cartella {folder_name}...")
+        self.progress['value'] = 0
+        progress_callback = self.folder_progress_callback(f"Upload {folder_name}")
+        sync = self.sync_var.get()
 
         def thread_func():
-            try:
-                success = self.smb_client.upload_file(local_path, remote_path, progress_callback)
-                self.root.after(0, lambda: self.on_upload_result(success, filename))
-            except Exception as e:
-                logger.error(f"Errore durante l'upload: {e}")
-                self.root.after(0, lambda: self.on_upload_result(False, filename))
+            stats = self.smb_client.upload_directory(local_dir, remote_path, progress_callback=progress_callback,
+                                                     sync=sync)
+            self.root.after(0, lambda: self.on_folder_upload_result(stats, folder_name))
         
         threading.Thread(target=thread_func, daemon=True).start()
 
-    def on_upload_result(self, success, filename):
+    def on_folder_upload_result(self, stats, folder_name):
         self.progress['value'] = 0
-        if success:
-            messagebox.showinfo("Successo", f"File caricato: {filename}")
-            self.status_var.set("Upload completato")
-            self.load_files()  # Ricarica la lista
+        summary = (f"{stats.files} file, {stats.dirs} cartelle create, {self.format_size(stats.bytes)} "
+                   f"in {stats.elapsed:.1f}s ({stats.files_per_s:.0f} file/s)")
+        if stats.skipped:
+            summary += f", {stats.skipped} invariati"
+        if stats:
+            messagebox.showinfo("Successo", f"Cartella caricata: {folder_name}\n{summary}")
+            self.status_var.set(f"Upload completato - {summary}")
         else:
-            messagebox.showerror("Errore", f"Errore upload: {filename}")
+            messagebox.showerror("Errore", f"Upload di {folder_name} incompleto: {len(stats.failed)} errori\n{summary}")
             self.status_var.set("Errore upload")
+        self.load_files()  # Ricarica la lista
+
+    def on_transfer_changed(self, job):
+        """Cambio di stato di un job (dal thread del trasferimento)"""
+        # Lo stato va letto adesso: quando Tk esegue la callback il job può essere già finito,
+        # e ogni notifica vedrebbe DONE/FAILED mostrando il risultato più volte
+        self.root.after(0, lambda state=job.state: self.on_transfer_state(job, state))
+
+    def on_transfer_state(self, job, state):
+        self.schedule_queue_refresh()
+        if state == DONE or state == FAILED:
+            if job.kind == 'download':
+                self.on_download_result(state == DONE, job.name)
+            else:
+                remote_dir = job.remote_path.rstrip("\\").rsplit("\\", 1)[0]
+                self.on_upload_result(state == DONE, job.name, remote_dir)
+
+    def schedule_queue_refresh(self):
+        if not self.queue_refresh_scheduled:
+            self.queue_refresh_scheduled = True
+            self.root.after(0, self.refresh_queue_view)
+
+    def refresh_queue_view(self):
+        """Aggiorna le righe del pannello; si riprogramma finché ci sono trasferimenti attivi"""
+        self.queue_refresh_scheduled = False
+        jobs = self.scheduler.jobs()
+        for job_id in set(self.queue_items) - {job.id for job in jobs}:
+            self.queue_tree.delete(self.queue_items.pop(job_id))
+        for job in jobs:
+            eta = job.eta
+            values = (job.name, "⬇ Download" if job.kind == 'download' else "⬆ Upload", job.state,
+                      f"{job.progress:.0f}%", f"{self.format_size(job.rate)}/s" if job.state == RUNNING else "",
+                      time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "")
+            item = self.queue_items.get(job.id)
+            if item is None:
+                self.queue_items[job.id] = self.queue_tree.insert("", "end", values=values)
+            elif self.queue_tree.item(item, "values") != values:
+                self.queue_tree.item(item, values=values)
+
+        stats = self.scheduler.stats()
+        counts = stats['counts']
+        if not jobs:
+            self.queue_status_var.set("Nessun trasferimento")
+        else:
+            total = stats['bytes_total']
+            progress = f" - {stats['bytes_done'] / total * 100:.0f}% di {self.format_size(total)}" if total else ""
+            self.queue_status_var.set(
+                f"{counts[RUNNING]} in corso, {counts[QUEUED]} in coda, {counts[PAUSED]} in pausa, "
+                f"{counts[DONE]} completati{progress} - {self.format_size(stats['rate'])}/s")
+        if counts[RUNNING] or counts[QUEUED]:
+            self.queue_refresh_scheduled = True
+            self.root.after(self.queue_refresh_ms, self.refresh_queue_view)
+
+    def selected_job_ids(self):
+        items = set(self.queue_tree.selection())
+        return [job_id for job_id, item in self.queue_items.items() if item in items]
+
+    def queue_action(self, action):
+        """Applica pausa, ripresa, annullamento o nuovo tentativo ai job selezionati"""
+        job_ids = self.selected_job_ids()
+        if not job_ids:
+            messagebox.showwarning("Attenzione", "Seleziona uno o più trasferimenti")
+            return
+        for job_id in job_ids:
+            action(job_id)
+        self.schedule_queue_refresh()
+
+    def clear_finished_transfers(self):
+        self.scheduler.clear_finished()
+        self.schedule_queue_refresh()
 
     def disconnect_server(self):
         """Disconnette in modo sicuro"""
@@ -863,6 +1041,9 @@ class SMBClientGUI:
         self.select_share_btn.config(state="disabled")
         self.status_var.set("Disconnessione in corso...")
         
+        # I trasferimenti in corso si fermano e restano riprendibili
+        self.scheduler.shutdown()
+
         def thread_func():
             try:
                 self.smb_client.disconnect()
@@ -882,6 +1063,9 @@ class SMBClientGUI:
         self.connection_status_label.config(text="Disconnesso", foreground="red")
         self.connected = False
         self.current_files = []
+        self.listing_path = None
+        self.load_generation += 1
+        self.loading = False
         
         self.connect_btn.config(state="normal")
         self.disconnect_btn.config(state="disabled")
@@ -894,11 +1078,14 @@ class SMBClientGUI:
 
     def on_closing(self):
         """Gestisce la chiusura della finestra"""
+        self.scheduler.shutdown()
         if self.connected:
             self.smb_client.disconnect()
         self.root.destroy()
 
 if __name__ == "__main__":
+    # --- Logging ---
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     root = tk.Tk()
     app = SMBClientGUI(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
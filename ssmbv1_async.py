@@ -0,0 +1,805 @@
+"""Client SMBv1 asincrono (asyncio): tante richieste in volo su un solo socket, distinte per MID.
+
+Pensato per lavorare su molti server da un solo event loop, senza un thread per
+connessione. Il login passa da impacket in un thread dell'executor; da lì in poi il
+socket è dell'event loop: un task legge i pacchetti e li consegna a chi attende
+quel MID. Una richiesta scaduta libera solo il suo MID, la connessione resta valida.
+
+Solo SMB1 senza firma dei pacchetti (il caso dei dispositivi embedded): per il
+resto, e per pool, ripresa dei trasferimenti e upload delta, c'è SMBv1Client.
+
+Esempio:
+    client = AsyncSMBv1Client()
+    if await client.connect('NAS', '192.168.1.10'):
+        shares = await client.list_shares()
+        await client.select_share(shares[0])
+        files = await client.list_files('\\\\cartella')
+        await client.disconnect()
+"""
+import asyncio
+import logging
+import os
+import struct
+import threading
+
+from impacket import smb, nmb, nt_errors
+from impacket.smbconnection import SMBConnection
+
+from ssmbv1_client import (COMMON_SHARES, DIRECTORY_EXISTS_ERRORS, FIND_SEARCH_ATTRIBUTES, INVALID_TID_ERRORS,
+                           READ_ANDX_RESPONSE, WRITE_ANDX_REQUEST, WRITE_ANDX_RESPONSE, LocalFileSource,
+                           ProgressReporter, SMBv1Client, TransferCancelled, filetime_to_unix, parse_find_entries)
+
+logger = logging.getLogger('SMBClient')
+
+NETBIOS_HEADER = struct.Struct('>BBH')
+
+
+class _PipeTransport:
+    """Trasporto DCE/RPC di impacket sopra una named pipe aperta dal client asincrono.
+
+    DCERPC_v5 è sincrono: gira in un thread dell'executor e ogni transazione sulla
+    pipe viene eseguita dall'event loop.
+    """
+
+    def __init__(self, client, loop, tid, fid):
+        self.client = client
+        self.loop = loop
+        self.tid = tid
+        self.fid = fid
+        self._buffer = b''
+
+    def send(self, data, forceWriteAndx=0, forceRecv=0):
+        future = asyncio.run_coroutine_threadsafe(self.client._transact_pipe(self.tid, self.fid, data), self.loop)
+        self._buffer += future.result()
+
+    def recv(self, forceRecv=0, count=0):
+        if not self._buffer:
+            raise IOError("Nessuna risposta dalla pipe")
+        count = count or len(self._buffer)
+        data, self._buffer = self._buffer[:count], self._buffer[count:]
+        return data
+
+
+class AsyncSMBv1Client:
+    """Client SMB1 asincrono: connect, list_shares, list_files, download_file, upload_file, create_directory"""
+
+    def __init__(self):
+        self.is_connected = False
+        self.current_share = None
+        self.server_key = None  # "ip:porta" del server connesso
+        self.timeout = 30  # Secondi di attesa per ogni risposta (e per il login)
+        self.read_queue_depth = 8  # Letture in volo per download
+        self.write_queue_depth = 4  # Scritture in volo per upload
+        self.find_batch_size = 512  # Voci richieste per FIND_FIRST2/FIND_NEXT2
+        self.share_probe_timeout = 5  # Secondi di attesa per share provata (e per l'elenco srvsvc)
+        self.share_wordlist = None  # Nomi da provare se il server non elenca le share (None = COMMON_SHARES)
+        # Richieste in volo sulla connessione. None = MaxMpxCount del server, ma almeno le finestre di
+        # lettura e scrittura: come le pipeline di SMBv1Client, che molti server accettano anche oltre
+        self.max_outstanding = None
+        self.last_error = None  # Messaggio dell'ultimo errore, per chi non legge i log
+
+        self._conn = None  # SMBConnection del login, proprietaria del socket
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}  # mid -> coda delle risposte
+        self._mid = 0
+        self._slots = None  # Semaforo sulle richieste in volo
+        self._trees = {}  # share -> future della TID
+        self._uid = 0
+        self._flags1 = 0
+        self._flags2 = 0
+        self._remote_host = None
+        self._max_buffer = 4356
+        self._max_read = 4096
+        self._max_write = 4096
+
+    # --- Connessione ---
+    async def connect(self, server_name, server_ip, username='', password='', domain='', port=139):
+        """Connette e autentica; il login gira in un thread dell'executor"""
+        if self.is_connected:
+            await self.disconnect()
+        loop = asyncio.get_running_loop()
+        try:
+            logger.info(f"Connessione asincrona a {server_ip}, user={'<anonimo>' if not username else username}, "
+                        f"port={port}")
+            login = loop.run_in_executor(None, self._login, server_name, server_ip, username, password, domain, port)
+            try:
+                conn = await asyncio.shield(login)
+            except asyncio.CancelledError:
+                # Il login prosegue nel suo thread: la connessione si chiude quando termina
+                login.add_done_callback(lambda f: f.cancelled() or f.exception() or f.result().close())
+                raise
+            self.server_key = f"{server_ip}:{port}"
+            try:
+                await self._attach(conn)
+            except Exception:
+                conn.close()
+                raise
+            self.is_connected = True
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._failed(f"Errore connessione {server_ip}: {e}")
+            return False
+
+    def _failed(self, message):
+        self.last_error = message
+        logger.error(message)
+
+    def _login(self, server_name, server_ip, username, password, domain, port):
+        conn = SMBConnection(remoteName=server_name, remoteHost=server_ip, sess_port=port,
+                             preferredDialect=smb.SMB_DIALECT, timeout=self.timeout)
+        conn.setTimeout(self.timeout)
+        conn.login(username, password, domain, lmhash='', nthash='', ntlmFallback=True)
+        return conn
+
+    async def _attach(self, conn):
+        """Prende il socket della sessione autenticata e avvia il task di lettura"""
+        server = conn.getSMBServer()
+        if getattr(server, '_SignatureEnabled', True):
+            raise IOError("Il server richiede la firma SMB, non supportata dal client asincrono")
+        session = server.get_session()
+        if not isinstance(session, nmb.NetBIOSTCPSession):
+            raise IOError("Trasporto non supportato dal client asincrono")
+
+        self._uid = server.get_uid()
+        self._flags1, self._flags2 = server.get_flags()
+        self._remote_host = server.get_remote_host()
+        try:
+            negotiated = server._dialects_parameters
+            self._max_buffer, max_mpx = negotiated['MaxBufferSize'], negotiated['MaxMpxCount']
+        except (AttributeError, KeyError, TypeError):
+            self._max_buffer, max_mpx = 4356, 1
+        capabilities = conn.getIOCapabilities()
+        self._max_read = max(1, min(capabilities['MaxReadSize'], 0xFFFF))
+        self._max_write = max(1, min(capabilities['MaxWriteSize'], 0xFFFF))
+        self._slots = asyncio.Semaphore(self.max_outstanding or
+                                        max(max_mpx, self.read_queue_depth, self.write_queue_depth))
+
+        sock = session.get_socket()
+        sock.settimeout(None)
+        self._reader, self._writer = await asyncio.open_connection(sock=sock)
+        self._conn = conn
+        self._pending = {}
+        self._trees = {}
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        """Legge i pacchetti dal socket e li consegna a chi attende il loro MID"""
+        error = ConnectionError("Connessione chiusa dal server")
+        try:
+            while True:
+                kind, flags, length = NETBIOS_HEADER.unpack(await self._reader.readexactly(4))
+                packet = await self._reader.readexactly(length | flags << 16)
+                if kind != nmb.NETBIOS_SESSION_MESSAGE or len(packet) < 32:
+                    continue  # Keep-alive
+                queue = self._pending.get(struct.unpack_from('<H', packet, 30)[0])
+                if queue is not None:
+                    queue.put_nowait(packet)
+                # Risposte non nostre (es. oplock break) o arrivate dopo il timeout: ignorate
+        except asyncio.IncompleteReadError:
+            pass
+        except OSError as e:
+            error = e
+        finally:
+            self.is_connected = False
+            for queue in self._pending.values():
+                queue.put_nowait(error)
+
+    async def disconnect(self):
+        """Chiude alberi e sessione ignorando gli errori"""
+        if self._reader_task is None:
+            return
+        if self.is_connected:
+            for share, future in list(self._trees.items()):
+                try:
+                    if future.done() and not future.exception():
+                        await self._command(smb.SMBCommand(smb.SMB.SMB_COM_TREE_DISCONNECT), future.result())
+                except Exception as e:
+                    logger.debug(f"Errore disconnessione share {share}: {e}")
+            try:
+                logoff = smb.SMBCommand(smb.SMB.SMB_COM_LOGOFF_ANDX)
+                logoff['Parameters'] = smb.SMBLogOffAndX()
+                await self._command(logoff)
+            except Exception as e:
+                logger.debug(f"Errore logoff: {e}")
+        self.is_connected = False
+        self.current_share = None
+        self._trees = {}
+        self._writer.close()
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        self._reader_task = None
+        logger.info(f"Disconnessione da {self.server_key} effettuata")
+
+    # --- Richieste multiplexate per MID ---
+    def _open_exchange(self):
+        """Riserva un MID libero e la coda su cui arriveranno le sue risposte"""
+        if self._reader_task is None or self._reader_task.done():
+            raise ConnectionError("Connessione chiusa")
+        while True:
+            # MID 0 è usato da impacket per il login, 0xFFFF è riservato agli oplock break
+            self._mid = self._mid % 0xFFFE + 1
+            if self._mid not in self._pending:
+                break
+        self._pending[self._mid] = asyncio.Queue()
+        return self._mid
+
+    def _close_exchange(self, mid):
+        # Una risposta che arriva dopo non trova più la coda e viene scartata
+        self._pending.pop(mid, None)
+
+    def _header(self, command, tid, mid):
+        packet = smb.NewSMBPacket()
+        packet['Flags1'] |= self._flags1
+        packet['Flags2'] |= self._flags2
+        packet['Tid'] = tid
+        packet['Uid'] = self._uid
+        packet['Pid'] = os.getpid() & 0xFFFF
+        packet['Mid'] = mid
+        packet.addCommand(command)
+        return packet
+
+    async def _send(self, *parts):
+        """Un pacchetto SMB (anche in più parti, es. header e dati) con il suo header NetBIOS"""
+        size = sum(len(part) for part in parts)
+        self._writer.write(NETBIOS_HEADER.pack(nmb.NETBIOS_SESSION_MESSAGE, size >> 16, size & 0xFFFF))
+        for part in parts:
+            self._writer.write(part)
+        await self._writer.drain()
+
+    async def _recv(self, mid, timeout=None):
+        """Prossima risposta al MID entro timeout (default self.timeout): byte del pacchetto SMB"""
+        timeout = timeout or self.timeout
+        try:
+            packet = await asyncio.wait_for(self._pending[mid].get(), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"Nessuna risposta entro {timeout}s") from None
+        if isinstance(packet, Exception):
+            raise packet
+        return packet
+
+    async def _command(self, command, tid=0, timeout=None):
+        """Invia un comando impacket e ne restituisce la risposta validata (NewSMBPacket)"""
+        code = command.command
+        async with self._slots:
+            mid = self._open_exchange()
+            try:
+                await self._send(self._header(command, tid, mid).getData())
+                packet = await self._recv(mid, timeout)
+            finally:
+                self._close_exchange(mid)
+        answer = smb.NewSMBPacket(data=packet)
+        answer.isValidAnswer(code)
+        return answer
+
+    # --- Share ---
+    async def _tree_connect(self, share, timeout=None):
+        path = f"\\\\{self._remote_host}\\{share}".upper()
+        unicode = self._flags2 & smb.SMB.FLAGS2_UNICODE
+        tree_connect = smb.SMBCommand(smb.SMB.SMB_COM_TREE_CONNECT_ANDX)
+        tree_connect['Parameters'] = smb.SMBTreeConnectAndX_Parameters()
+        tree_connect['Data'] = smb.SMBTreeConnectAndX_Data(flags=self._flags2)
+        tree_connect['Parameters']['PasswordLength'] = 1
+        tree_connect['Data']['Password'] = '\x00'  # Sicurezza a livello utente: password nella sessione
+        tree_connect['Data']['Path'] = path.encode('utf-16le') if unicode else path
+        tree_connect['Data']['Service'] = smb.SERVICE_ANY
+        if unicode:
+            tree_connect['Data']['Pad'] = 0x0
+        answer = await self._command(tree_connect, 0xFFFF, timeout)
+        return answer['Tid']
+
+    async def _tree(self, share):
+        """TID della share, connessa alla prima richiesta e condivisa tra le coroutine"""
+        future = self._trees.get(share)
+        if future is None:
+            future = self._trees[share] = asyncio.ensure_future(self._tree_connect(share))
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if self._trees.get(share) is future:
+                del self._trees[share]
+            raise
+
+    async def _on_tree(self, share, operation):
+        """Esegue operation(tid), riconnettendo la share se il server ha invalidato la TID"""
+        try:
+            return await operation(await self._tree(share))
+        except smb.SessionError as e:
+            if e.get_error_code() not in INVALID_TID_ERRORS:
+                raise
+            logger.warning(f"TID non valida per {share}, riconnessione: {e}")
+            self._trees.pop(share, None)
+            return await operation(await self._tree(share))
+
+    async def select_share(self, share_name):
+        """Seleziona una share specifica"""
+        try:
+            await self._tree(share_name)
+            self.current_share = share_name
+            logger.info(f"Share selezionata: {share_name}")
+            return True
+        except Exception as e:
+            self._failed(f"Share {share_name} non accessibile: {e}")
+            return False
+
+    async def list_shares(self):
+        """Lista le share: elenco srvsvc del server, altrimenti prova i nomi noti"""
+        if not self.is_connected:
+            return []
+        try:
+            share_list = await asyncio.wait_for(self._share_enum(), self.share_probe_timeout)
+            return [name for name in share_list if name and not name.endswith('$')]  # Escludi share amministrative
+        except Exception as e:
+            logger.error(f"Errore list_shares: {e}")
+            return await self.try_common_shares()
+
+    async def _share_enum(self):
+        """NetrShareEnum su \\srvsvc, con le strutture DCE/RPC di impacket"""
+        from impacket.dcerpc.v5 import rpcrt, srvs
+        tid = await self._tree('IPC$')
+        fid = await self._open(tid, '\\srvsvc', smb.FILE_READ_DATA | smb.FILE_WRITE_DATA, smb.FILE_OPEN, 0)
+        loop = asyncio.get_running_loop()
+
+        def enumerate_shares():
+            dce = rpcrt.DCERPC_v5(_PipeTransport(self, loop, tid, fid))
+            dce.bind(srvs.MSRPC_UUID_SRVS)
+            response = srvs.hNetrShareEnum(dce, 1)
+            return [share['shi1_netname'][:-1] for share in response['InfoStruct']['ShareInfo']['Level1']['Buffer']]
+
+        try:
+            return await loop.run_in_executor(None, enumerate_shares)
+        finally:
+            await self._close(tid, fid)
+
+    async def _transact_pipe(self, tid, fid, data):
+        """TransactNamedPipe: scrive data sulla pipe e restituisce la risposta"""
+        transaction = smb.SMBCommand(smb.SMB.SMB_COM_TRANSACTION)
+        transaction['Parameters'] = smb.SMBTransaction_Parameters()
+        transaction['Data'] = smb.SMBTransaction_Data()
+        setup = struct.pack('<HH', 0x26, fid)  # TransactNmPipe
+        name = '\\PIPE\\\x00'
+        transaction['Parameters']['Setup'] = setup
+        transaction['Parameters']['TotalParameterCount'] = 0
+        transaction['Parameters']['TotalDataCount'] = len(data)
+        transaction['Parameters']['ParameterCount'] = 0
+        transaction['Parameters']['ParameterOffset'] = 32 + 3 + 28 + len(setup) + len(name)
+        transaction['Parameters']['DataCount'] = len(data)
+        transaction['Parameters']['DataOffset'] = transaction['Parameters']['ParameterOffset']
+        transaction['Data']['Name'] = name
+        transaction['Data']['Trans_Parameters'] = b''
+        transaction['Data']['Trans_Data'] = data
+        answer = await self._command(transaction, tid)
+        response = smb.SMBCommand(answer['Data'][0])
+        params = smb.SMBTransactionResponse_Parameters(response['Parameters'])
+        return response['Data'][-params['TotalDataCount']:]  # Senza l'eventuale padding iniziale
+
+    async def try_common_shares(self, candidates=None):
+        """Prova le share note tutte insieme, ognuna entro share_probe_timeout secondi"""
+        candidates = list(dict.fromkeys(candidates or self.share_wordlist or COMMON_SHARES))
+
+        async def probe(share):
+            try:
+                tid = await self._tree_connect(share, self.share_probe_timeout)
+            except (smb.SessionError, asyncio.TimeoutError):
+                return None
+            if share not in self._trees:
+                self._trees[share] = asyncio.get_running_loop().create_future()
+                self._trees[share].set_result(tid)
+            return share
+
+        try:
+            found = await asyncio.gather(*(probe(share) for share in candidates))
+        except Exception as e:
+            logger.error(f"Errore ricerca share: {e}")
+            return []
+        for share in found:
+            if share:
+                logger.info(f"Share trovata: {share}")
+        return [share for share in found if share]
+
+    # --- File ---
+    async def _open(self, tid, path, access, disposition, options=smb.FILE_NON_DIRECTORY_FILE):
+        """NT_CREATE_ANDX: FID del file aperto"""
+        return (await self._open_info(tid, path, access, disposition, options))['Fid']
+
+    async def _open_info(self, tid, path, access, disposition, options=smb.FILE_NON_DIRECTORY_FILE):
+        """NT_CREATE_ANDX: parametri della risposta (Fid, EndOfFile, LastWriteTime...)"""
+        unicode = self._flags2 & smb.SMB.FLAGS2_UNICODE
+        name = path.encode('utf-16le') if unicode else path
+        nt_create = smb.SMBCommand(smb.SMB.SMB_COM_NT_CREATE_ANDX)
+        nt_create['Parameters'] = smb.SMBNtCreateAndX_Parameters()
+        nt_create['Parameters']['FileNameLength'] = len(name)
+        nt_create['Parameters']['CreateFlags'] = 0  # Niente oplock: non gestiamo le oplock break
+        nt_create['Parameters']['AccessMask'] = access
+        nt_create['Parameters']['ShareAccess'] = smb.FILE_SHARE_READ | smb.FILE_SHARE_WRITE
+        nt_create['Parameters']['Disposition'] = disposition
+        nt_create['Parameters']['CreateOptions'] = options
+        nt_create['Parameters']['Impersonation'] = 2  # SecurityImpersonation
+        nt_create['Data'] = smb.SMBNtCreateAndX_Data(flags=self._flags2)
+        nt_create['Data']['FileName'] = name
+        if unicode:
+            nt_create['Data']['Pad'] = 0x0
+        answer = await self._command(nt_create, tid)
+        return smb.SMBNtCreateAndXResponse_Parameters(smb.SMBCommand(answer['Data'][0])['Parameters'])
+
+    async def _close(self, tid, fid):
+        close = smb.SMBCommand(smb.SMB.SMB_COM_CLOSE)
+        close['Parameters'] = smb.SMBClose_Parameters()
+        close['Parameters']['FID'] = fid
+        await self._command(close, tid)
+
+    @staticmethod
+    def _remote_path(path):
+        path = path.replace('/', '\\')
+        return path if path.startswith('\\') else '\\' + path
+
+    # --- Listing ---
+    def _trans2(self, setup, params):
+        """Comando TRANS2 senza dati (come send_trans2 di impacket, ma senza inviarlo)"""
+        command = struct.pack('<H', setup)
+        name = '\x00'
+        transaction = smb.SMBCommand(smb.SMB.SMB_COM_TRANSACTION2)
+        transaction['Parameters'] = smb.SMBTransaction2_Parameters()
+        transaction['Parameters']['MaxDataCount'] = self._max_buffer
+        transaction['Data'] = smb.SMBTransaction2_Data()
+        transaction['Parameters']['Setup'] = command
+        transaction['Parameters']['TotalParameterCount'] = len(params)
+        transaction['Parameters']['TotalDataCount'] = 0
+        pad = (4 - (32 + 2 + 28 + len(command)) % 4) % 4
+        transaction['Data']['Pad1'] = '\xFF' * pad
+        transaction['Parameters']['ParameterCount'] = len(params)
+        transaction['Parameters']['ParameterOffset'] = 32 + 2 + 28 + len(command) + len(name) + pad
+        transaction['Data']['Pad2'] = ''
+        transaction['Parameters']['DataCount'] = 0
+        transaction['Parameters']['DataOffset'] = transaction['Parameters']['ParameterOffset'] + len(params)
+        transaction['Data']['Name'] = name
+        transaction['Data']['Trans_Parameters'] = params
+        transaction['Data']['Trans_Data'] = ''
+        return transaction
+
+    async def _transact2(self, tid, setup, params):
+        """Invia un TRANS2 e riunisce la risposta, anche se arriva in più pacchetti: (parametri, dati)"""
+        async with self._slots:
+            mid = self._open_exchange()
+            try:
+                await self._send(self._header(self._trans2(setup, params), tid, mid).getData())
+                params = b''
+                data = b''
+                total_params = total_data = 1
+                while len(params) < total_params or len(data) < total_data:
+                    answer = smb.NewSMBPacket(data=await self._recv(mid))
+                    answer.isValidAnswer(smb.SMB.SMB_COM_TRANSACTION2)
+                    response = smb.SMBCommand(answer['Data'][0])
+                    header = smb.SMBTransaction2Response_Parameters(response['Parameters'])
+                    total_params = header['TotalParameterCount']
+                    total_data = header['TotalDataCount']
+                    # Gli offset partono dall'header SMB (55 byte prima dei dati con SetupCount 0)
+                    start = header['ParameterOffset'] - 55
+                    params += response['Data'][start:start + header['ParameterCount']]
+                    start = header['DataOffset'] - 55
+                    data += response['Data'][start:start + header['DataCount']]
+                    if not header['ParameterCount'] and not header['DataCount']:
+                        break
+                return params, data
+            finally:
+                self._close_exchange(mid)
+
+    async def iter_files(self, path="\\", share=None, pattern="*"):
+        """Genera le voci della directory man mano che arrivano dal server (async for)"""
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return
+        search_path = SMBv1Client._search_path(path, pattern)
+        unicode = self._flags2 & smb.SMB.FLAGS2_UNICODE
+        encoding = 'utf-16le' if unicode else 'cp437'
+        tid = await self._tree(share)
+        sid = None
+        resume_key, resume_name = 0, b''
+        try:
+            while True:
+                if sid is None:
+                    request = smb.SMBFindFirst2_Parameters(self._flags2)
+                    request['SearchAttributes'] = FIND_SEARCH_ATTRIBUTES
+                    request['SearchStorageType'] = 0
+                    request['FileName'] = search_path.encode('utf-16le') if unicode else search_path
+                    setup = smb.SMB.TRANS2_FIND_FIRST2
+                else:
+                    request = smb.SMBFindNext2_Parameters(self._flags2)
+                    request['SID'] = sid
+                    request['ResumeKey'] = resume_key
+                    request['FileName'] = resume_name
+                    setup = smb.SMB.TRANS2_FIND_NEXT2
+                request['SearchCount'] = self.find_batch_size
+                request['InformationLevel'] = smb.SMB_FIND_FILE_DIRECTORY_INFO
+                request['Flags'] = smb.SMB_FIND_RETURN_RESUME_KEYS | smb.SMB_FIND_CLOSE_AT_EOS
+
+                params, data = await self._transact2(tid, setup, request.getData())
+                if sid is None:
+                    response = smb.SMBFindFirst2Response_Parameters(params)
+                    sid = response['SID']
+                else:
+                    response = smb.SMBFindNext2Response_Parameters(params)
+                entries = parse_find_entries(data, response['SearchCount'])
+                if response['EndOfSearch'] or not entries:
+                    sid = None  # Con SMB_FIND_CLOSE_AT_EOS il server ha già chiuso la ricerca
+                else:
+                    raw_name, resume_key = entries[-1][0], entries[-1][1]
+                    resume_name = raw_name if unicode else raw_name.rstrip(b'\x00')
+
+                for raw, _, size, attribs, wtime in entries:
+                    name = raw.decode(encoding, errors='replace').rstrip('\x00')
+                    if name in ('.', '..'):
+                        continue
+                    yield {
+                        'filename': name,
+                        'is_directory': bool(attribs & smb.ATTR_DIRECTORY),
+                        'size': size,
+                        'mtime': filetime_to_unix(wtime)
+                    }
+                if sid is None:
+                    return
+        finally:
+            if sid is not None and self.is_connected:
+                try:
+                    find_close = smb.SMBCommand(smb.SMB.SMB_COM_FIND_CLOSE2)
+                    find_close['Parameters'] = struct.pack('<H', sid)
+                    find_close['Data'] = b''
+                    await self._command(find_close, tid)
+                except Exception as e:
+                    logger.debug(f"Errore chiusura ricerca: {e}")
+
+    async def list_files(self, path="\\", limit=None, share=None):
+        """Voci della directory (al massimo limit), cartelle prima dei file"""
+        files = []
+        entries = self.iter_files(path, share)
+        try:
+            async for entry in entries:
+                files.append(entry)
+                if limit and len(files) >= limit:
+                    break
+        except Exception as e:
+            self._failed(f"Errore listing {path}: {e}")
+            return []
+        finally:
+            await entries.aclose()  # Chiude subito la ricerca rimasta aperta sul server
+        files.sort(key=lambda f: (not f['is_directory'], f['filename'].lower()))
+        return files
+
+    # --- Trasferimenti ---
+    async def _read(self, tid, fid, offset, size):
+        """Una READ_ANDX: dati letti (b'' a fine file), estratti senza il parsing di impacket"""
+        read_andx = smb.SMBCommand(smb.SMB.SMB_COM_READ_ANDX)
+        read_andx['Parameters'] = smb.SMBReadAndX_Parameters()
+        read_andx['Parameters']['Fid'] = fid
+        read_andx['Parameters']['Offset'] = offset & 0xFFFFFFFF
+        read_andx['Parameters']['HighOffset'] = offset >> 32  # File oltre 4 GB
+        read_andx['Parameters']['MaxCount'] = size
+        read_andx['Parameters']['MinCount'] = size
+        read_andx['Data'] = b''
+        async with self._slots:
+            mid = self._open_exchange()
+            try:
+                await self._send(self._header(read_andx, tid, mid).getData())
+                packet = await self._recv(mid)
+            finally:
+                self._close_exchange(mid)
+
+        if len(packet) >= READ_ANDX_RESPONSE.size and packet[4] == smb.SMB.SMB_COM_READ_ANDX and \
+                not struct.unpack_from('<L', packet, 5)[0] and packet[32] == 12:
+            count, data_offset, count_high = READ_ANDX_RESPONSE.unpack_from(packet)
+            count += 0x10000 * count_high
+            if data_offset + count > len(packet) or count > size:
+                raise IOError(f"Risposta READ_ANDX non valida all'offset {offset}")
+            return memoryview(packet)[data_offset:data_offset + count]
+        # Errore o risposta fuori formato: la interpreta impacket
+        try:
+            smb.NewSMBPacket(data=packet).isValidAnswer(smb.SMB.SMB_COM_READ_ANDX)
+        except smb.SessionError as e:
+            if e.get_error_code() == nt_errors.STATUS_END_OF_FILE:
+                return b''
+            raise
+        raise IOError(f"Risposta READ_ANDX inattesa all'offset {offset}")
+
+    async def _write(self, tid, fid, offset, data):
+        """Una WRITE_ANDX (header con struct, dati inviati così come sono): byte scritti"""
+        length = len(data)
+        async with self._slots:
+            mid = self._open_exchange()
+            try:
+                header = WRITE_ANDX_REQUEST.pack(
+                    b'\xffSMB', smb.SMB.SMB_COM_WRITE_ANDX, 0, self._flags1, self._flags2, 0, b'', 0,
+                    tid, os.getpid() & 0xFFFF, self._uid, mid,
+                    14, 0xFF, 0, 0,  # WordCount, nessun comando AndX
+                    fid, offset & 0xFFFFFFFF, 0xFF, 8, length & 0xFFFF,  # Timeout, WriteMode, Remaining
+                    length >> 16, length & 0xFFFF, WRITE_ANDX_REQUEST.size, offset >> 32,
+                    length & 0xFFFF)  # ByteCount
+                await self._send(header, data)
+                packet = await self._recv(mid)
+            finally:
+                self._close_exchange(mid)
+
+        if len(packet) >= WRITE_ANDX_RESPONSE.size and packet[4] == smb.SMB.SMB_COM_WRITE_ANDX and \
+                not struct.unpack_from('<L', packet, 5)[0] and packet[32] == 6:
+            count, count_high = WRITE_ANDX_RESPONSE.unpack_from(packet)
+            return count + ((count_high & 0xFFFF) << 16)
+        answer = smb.NewSMBPacket(data=packet)
+        answer.isValidAnswer(smb.SMB.SMB_COM_WRITE_ANDX)
+        params = smb.SMBWriteAndXResponse_Parameters(smb.SMBCommand(answer['Data'][0])['Parameters'])
+        return params['Count'] + ((params['Reserved'] & 0xFFFF) << 16)  # CountHigh
+
+    @staticmethod
+    async def _run_window(depth, worker):
+        """Esegue depth copie di worker; al primo errore ferma le altre e lo rilancia"""
+        tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, depth))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def download_file(self, remote_path, local_path, progress_callback=None, share=None):
+        """Scarica un file con read_queue_depth letture in volo.
+
+        I dati vanno in local_path + '.part', rinominato solo a download completo e
+        rimosso se il download fallisce o viene annullato.
+        progress_callback riceve un TransferProgress, al massimo 20 volte al secondo.
+        """
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return False
+        remote_path = self._remote_path(remote_path)
+        part_path = local_path + '.part'
+        try:
+            os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+
+            async def transfer(tid):
+                info = await self._open_info(tid, remote_path, smb.FILE_READ_DATA | smb.FILE_READ_ATTRIBUTES,
+                                             smb.FILE_OPEN)
+                fid, file_size = info['Fid'], info['EndOfFile']
+                try:
+                    reporter = ProgressReporter(progress_callback, file_size)
+                    blocks = [(offset, min(self._max_read, file_size - offset))
+                              for offset in range(0, file_size, self._max_read)]
+                    blocks.reverse()
+                    end = [file_size]
+                    done = [0]
+                    loop = asyncio.get_running_loop()
+                    write_lock = threading.Lock()
+
+                    with open(part_path, 'wb') as f:
+                        f.truncate(file_size)
+
+                        def write_at(offset, data):
+                            # Più thread dell'executor sullo stesso file: seek e write insieme
+                            with write_lock:
+                                f.seek(offset)
+                                f.write(data)
+
+                        async def worker():
+                            while blocks:
+                                offset, size = blocks.pop()
+                                if offset >= end[0]:
+                                    continue
+                                data = await self._read(tid, fid, offset, size)
+                                if not data:
+                                    end[0] = min(end[0], offset)  # Il file si è accorciato durante la lettura
+                                    continue
+                                if len(data) < size:
+                                    blocks.append((offset + len(data), size - len(data)))
+                                # Risposte fuori ordine: ognuna va al suo offset. La scrittura su disco
+                                # gira nell'executor, così un disco lento non ferma le altre connessioni
+                                await loop.run_in_executor(None, write_at, offset, data)
+                                done[0] += len(data)
+                                reporter.update(done[0])
+
+                        await self._run_window(self.read_queue_depth, worker)
+                        f.truncate(min(end[0], file_size))
+                    reporter.update(done[0], final=True)
+                    return done[0]
+                finally:
+                    await self._close(tid, fid)
+
+            downloaded = await self._on_tree(share, transfer)
+            os.replace(part_path, local_path)
+            logger.info(f"File scaricato: {remote_path} -> {local_path} ({downloaded} byte)")
+            return True
+        except TransferCancelled as e:
+            logger.info(f"Download interrotto: {remote_path} ({e})")
+            self._drop_part(part_path)
+            return False
+        except asyncio.CancelledError:
+            # Annullato dall'esterno (es. wait_for scaduto): niente ripresa, il .part non serve più
+            self._drop_part(part_path)
+            raise
+        except Exception as e:
+            self._failed(f"Errore download_file {remote_path}: {e}")
+            self._drop_part(part_path)
+            return False
+
+    @staticmethod
+    def _drop_part(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    async def upload_file(self, local_path, remote_path, progress_callback=None, share=None):
+        """Carica un file con write_queue_depth scritture in volo, letto da una mappatura del file locale"""
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return False
+        remote_path = self._remote_path(remote_path)
+        try:
+            file_size = os.path.getsize(local_path)
+
+            async def transfer(tid):
+                fid = await self._open(tid, remote_path, smb.FILE_WRITE_DATA | smb.FILE_APPEND_DATA |
+                                       smb.FILE_READ_ATTRIBUTES | smb.FILE_WRITE_ATTRIBUTES, smb.FILE_OVERWRITE_IF)
+                try:
+                    reporter = ProgressReporter(progress_callback, file_size)
+                    acked = [0]
+                    with LocalFileSource(local_path) as source:
+                        chunks = source.chunks(0, self._max_write)
+
+                        async def worker():
+                            for offset, data in chunks:
+                                while data:
+                                    count = await self._write(tid, fid, offset, data)
+                                    if count <= 0:
+                                        raise IOError(f"Il server non ha scritto dati all'offset {offset}")
+                                    count = min(count, len(data))
+                                    acked[0] += count
+                                    reporter.update(acked[0])
+                                    # Scrittura parziale: si reinvia il resto
+                                    offset, data = offset + count, data[count:]
+
+                        await self._run_window(self.write_queue_depth, worker)
+                    reporter.update(acked[0], final=True)
+                    return acked[0]
+                finally:
+                    await self._close(tid, fid)
+
+            uploaded = await self._on_tree(share, transfer)
+            logger.info(f"File caricato: {local_path} -> {remote_path} ({uploaded} byte)")
+            return True
+        except TransferCancelled as e:
+            logger.info(f"Upload interrotto: {local_path} ({e})")
+            return False
+        except Exception as e:
+            self._failed(f"Errore upload_file {local_path}: {e}")
+            return False
+
+    async def create_directory(self, path, share=None):
+        """Crea una directory; True anche se esiste già"""
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return False
+        path = self._remote_path(path)
+        unicode = self._flags2 & smb.SMB.FLAGS2_UNICODE
+
+        async def create(tid):
+            create_dir = smb.SMBCommand(smb.SMB.SMB_COM_CREATE_DIRECTORY)
+            create_dir['Data'] = smb.SMBCreateDirectory_Data(flags=self._flags2)
+            create_dir['Data']['DirectoryName'] = path.encode('utf-16le') if unicode else path
+            await self._command(create_dir, tid)
+
+        try:
+            await self._on_tree(share, create)
+            logger.info(f"Directory creata: {path}")
+            return True
+        except smb.SessionError as e:
+            if e.get_error_code() in DIRECTORY_EXISTS_ERRORS:
+                return True
+            self._failed(f"Errore create_directory {path}: {e}")
+            return False
+        except Exception as e:
+            self._failed(f"Errore create_directory {path}: {e}")
+            return False
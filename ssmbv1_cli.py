@@ -0,0 +1,387 @@
+"""Client SMBv1 a riga di comando, per script e host senza interfaccia grafica.
+
+Esempi:
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS shares
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS shares --wordlist nomi.txt --probe-timeout 2
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share DATI ls \\cartella
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share DATI find \\ --name "*.cfg;*.ini" --newer 2024-01-01
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share DATI get \\doc.pdf ./doc.pdf
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share DATI put ./report.csv \\report.csv
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share DATI mkdir \\nuova
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share LOG get -r --sync --delete \\log ./log
+    python ssmbv1_cli.py --ip 192.168.1.10 --name NAS --share DATI index
+    python ssmbv1_cli.py search "*.cfg"
+
+La password può arrivare anche dalla variabile d'ambiente SMB_PASSWORD.
+Codici di uscita: 0 successo, 1 operazione fallita, 2 argomenti non validi.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+
+def format_size(size):
+    """Formatta la dimensione del file in modo leggibile"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} TB"
+
+
+def cmd_shares(client, args):
+    """Elenca le share accessibili"""
+    if args.wordlist:
+        from ssmbv1_client import load_share_wordlist
+        try:
+            client.share_wordlist = load_share_wordlist(args.wordlist)
+        except OSError as e:
+            print(f"Lista di share non leggibile: {e}", file=sys.stderr)
+            return 1
+    if args.probe_timeout:
+        client.share_probe_timeout = args.probe_timeout
+    shares = client.try_common_shares() if args.probe else client.list_shares()
+    for share in shares:
+        print(share)
+    return 0 if shares else 1
+
+
+def cmd_ls(client, args):
+    """Elenca una directory: dimensione in byte (o <DIR>) e nome, cartelle prima dei file"""
+    from ssmbv1_client import SMB_ERRORS
+    files = []
+    count = 0
+    entries = client.iter_files(args.path)
+    try:
+        for entry in entries:
+            if args.type == "folders" and not entry['is_directory']:
+                continue
+            if args.type == "files" and entry['is_directory']:
+                continue
+            if args.unsorted:
+                print_entry(entry)
+            else:
+                files.append(entry)
+            count += 1
+            if args.limit and count >= args.limit:
+                break
+    except SMB_ERRORS as e:
+        print(f"Errore listing {args.path}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        entries.close()
+    files.sort(key=lambda f: (not f['is_directory'], f['filename'].lower()))
+    for entry in files:
+        print_entry(entry)
+    return 0
+
+
+def print_entry(entry, name_key='filename'):
+    size = "<DIR>" if entry['is_directory'] else str(entry['size'])
+    mtime = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['mtime'])) if entry.get('mtime') else "-"
+    print(f"{size:>14}  {mtime:<16}  {entry[name_key]}")
+
+
+def cmd_find(client, args):
+    """Cerca ricorsivamente: stampa le voci trovate man mano che arrivano"""
+    count = 0
+    results = client.find(args.path, args.pattern, file_type=args.type, min_size=args.min_size,
+                          max_size=args.max_size, newer_than=args.newer, older_than=args.older,
+                          max_depth=args.max_depth, workers=args.workers)
+    try:
+        for entry in results:
+            print_entry(entry, 'path')
+            count += 1
+            if args.limit and count >= args.limit:
+                break
+    finally:
+        results.close()
+    return 0 if count else 1
+
+
+def format_age(seconds):
+    """Età leggibile: 45 s, 12 min, 3 h, 2 g"""
+    for unit, length in (("g", 86400), ("h", 3600), ("min", 60)):
+        if seconds >= length:
+            return f"{seconds // length:.0f} {unit}"
+    return f"{max(0, seconds):.0f} s"
+
+
+def cmd_index(client, args):
+    """Indicizza la share nel database locale, rileggendo solo le cartelle cambiate"""
+    from ssmbv1_index import MetadataIndex, IndexCrawler, DEFAULT_INDEX_PATH
+    index = MetadataIndex(args.db or DEFAULT_INDEX_PATH)
+    try:
+        crawler = IndexCrawler(client, index, workers=args.workers, full=args.full)
+        start = time.monotonic()
+        complete = crawler.run()
+        stats = crawler.stats
+        print(f"{stats['listed']} cartelle lette, {stats['unchanged']} invariate, {stats['entries']} voci, "
+              f"{stats['errors']} errori in {time.monotonic() - start:.1f}s")
+        return 0 if complete else 1
+    finally:
+        index.close()
+
+
+def cmd_search(client, args):
+    """Cerca nell'indice locale, senza contattare il server"""
+    from ssmbv1_index import MetadataIndex, DEFAULT_INDEX_PATH
+    path = args.db or DEFAULT_INDEX_PATH
+    if not os.path.exists(path):
+        print(f"Indice non trovato: {path} (crearlo con il comando index)", file=sys.stderr)
+        return 1
+    server = f"{args.ip}:{args.port}" if args.ip else None
+    index = MetadataIndex(path)
+    try:
+        now = time.time()
+        for status in index.status(server, args.share):
+            finished = status['crawl_finished']
+            fresh = f"ultima scansione completa {format_age(now - finished)} fa" if finished else \
+                "nessuna scansione completa"
+            print(f"{status['server']} {status['share']}: {status['entries']} voci, {fresh}", file=sys.stderr)
+        entries = index.search(args.text, server, args.share, args.path, args.type, args.limit)
+        for entry in entries:
+            size = "<DIR>" if entry['is_directory'] else str(entry['size'])
+            mtime = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['mtime'])) if entry['mtime'] else "-"
+            print(f"{size:>14}  {mtime:<16}  {format_age(now - entry['indexed_at']):>6}  "
+                  f"{entry['server']} {entry['share']}{entry['path']}")
+        return 0 if entries else 1
+    finally:
+        index.close()
+
+
+def parse_size(value):
+    """Dimensione in byte da 1500, 64K, 10M o 2G"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    try:
+        if value[-1:].upper() in units:
+            return int(float(value[:-1]) * units[value[-1].upper()])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Dimensione non valida: {value}") from None
+
+
+def parse_date(value):
+    """Secondi Unix da "AAAA-MM-GG" o "AAAA-MM-GG HH:MM" (ora locale)"""
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"Data non valida: {value} (formato AAAA-MM-GG [HH:MM])")
+
+
+def progress_printer(args):
+    """progress_callback che riscrive una riga su stderr, o None senza --progress"""
+    if not args.progress:
+        return None
+
+    def show(progress):
+        done = format_size(progress.bytes_done)
+        if progress.files_total:
+            done = f"{progress.files_done}/{progress.files_total} file, {done}"
+        eta = progress.eta
+        eta = time.strftime(" - mancano %H:%M:%S", time.gmtime(eta)) if eta and not progress.final else ""
+        print(f"\r{progress.percent:5.1f}%  {done}  {format_size(progress.rate)}/s{eta}\033[K",
+              end="\n" if progress.final else "", file=sys.stderr, flush=True)
+    return show
+
+
+def cmd_get(client, args):
+    """Scarica un file remoto, o una directory con -r"""
+    if args.recursive:
+        local_dir = args.local or os.path.basename(args.remote.replace('\\', '/').rstrip('/'))
+        stats = client.download_directory(args.remote, local_dir, workers=args.workers, sync=args.sync,
+                                          delete=args.delete, progress_callback=progress_printer(args))
+        print(f"{args.remote} -> {local_dir}: {stats.summary()}")
+        for path in stats.failed:
+            print(f"Errore download: {path}", file=sys.stderr)
+        return 0 if stats else 1
+    local_path = args.local or os.path.basename(args.remote.replace('\\', '/'))
+    if os.path.isdir(local_path):
+        local_path = os.path.join(local_path, os.path.basename(args.remote.replace('\\', '/')))
+    start = time.perf_counter()
+    if not client.download_file(args.remote, local_path, progress_printer(args)):
+        print(f"Errore download: {args.remote}", file=sys.stderr)
+        return 1
+    report_transfer(f"{args.remote} -> {local_path}", os.path.getsize(local_path), start)
+    return 0
+
+
+def cmd_put(client, args):
+    """Carica un file locale, o una directory con -r"""
+    if args.recursive:
+        remote_path = args.remote or os.path.basename(os.path.normpath(args.local))
+        stats = client.upload_directory(args.local, remote_path, workers=args.workers, sync=args.sync,
+                                        delete=args.delete, delta=args.delta, progress_callback=progress_printer(args))
+        print(f"{args.local} -> {remote_path}: {stats.summary()}")
+        report_delta(client, args)
+        for path in stats.failed:
+            print(f"Errore upload: {path}", file=sys.stderr)
+        return 0 if stats else 1
+    if not os.path.isfile(args.local):
+        print(f"File locale non trovato: {args.local}", file=sys.stderr)
+        return 1
+    remote_path = args.remote or os.path.basename(args.local)
+    if remote_path.endswith(('\\', '/')):
+        remote_path += os.path.basename(args.local)
+    start = time.perf_counter()
+    if not client.upload_file(args.local, remote_path, progress_printer(args), delta=args.delta):
+        print(f"Errore upload: {args.local}", file=sys.stderr)
+        return 1
+    report_transfer(f"{args.local} -> {remote_path}", os.path.getsize(args.local), start)
+    report_delta(client, args)
+    return 0
+
+
+def cmd_mkdir(client, args):
+    """Crea una directory"""
+    if not client.create_directory(args.path):
+        print(f"Errore creazione directory: {args.path}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def report_transfer(description, size, start):
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print(f"{description}: {format_size(size)} in {elapsed:.2f}s ({size / elapsed / 1e6:.1f} MB/s)")
+
+
+def report_delta(client, args):
+    if args.delta:
+        stats = client.delta_stats
+        print(f"Delta: {format_size(stats['sent'])} inviati, {format_size(stats['saved'])} risparmiati")
+
+
+COMMANDS = {
+    'shares': cmd_shares,
+    'ls': cmd_ls,
+    'find': cmd_find,
+    'get': cmd_get,
+    'put': cmd_put,
+    'mkdir': cmd_mkdir,
+    'index': cmd_index,
+    'search': cmd_search,
+}
+OFFLINE_COMMANDS = ('search',)
+
+
+def add_sync_arguments(parser, target):
+    parser.add_argument('--sync', action='store_true',
+                        help="Con -r trasferisce solo i file nuovi o con dimensione/data di modifica diverse")
+    parser.add_argument('--delete', action='store_true',
+                        help=f"Con -r elimina i file {target} assenti nella sorgente")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Client SMBv1 a riga di comando")
+    parser.add_argument('--ip', help="IP del server (per search: filtra l'indice)")
+    parser.add_argument('--name', help="Nome NetBIOS del server")
+    parser.add_argument('--port', type=int, default=139)
+    parser.add_argument('--user', default='', help="Utente (vuoto = connessione anonima)")
+    parser.add_argument('--password', default=os.environ.get('SMB_PASSWORD', ''))
+    parser.add_argument('--domain', default='')
+    parser.add_argument('--share', help="Share su cui operare (obbligatoria tranne che per 'shares' e 'search')")
+    parser.add_argument('--timeout', type=int, default=30, help="Timeout delle richieste in secondi")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="-v info, -vv debug")
+
+    commands = parser.add_subparsers(dest='command', metavar='comando')
+    commands.required = True
+    shares = commands.add_parser('shares', help="Elenca le share")
+    shares.add_argument('--wordlist', help="File con i nomi di share da provare se il server non le elenca")
+    shares.add_argument('--probe', action='store_true', help="Prova solo i nomi, senza chiedere l'elenco al server")
+    shares.add_argument('--probe-timeout', type=float,
+                        help="Secondi di attesa per ogni share provata (default: 5)")
+
+    ls = commands.add_parser('ls', help="Elenca una directory")
+    ls.add_argument('path', nargs='?', default="\\")
+    ls.add_argument('--type', choices=["all", "folders", "files"], default="all")
+    ls.add_argument('--limit', type=int, default=0, help="Numero massimo di voci (0 = nessun limite)")
+    ls.add_argument('-U', '--unsorted', action='store_true',
+                    help="Stampa le voci man mano che arrivano, nell'ordine del server")
+
+    find = commands.add_parser('find', help="Cerca ricorsivamente file e cartelle")
+    find.add_argument('path', nargs='?', default="\\")
+    find.add_argument('--name', dest='pattern', default="*",
+                      help="Pattern dei nomi, anche più di uno separati da ; (es. \"*.cfg;*.ini\")")
+    find.add_argument('--type', choices=["all", "folders", "files"], default="all")
+    find.add_argument('--min-size', type=parse_size, help="Dimensione minima dei file (es. 10K, 5M)")
+    find.add_argument('--max-size', type=parse_size, help="Dimensione massima dei file")
+    find.add_argument('--newer', type=parse_date, help="Modificati dal (AAAA-MM-GG [HH:MM])")
+    find.add_argument('--older', type=parse_date, help="Modificati fino al (AAAA-MM-GG [HH:MM])")
+    find.add_argument('--max-depth', type=int, help="Livelli di sottocartelle da visitare (0 = solo path)")
+    find.add_argument('--workers', type=int, help="Cartelle visitate in parallelo (default: dimensione del pool - 1)")
+    find.add_argument('--limit', type=int, default=0, help="Ferma la ricerca dopo tante voci (0 = nessun limite)")
+
+    get = commands.add_parser('get', help="Scarica un file")
+    get.add_argument('remote')
+    get.add_argument('local', nargs='?', help="Percorso o directory locale (default: nome del file)")
+    get.add_argument('-r', '--recursive', action='store_true', help="Scarica una directory con tutto il contenuto")
+    get.add_argument('--workers', type=int, help="Download paralleli con -r (default: dimensione del pool - 1)")
+    get.add_argument('-P', '--progress', action='store_true', help="Mostra avanzamento, velocità e tempo residuo")
+    add_sync_arguments(get, "locali")
+
+    put = commands.add_parser('put', help="Carica un file")
+    put.add_argument('local')
+    put.add_argument('remote', nargs='?', help="Percorso remoto (default: nome del file nella root)")
+    put.add_argument('-r', '--recursive', action='store_true',
+                     help="Carica una directory: prima crea le cartelle, poi i file in parallelo")
+    put.add_argument('--workers', type=int, help="Upload paralleli con -r (default: dimensione del pool - 1)")
+    put.add_argument('-P', '--progress', action='store_true', help="Mostra avanzamento, velocità e tempo residuo")
+    add_sync_arguments(put, "remoti")
+    put.add_argument('--delta', action='store_true',
+                     help="Riscrive solo i blocchi cambiati dall'ultimo upload --delta dello stesso file")
+
+    mkdir = commands.add_parser('mkdir', help="Crea una directory")
+    mkdir.add_argument('path')
+
+    index = commands.add_parser('index', help="Indicizza la share nel database locale per search")
+    index.add_argument('--full', action='store_true', help="Rilegge anche le cartelle con data di modifica invariata")
+    index.add_argument('--workers', type=int, help="Cartelle lette in parallelo (default: dimensione del pool - 1)")
+    index.add_argument('--db', help="Database dell'indice (default: ~/.cache/ssmbv1/index.sqlite)")
+
+    search = commands.add_parser('search', help="Cerca nell'indice locale, anche a server spento")
+    search.add_argument('text', help="Parte del nome, o pattern con * e ?; con \\ cerca nel percorso")
+    search.add_argument('--path', help="Solo sotto questa cartella")
+    search.add_argument('--type', choices=["all", "folders", "files"], default="all")
+    search.add_argument('--limit', type=int, default=1000, help="Numero massimo di voci (0 = nessun limite)")
+    search.add_argument('--db', help="Database dell'indice (default: ~/.cache/ssmbv1/index.sqlite)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command not in OFFLINE_COMMANDS and not (args.ip and args.name):
+        parser.error(f"--ip e --name sono obbligatori per '{args.command}'")
+    if args.command not in ('shares',) + OFFLINE_COMMANDS and not args.share:
+        parser.error(f"--share è obbligatoria per '{args.command}'")
+    if (getattr(args, 'sync', False) or getattr(args, 'delete', False)) and not args.recursive:
+        parser.error("--sync e --delete richiedono -r")
+
+    level = logging.WARNING if not args.verbose else logging.INFO if args.verbose == 1 else logging.DEBUG
+    logging.basicConfig(level=level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command in OFFLINE_COMMANDS:
+        return COMMANDS[args.command](None, args)
+
+    # Import ritardato: --help e gli errori negli argomenti non pagano l'import di impacket
+    from ssmbv1_client import SMBv1Client
+
+    client = SMBv1Client()
+    client.timeout = args.timeout
+    if not client.connect(args.name, args.ip, args.user, args.password, args.domain, port=args.port):
+        print(f"Connessione a {args.ip} fallita", file=sys.stderr)
+        return 1
+    try:
+        if args.share and not client.select_share(args.share):
+            print(f"Impossibile accedere alla share {args.share}", file=sys.stderr)
+            return 1
+        return COMMANDS[args.command](client, args)
+    finally:
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
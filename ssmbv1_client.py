@@ -0,0 +1,2592 @@
+"""Client SMBv1 senza interfaccia grafica: importabile da script, CLI e GUI"""
+from impacket.smbconnection import SMBConnection
+from impacket import smb, smbconnection, smb3structs, nt_errors, nmb
+import threading
+import os
+import logging
+import struct
+import errno
+import hashlib
+import json
+import mmap
+import time
+import fnmatch
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from queue import Queue
+
+# --- Logging ---
+# La configurazione (livello, formato, destinazione) spetta all'applicazione che importa il modulo
+logger = logging.getLogger('SMBClient')
+logger.addHandler(logging.NullHandler())
+
+# Errori con cui il server segnala una TID non più valida
+STATUS_SMB_BAD_TID = 0x00050002
+INVALID_TID_ERRORS = (STATUS_SMB_BAD_TID, nt_errors.STATUS_NETWORK_NAME_DELETED)
+
+# Risposte a CREATE_DIRECTORY per una directory già presente (NT status e DOS ERRDOS/ERRfilexists)
+DIRECTORY_EXISTS_ERRORS = (nt_errors.STATUS_OBJECT_NAME_COLLISION, 0x00500001)
+
+# File o percorso inesistente (NT status e DOS ERRDOS/ERRbadfile, ERRbadpath)
+NOT_FOUND_ERRORS = (nt_errors.STATUS_OBJECT_NAME_NOT_FOUND, nt_errors.STATUS_OBJECT_PATH_NOT_FOUND,
+                    nt_errors.STATUS_NO_SUCH_FILE, 0x00020001, 0x00030001)
+
+# Share provate quando il server non elenca le proprie (niente srvsvc, tipico dei dispositivi embedded)
+COMMON_SHARES = ['shared', 'Public', 'Files', 'Data', 'Share', 'Documents', 'Temp', 'IPC$',
+                 'Volume_1', 'HDD', 'USB', 'Media', 'Backup', 'Scans', 'homes']
+
+# Errori di protocollo: il server ha risposto, la connessione è integra
+SMB_ERRORS = (smb.SessionError, smbconnection.SessionError)
+
+
+class TransferCancelled(Exception):
+    """Sollevata da un progress_callback per interrompere un trasferimento (pausa o annullamento).
+
+    Il trasferimento restituisce False senza nuovi tentativi e lascia lo stato di
+    ripresa: una nuova chiamata riparte da dove si era fermato.
+    """
+
+
+# Differenza tra l'epoca FILETIME (1601) e l'epoca Unix, in unità da 100 ns
+FILETIME_EPOCH = 116444736000000000
+
+
+def load_share_wordlist(path):
+    """Nomi di share da un file di testo: uno per riga, righe vuote e commenti (#) ignorati"""
+    with open(path, 'r', encoding='utf-8') as f:
+        names = [line.strip() for line in f]
+    return [name for name in names if name and not name.startswith('#')]
+
+
+def filetime_to_unix(filetime):
+    """FILETIME SMB -> secondi Unix; None se il server non riporta la data"""
+    if not filetime:
+        return None
+    return (filetime - FILETIME_EPOCH) / 1e7
+
+
+def unix_to_filetime(timestamp):
+    return int(timestamp * 1e7) + FILETIME_EPOCH
+
+
+# Inizio di una risposta READ_ANDX fino a ByteCount: header SMB (32), WordCount (12 word),
+# parametri; se ne leggono DataCount, DataOffset e DataCount_Hi
+READ_ANDX_RESPONSE = struct.Struct('<43xHHL8x')
+
+# Richiesta WRITE_ANDX senza i dati: header SMB (32), WordCount (14), parametri, ByteCount.
+# I dati seguono subito, a DataOffset 63
+WRITE_ANDX_REQUEST = struct.Struct('<4sBLBHH8sHHHHHBBBHHLLHHHHHLH')
+# Risposta WRITE_ANDX fino a ByteCount: header SMB (32), WordCount (6 word), Count, Available,
+# Reserved (nei 16 bit bassi CountHigh)
+WRITE_ANDX_RESPONSE = struct.Struct('<37xHxxLxx')
+
+
+# --- Pipeline SMB1 ---
+class SMB1Pipeline:
+    """Base per richieste SMB1 multiple in volo sulla stessa connessione, distinte per MID"""
+
+    def __init__(self, server, tid, fid, depth):
+        self.server = server
+        self.tid = tid
+        self.fid = fid
+        self.depth = max(1, depth)
+        self.in_flight = {}  # mid -> richiesta
+        self._mid = 0
+
+    def _next_mid(self):
+        # MID 0 è usato da impacket, 0xFFFF è riservato agli oplock break
+        while True:
+            self._mid = self._mid % 0xFFFE + 1
+            if self._mid not in self.in_flight:
+                return self._mid
+
+    def _send(self, command, request):
+        packet = smb.NewSMBPacket()
+        packet['Tid'] = self.tid
+        packet['Mid'] = self._next_mid()
+        packet.addCommand(command)
+        self.server.sendSMB(packet)
+        self.in_flight[packet['Mid']] = request
+
+    def _recv(self):
+        """Attende la prossima risposta a una nostra richiesta: (richiesta, risposta)"""
+        while True:
+            answer = self.server.recvSMB()
+            request = self.in_flight.pop(answer['Mid'], None)
+            if request is not None:
+                return request, answer
+            # Risposta non nostra (es. oplock break): ignorata
+
+    def _socket(self):
+        """Socket della sessione NetBIOS su TCP, None se il trasporto è un altro"""
+        session = self.server.get_session()
+        if not isinstance(session, nmb.NetBIOSTCPSession):
+            return None
+        sock = session.get_socket()
+        sock.settimeout(self.server.get_timeout())
+        return sock
+
+    @classmethod
+    def _recv_netbios(cls, sock):
+        """Header della sessione NetBIOS: (tipo, lunghezza del contenuto)"""
+        header = bytearray(4)
+        cls._recv_exact(sock, memoryview(header))
+        kind, flags, length = struct.unpack('>BBH', header)
+        return kind, length | flags << 16  # Su TCP 445 la lunghezza occupa anche il byte dei flag
+
+    @staticmethod
+    def _recv_exact(sock, target):
+        received = 0
+        while received < len(target):
+            count = sock.recv_into(target[received:])
+            if not count:
+                raise ConnectionError("Connessione chiusa dal server")
+            received += count
+
+    @classmethod
+    def _recv_skip(cls, sock, size):
+        if size > 0:
+            cls._recv_exact(sock, memoryview(bytearray(size)))
+
+    def _drain(self):
+        """Consuma le risposte ancora in volo per lasciare la connessione coerente"""
+        while self.in_flight:
+            try:
+                answer = self.server.recvSMB()
+                self.in_flight.pop(answer['Mid'], None)
+            except Exception as e:
+                logger.error(f"Errore svuotando la pipeline SMB1: {e}")
+                self.in_flight.clear()
+
+
+class SMB1ReadPipeline(SMB1Pipeline):
+    """Legge un file con più READ_ANDX in volo, restituendo i dati in ordine"""
+
+    def __init__(self, server, tid, fid, file_size, block_size, depth, start=0):
+        super().__init__(server, tid, fid, depth)
+        self.file_size = file_size
+        self.block_size = block_size
+        self.start = start  # Primo byte da leggere (ripresa)
+
+    def __iter__(self):
+        """Dati del file in ordine, riordinando le risposte arrivate fuori sequenza"""
+        arrived = {}  # offset -> dati arrivati fuori ordine
+        next_yield = self.start
+        for offset, _, data in self._completions(self._recv_read):
+            arrived[offset] = data
+            while next_yield in arrived:
+                chunk = arrived.pop(next_yield)
+                next_yield += len(chunk)
+                yield chunk
+
+    def read_into(self, view):
+        """Scrive ogni risposta direttamente in view (lungo quanto il file) al suo offset.
+
+        Le risposte vanno a posto nell'ordine di arrivo, senza buffer di riordino; su
+        TCP i dati passano dal socket a view con recv_into, senza copie intermedie.
+        Genera l'estremo dei byte contigui scritti da start in poi ogni volta che avanza.
+        """
+        sock = self._socket()
+        if sock is not None:
+            receive = lambda: self._recv_read_into(sock, view)  # noqa: E731
+        else:
+            receive = lambda: self._recv_read_copy(view)  # noqa: E731
+        ends = {}  # offset -> fine dei blocchi scritti oltre l'estremo contiguo
+        done = self.start
+        for offset, count, _ in self._completions(receive):
+            ends[offset] = offset + count
+            if offset == done:
+                while done in ends:
+                    done = ends.pop(done)
+                yield done
+
+    def _completions(self, receive):
+        """Genera (offset, byte, dati) nell'ordine di arrivo, tenendo piena la finestra di letture.
+
+        receive() attende una risposta e restituisce (offset, richiesti, ricevuti, dati).
+        """
+        retry = deque()  # Letture corte da completare
+        next_issue = self.start
+        end = self.file_size
+        try:
+            while True:
+                # Riempi la finestra di richieste in volo
+                while len(self.in_flight) < self.depth:
+                    if retry:
+                        offset, size = retry.popleft()
+                        if offset >= end:
+                            continue
+                    elif next_issue < end:
+                        offset, size = next_issue, min(self.block_size, end - next_issue)
+                        next_issue += size
+                    else:
+                        break
+                    self._send_read(offset, size)
+
+                if not self.in_flight:
+                    break
+
+                offset, size, count, data = receive()
+                if not count:
+                    # Il file si è accorciato durante la lettura
+                    end = min(end, offset)
+                    continue
+                if count < size:
+                    retry.append((offset + count, size - count))
+                yield offset, count, data
+        finally:
+            self._drain()
+
+    def _send_read(self, offset, size):
+        read_andx = smb.SMBCommand(smb.SMB.SMB_COM_READ_ANDX)
+        read_andx['Parameters'] = smb.SMBReadAndX_Parameters()
+        read_andx['Parameters']['Fid'] = self.fid
+        read_andx['Parameters']['Offset'] = offset & 0xFFFFFFFF
+        read_andx['Parameters']['HighOffset'] = offset >> 32  # File oltre 4 GB
+        read_andx['Parameters']['MaxCount'] = size
+        read_andx['Parameters']['MinCount'] = size
+        read_andx['Data'] = b''
+        self._send(read_andx, (offset, size))
+
+    def _recv_read(self):
+        (offset, size), answer = self._recv()
+        data = self._read_data(answer)
+        return offset, size, len(data), data
+
+    def _recv_read_copy(self, view):
+        offset, size, count, data = self._recv_read()
+        view[offset:offset + count] = data
+        return offset, size, count, None
+
+    @staticmethod
+    def _read_data(answer):
+        """Dati di una risposta READ_ANDX già ricevuta; b'' a fine file"""
+        try:
+            answer.isValidAnswer(smb.SMB.SMB_COM_READ_ANDX)
+        except smb.SessionError as e:
+            if e.get_error_code() == nt_errors.STATUS_END_OF_FILE:
+                return b''
+            raise
+        # Byte del comando così come ricevuti: WordCount, parametri, ByteCount, dati.
+        # Niente SMBCommand né getData(), che copierebbero i dati o ricostruirebbero il pacchetto
+        raw = answer['Data'][0]
+        params = smb.SMBReadAndXResponse_Parameters(raw[1:1 + raw[0] * 2])
+        # DataOffset conta dall'inizio dell'header SMB (32 byte)
+        start = params['DataOffset'] - 32
+        count = params['DataCount'] + 0x10000 * params['DataCount_Hi']
+        return memoryview(raw)[start:start + count]
+
+    def _recv_read_into(self, sock, view):
+        """Riceve una risposta leggendo il socket da sé: i dati finiscono con recv_into in view.
+
+        Header NetBIOS, header SMB e parametri si leggono con struct; errori e risposte
+        inattese passano al parsing di impacket una volta ricevuto il pacchetto intero.
+        """
+        try:
+            while True:
+                kind, length = self._recv_netbios(sock)
+                if kind != nmb.NETBIOS_SESSION_MESSAGE:
+                    self._recv_skip(sock, length)  # Keep-alive
+                    continue
+                head = bytearray(min(length, READ_ANDX_RESPONSE.size))
+                self._recv_exact(sock, memoryview(head))
+                if len(head) < 32:
+                    raise IOError(f"Pacchetto SMB troppo corto ({length} byte)")
+                mid = struct.unpack_from('<H', head, 30)[0]
+                request = self.in_flight.pop(mid, None)
+                if request is not None:
+                    break
+                self._recv_skip(sock, length - len(head))  # Risposta non nostra (es. oplock break)
+            offset, size = request
+
+            if len(head) < READ_ANDX_RESPONSE.size or head[4] != smb.SMB.SMB_COM_READ_ANDX or \
+                    struct.unpack_from('<L', head, 5)[0] or head[32] != 12:
+                # Errore o risposta fuori formato: la interpreta impacket, a pacchetto ricevuto
+                rest = bytearray(length - len(head))
+                self._recv_exact(sock, memoryview(rest))
+                packet = bytes(head + rest)
+            else:
+                packet = None
+                count, data_offset, count_high = READ_ANDX_RESPONSE.unpack(head)
+                count += 0x10000 * count_high
+                if data_offset < READ_ANDX_RESPONSE.size or data_offset + count > length or count > size:
+                    raise IOError(f"Risposta READ_ANDX non valida all'offset {offset}")
+                self._recv_skip(sock, data_offset - len(head))  # Padding prima dei dati
+                with view[offset:offset + count] as target:
+                    self._recv_exact(sock, target)
+                self._recv_skip(sock, length - data_offset - count)
+        except Exception:
+            # Pacchetto letto a metà: lo stream non è più allineato, niente da svuotare
+            self.in_flight.clear()
+            raise
+
+        if packet is not None:
+            data = self._read_data(smb.NewSMBPacket(data=packet))
+            view[offset:offset + len(data)] = data
+            count = len(data)
+        return offset, size, count, None
+
+
+class SMB1WritePipeline(SMB1Pipeline):
+    """Scrive un file con più WRITE_ANDX in volo; tiene in memoria solo i blocchi non confermati"""
+
+    def __init__(self, server, tid, fid, depth):
+        super().__init__(server, tid, fid, depth)
+        self.acked = 0  # Byte confermati dal server
+        # Con la firma dei pacchetti attiva le richieste passano da impacket, che la calcola
+        self.sock = None if getattr(server, '_SignatureEnabled', True) else self._socket()
+
+    def write(self, offset, data):
+        """Accoda una scrittura, attendendo conferme se la finestra è piena"""
+        try:
+            while len(self.in_flight) >= self.depth:
+                self._recv_write()
+            self._send_write(offset, data)
+        except Exception:
+            self._drain()
+            raise
+
+    def flush(self):
+        """Attende la conferma di tutte le scritture in volo"""
+        try:
+            while self.in_flight:
+                self._recv_write()
+        finally:
+            self._drain()
+
+    def abort(self):
+        """Abbandona la scrittura: consuma le risposte in volo per lasciare la connessione coerente"""
+        self._drain()
+
+    def _send_write(self, offset, data):
+        if self.sock is not None:
+            self._send_write_raw(offset, data)
+            return
+        write_andx = smb.SMBCommand(smb.SMB.SMB_COM_WRITE_ANDX)
+        write_andx['Parameters'] = smb.SMBWriteAndX_Parameters()
+        write_andx['Parameters']['Fid'] = self.fid
+        write_andx['Parameters']['Offset'] = offset & 0xFFFFFFFF
+        write_andx['Parameters']['HighOffset'] = offset >> 32
+        write_andx['Parameters']['WriteMode'] = 8
+        write_andx['Parameters']['Remaining'] = len(data) & 0xFFFF
+        write_andx['Parameters']['DataLength'] = len(data) & 0xFFFF
+        write_andx['Parameters']['DataLength_Hi'] = len(data) >> 16
+        # Header SMB (32) + WordCount + parametri + ByteCount
+        write_andx['Parameters']['DataOffset'] = 32 + 1 + len(write_andx['Parameters']) + 2
+        write_andx['Data'] = bytes(data)
+        self._send(write_andx, (offset, data))
+
+    def _send_write_raw(self, offset, data):
+        """Invia la richiesta come header + dati con una sola sendmsg: i dati (anche una
+        memoryview su un file mappato) arrivano al socket senza copie né packing di impacket"""
+        mid = self._next_mid()
+        flags1, flags2 = self.server.get_flags()
+        length = len(data)
+        header = WRITE_ANDX_REQUEST.pack(
+            b'\xffSMB', smb.SMB.SMB_COM_WRITE_ANDX, 0, flags1, flags2, 0, b'', 0,
+            self.tid, os.getpid() & 0xFFFF, self.server.get_uid(), mid,
+            14, 0xFF, 0, 0,  # WordCount, nessun comando AndX
+            self.fid, offset & 0xFFFFFFFF, 0xFF, 8, length & 0xFFFF,  # Timeout, WriteMode, Remaining
+            length >> 16, length & 0xFFFF, WRITE_ANDX_REQUEST.size, offset >> 32,
+            length & 0xFFFF)  # ByteCount
+        size = len(header) + length
+        header = struct.pack('>BBH', nmb.NETBIOS_SESSION_MESSAGE, size >> 16, size & 0xFFFF) + header
+        self.in_flight[mid] = (offset, data)
+        if not hasattr(self.sock, 'sendmsg'):  # Windows
+            self.sock.sendall(header)
+            self.sock.sendall(data)
+            return
+        sent = self.sock.sendmsg([header, data])
+        if sent < len(header):
+            self.sock.sendall(header[sent:])
+            sent = len(header)
+        if sent < len(header) + length:
+            self.sock.sendall(data[sent - len(header):])
+
+    def _recv_write(self):
+        if self.sock is not None:
+            (offset, data), packet = self._recv_raw()
+            if len(packet) >= WRITE_ANDX_RESPONSE.size and packet[4] == smb.SMB.SMB_COM_WRITE_ANDX and \
+                    not struct.unpack_from('<L', packet, 5)[0] and packet[32] == 6:
+                count, count_high = WRITE_ANDX_RESPONSE.unpack_from(packet)
+                count += (count_high & 0xFFFF) << 16
+            else:
+                # Errore o risposta fuori formato: la interpreta impacket
+                count = self._write_count(smb.NewSMBPacket(data=bytes(packet)))
+        else:
+            (offset, data), answer = self._recv()
+            count = self._write_count(answer)
+        if count <= 0:
+            raise IOError(f"Il server non ha scritto dati all'offset {offset}")
+        self.acked += min(count, len(data))
+        if count < len(data):
+            # Scrittura parziale: reinvia il resto
+            self._send_write(offset + count, data[count:])
+
+    @staticmethod
+    def _write_count(answer):
+        answer.isValidAnswer(smb.SMB.SMB_COM_WRITE_ANDX)
+        response = smb.SMBCommand(answer['Data'][0])
+        params = smb.SMBWriteAndXResponse_Parameters(response['Parameters'])
+        return params['Count'] + ((params['Reserved'] & 0xFFFF) << 16)  # CountHigh
+
+    def _recv_raw(self):
+        """Come _recv, ma legge il pacchetto dal socket senza il parsing di impacket: (richiesta, byte SMB)"""
+        try:
+            while True:
+                kind, length = self._recv_netbios(self.sock)
+                packet = bytearray(length)
+                self._recv_exact(self.sock, memoryview(packet))
+                if kind != nmb.NETBIOS_SESSION_MESSAGE:
+                    continue  # Keep-alive
+                if length < 32:
+                    raise IOError(f"Pacchetto SMB troppo corto ({length} byte)")
+                request = self.in_flight.pop(struct.unpack_from('<H', packet, 30)[0], None)
+                if request is not None:
+                    return request, packet
+                # Risposta non nostra (es. oplock break): ignorata
+        except Exception:
+            # Pacchetto letto a metà: lo stream non è più allineato, niente da svuotare
+            self.in_flight.clear()
+            raise
+
+
+class SMB1DirectoryPipeline(SMB1Pipeline):
+    """Crea più directory con le CREATE_DIRECTORY in volo insieme"""
+
+    def __init__(self, server, tid, depth):
+        super().__init__(server, tid, None, depth)
+        self.flags2 = server.get_flags()[1]
+
+    def create(self, paths):
+        """Crea paths: {percorso: True se creata, False se già presente, eccezione se fallita}"""
+        results = {}
+        pending = deque(paths)
+        try:
+            while pending or self.in_flight:
+                while pending and len(self.in_flight) < self.depth:
+                    self._send_create(pending.popleft())
+                path, answer = self._recv()
+                try:
+                    answer.isValidAnswer(smb.SMB.SMB_COM_CREATE_DIRECTORY)
+                    results[path] = True
+                except smb.SessionError as e:
+                    if e.get_error_code() in INVALID_TID_ERRORS:
+                        raise
+                    results[path] = False if e.get_error_code() in DIRECTORY_EXISTS_ERRORS else e
+        finally:
+            self._drain()
+        return results
+
+    def _send_create(self, path):
+        create_dir = smb.SMBCommand(smb.SMB.SMB_COM_CREATE_DIRECTORY)
+        create_dir['Data'] = smb.SMBCreateDirectory_Data(flags=self.flags2)
+        create_dir['Data']['DirectoryName'] = path.encode('utf-16le') if self.flags2 & smb.SMB.FLAGS2_UNICODE else path
+        self._send(create_dir, path)
+
+
+class SMB1TreeProbePipeline(SMB1Pipeline):
+    """Prova più share con le TREE_CONNECT_ANDX in volo insieme, ognuna entro timeout secondi"""
+
+    def __init__(self, server, depth, timeout):
+        super().__init__(server, 0xFFFF, None, depth)
+        self.timeout = timeout
+        self.flags2 = server.get_flags()[1]
+        self.expired = []  # Share senza risposta entro il timeout: la connessione non è più allineata
+
+    def probe(self, shares):
+        """{share: TID se accessibile, None se rifiutata}; le share scadute finiscono in expired"""
+        results = {}
+        pending = deque(shares)
+        default_timeout = self.server.get_timeout()
+        try:
+            while pending or self.in_flight:
+                while pending and len(self.in_flight) < self.depth:
+                    self._send_connect(pending.popleft())
+                remaining = min(deadline for _, deadline in self.in_flight.values()) - time.monotonic()
+                if remaining <= 0:
+                    raise nmb.NetBIOSTimeout
+                self.server.set_timeout(remaining)
+                (share, _), answer = self._recv()
+                try:
+                    answer.isValidAnswer(smb.SMB.SMB_COM_TREE_CONNECT_ANDX)
+                    results[share] = answer['Tid']
+                except smb.SessionError:
+                    results[share] = None
+        except (nmb.NetBIOSTimeout, nmb.NetBIOSError, OSError):
+            # Risposte mancanti (o lette a metà): restano in volo, non si possono più attendere
+            self.expired = [share for share, _ in self.in_flight.values()] + list(pending)
+            self.in_flight.clear()
+        finally:
+            self.server.set_timeout(default_timeout)
+        return results
+
+    def _send_connect(self, share):
+        path = f"\\\\{self.server.get_remote_host()}\\{share}".upper()
+        tree_connect = smb.SMBCommand(smb.SMB.SMB_COM_TREE_CONNECT_ANDX)
+        tree_connect['Parameters'] = smb.SMBTreeConnectAndX_Parameters()
+        tree_connect['Data'] = smb.SMBTreeConnectAndX_Data(flags=self.flags2)
+        tree_connect['Parameters']['PasswordLength'] = 1
+        tree_connect['Data']['Password'] = '\x00'  # Sicurezza a livello utente: password nella sessione
+        tree_connect['Data']['Path'] = path.encode('utf-16le') if self.flags2 & smb.SMB.FLAGS2_UNICODE else path
+        tree_connect['Data']['Service'] = smb.SERVICE_ANY
+        if self.flags2 & smb.SMB.FLAGS2_UNICODE:
+            tree_connect['Data']['Pad'] = 0x0
+        self._send(tree_connect, (share, time.monotonic() + self.timeout))
+
+
+class SequentialWriter:
+    """Scrittore a blocchi senza pipeline, per dialetti diversi da SMB1"""
+
+    def __init__(self, conn, tid, fid):
+        self.conn = conn
+        self.tid = tid
+        self.fid = fid
+        self.acked = 0
+
+    def write(self, offset, data):
+        self.conn.writeFile(self.tid, self.fid, bytes(data), offset)  # impacket vuole bytes
+        self.acked += len(data)
+
+    def flush(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class LocalFileSource:
+    """File locale da caricare, letto a blocchi da una mappatura in memoria senza copie.
+
+    I blocchi sono memoryview sulla mappatura; quelli già inviati vengono tolti dalla
+    memoria del processo (MADV_DONTNEED), così l'RSS resta piatto anche per file molto
+    grandi. Se il file non si può mappare (vuoto, file speciale, file system senza mmap)
+    o con use_mmap=False, i blocchi arrivano da read().
+    """
+
+    RELEASE_STEP = 4 * 1024 * 1024
+
+    def __init__(self, path, use_mmap=True):
+        self.file = open(path, 'rb')
+        self.mapping = None
+        self.view = None
+        self.released = 0  # Inizio della parte ancora residente della mappatura
+        if use_mmap:
+            try:
+                self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.mapping)
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    self.mapping.madvise(mmap.MADV_SEQUENTIAL)
+            except (OSError, ValueError) as e:
+                logger.debug(f"mmap non disponibile per {path}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def chunks(self, start, chunk_size, end=None):
+        """Genera (offset, dati) da start fino a end (default: fine del file), chunk_size byte alla volta"""
+        if self.view is None:
+            self.file.seek(start)
+            offset = start
+            while end is None or offset < end:
+                data = self.file.read(chunk_size if end is None else min(chunk_size, end - offset))
+                if not data:
+                    return
+                yield offset, data
+                offset += len(data)
+            return
+        end = len(self.view) if end is None else min(end, len(self.view))
+        for offset in range(start, end, chunk_size):
+            yield offset, self.view[offset:min(offset + chunk_size, end)]
+            self._release(offset)
+
+    def _release(self, offset):
+        """Libera le pagine prima di offset: se servono ancora (reinvio) il kernel le rilegge dal file"""
+        if offset - self.released < self.RELEASE_STEP or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        end = offset - offset % mmap.PAGESIZE
+        self.mapping.madvise(mmap.MADV_DONTNEED, self.released, end - self.released)
+        self.released = end
+
+    def close(self):
+        if self.mapping is not None:
+            self.view.release()
+            try:
+                self.mapping.close()
+            except BufferError:
+                pass  # Blocchi ancora referenziati: la mappatura si chiude quando vengono liberati
+        self.file.close()
+
+
+# --- Enumerazione directory SMB1 ---
+# SMB_FIND_FILE_DIRECTORY_INFO senza il nome: NextEntryOffset, FileIndex, 4 timestamp,
+# EndOfFile, AllocationSize, ExtFileAttributes, FileNameLength
+FIND_DIRECTORY_INFO = struct.Struct('<LLqqqqqqLL')
+FIND_SEARCH_ATTRIBUTES = (smb.SMB_FILE_ATTRIBUTE_DIRECTORY | smb.SMB_FILE_ATTRIBUTE_HIDDEN |
+                          smb.SMB_FILE_ATTRIBUTE_SYSTEM | smb.SMB_FILE_ATTRIBUTE_READONLY |
+                          smb.SMB_FILE_ATTRIBUTE_ARCHIVE)
+# Con il bit "must" della directory (byte alto di SMB_SEARCH_ATTRIBUTES) il server restituisce
+# solo le cartelle; chi lo ignora manda tutto e il filtro resta lato client
+FIND_DIRECTORIES_ONLY = FIND_SEARCH_ATTRIBUTES | smb.SMB_FILE_ATTRIBUTE_DIRECTORY << 8
+
+
+def parse_find_entries(data, count):
+    """Estrae (nome grezzo, FileIndex, dimensione, attributi, LastWriteTime) da un blocco di FIND_FIRST2/NEXT2"""
+    entries = []
+    offset = 0
+    for _ in range(count):
+        if offset + FIND_DIRECTORY_INFO.size > len(data):
+            break
+        (next_offset, file_index, _ctime, _atime, wtime, _chtime,
+         size, _alloc, attribs, name_len) = FIND_DIRECTORY_INFO.unpack_from(data, offset)
+        start = offset + FIND_DIRECTORY_INFO.size
+        entries.append((data[start:start + name_len], file_index, size, attribs, wtime))
+        if not next_offset:
+            break
+        offset += next_offset
+    return entries
+
+
+class ListingCursor:
+    """Posizione di un'enumerazione di directory: la pagina successiva riprende da qui"""
+
+    def __init__(self, share, search_path):
+        self.share = share
+        self.search_path = search_path
+        self.search_attributes = FIND_SEARCH_ATTRIBUTES
+        self.session = None  # Sessione su cui è aperta la ricerca
+        self.sid = None  # Handle della ricerca ancora aperto sul server
+        self.resume_name = None  # Nome grezzo dell'ultima voce ricevuta dal server
+        self.resume_key = 0
+        self.pending = deque()  # Voci ricevute ma non ancora restituite
+        self.returned = 0  # Voci restituite finora
+        self.end_of_search = False  # Il server non ha altre voci da inviare
+        self.finished = False
+
+
+# --- Sessione del pool ---
+class SMBSession:
+    """Connessione SMB autenticata del pool, con la propria cache di TID"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.tree_ids = {}  # share -> TID mantenuta per tutta la sessione
+        self.last_used = time.monotonic()
+        self.suspect = False  # Ultima operazione fallita per un errore non SMB
+
+    def is_healthy(self):
+        """Verifica la connessione con un SMB ECHO"""
+        try:
+            self.conn.getSMBServer().echo()
+            return True
+        except Exception as e:
+            logger.warning(f"Sessione SMB non valida: {e}")
+            return False
+
+    def close(self):
+        """Chiude alberi e sessione ignorando gli errori"""
+        for share, tid in self.tree_ids.items():
+            try:
+                self.conn.disconnectTree(tid)
+            except Exception as e:
+                logger.debug(f"Errore disconnectTree {share}: {e}")
+        self.tree_ids = {}
+        try:
+            self.conn.logoff()
+        except Exception as e:
+            logger.debug(f"Errore logoff: {e}")
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+# --- Cache dei listing ---
+class ListingCache:
+    """Listing di directory recenti con scadenza (ttl) ed eliminazione LRU oltre il budget"""
+
+    ENTRY_OVERHEAD = 300  # Byte stimati per voce oltre al nome (dict, int, str)
+
+    def __init__(self, ttl=30, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # chiave -> (istante, file, completo, byte stimati)
+        self.bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def get(self, key, limit=None):
+        """File in cache per key, se non scaduti e sufficienti per limit; altrimenti None"""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None and time.monotonic() - item[0] > self.ttl:
+                self._remove(key)
+                item = None
+            if item is None or (not item[2] and (limit is None or len(item[1]) < limit)):
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return item[1][:limit] if limit else list(item[1])
+
+    def put(self, key, files, complete):
+        """Memorizza un listing; complete=False se troncato da un limite"""
+        size = sum(self.ENTRY_OVERHEAD + len(f['filename']) for f in files)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (time.monotonic(), files, complete, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate(self, server, share, path):
+        """Rimuove i listing di una directory con qualsiasi filtro"""
+        with self.lock:
+            for key in [k for k in self.entries if k[:3] == (server, share, path)]:
+                self._remove(key)
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[3]
+
+
+# --- Statistiche dei trasferimenti ---
+class TransferProgress:
+    """Istantanea del progresso passata ai progress_callback"""
+
+    __slots__ = ('bytes_done', 'bytes_total', 'files_done', 'files_total', 'elapsed', 'rate', 'final')
+
+    def __init__(self, bytes_done, bytes_total, files_done, files_total, elapsed, rate, final):
+        self.bytes_done = bytes_done
+        self.bytes_total = bytes_total  # 0 se non noto (es. visita ricorsiva in corso)
+        self.files_done = files_done  # None per i trasferimenti di un solo file
+        self.files_total = files_total
+        self.elapsed = elapsed
+        self.rate = rate  # Byte al secondo negli ultimi secondi
+        self.final = final  # Ultimo aggiornamento del trasferimento
+
+    @property
+    def percent(self):
+        if self.bytes_total:
+            return min(100.0, self.bytes_done / self.bytes_total * 100)
+        if self.files_total:
+            return self.files_done / self.files_total * 100
+        return 100.0 if self.final else 0.0
+
+    @property
+    def eta(self):
+        """Secondi stimati alla fine, None se non stimabili"""
+        if self.final:
+            return 0.0
+        if not self.bytes_total or not self.rate:
+            return None
+        return max(self.bytes_total - self.bytes_done, 0) / self.rate
+
+    @property
+    def files_per_s(self):
+        return (self.files_done or 0) / max(self.elapsed, 1e-6)
+
+
+class ProgressReporter:
+    """Riduce gli aggiornamenti di progresso prima di chiamare callback.
+
+    I trasferimenti chiamano update a ogni blocco; callback riceve un TransferProgress
+    al massimo ogni min_interval secondi e solo se la percentuale è avanzata di almeno
+    min_percent (o se è passato un secondo, per aggiornare velocità e tempo residuo).
+    Il primo e l'ultimo aggiornamento passano sempre. La velocità è la media sugli
+    ultimi rate_window secondi, così il tempo residuo segue i cambi del link.
+    """
+
+    def __init__(self, callback, bytes_total=0, start_bytes=0, min_interval=0.05, min_percent=0.5,
+                 rate_window=3.0):
+        self.callback = callback
+        self.bytes_total = bytes_total
+        self.min_interval = min_interval
+        self.min_percent = min_percent
+        self.rate_window = rate_window
+        self.started = time.monotonic()
+        self.samples = deque([(self.started, start_bytes)])  # (istante, byte) per la velocità
+        self.last_report = None
+        self.last_percent = None
+
+    def update(self, bytes_done, files_done=None, files_total=None, final=False):
+        if not self.callback:
+            return
+        now = time.monotonic()
+        if not final and self.last_report is not None:
+            if now - self.last_report < self.min_interval:
+                return
+            if self.bytes_total:
+                percent = bytes_done / self.bytes_total * 100
+            elif files_total:
+                percent = (files_done or 0) / files_total * 100
+            else:
+                percent = None
+            if percent is not None and percent - self.last_percent < self.min_percent \
+                    and now - self.last_report < 1.0:
+                return
+
+        self.samples.append((now, bytes_done))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.rate_window:
+            self.samples.popleft()
+        first_time, first_bytes = self.samples[0]
+        rate = (bytes_done - first_bytes) / (now - first_time) if now > first_time else 0.0
+        progress = TransferProgress(bytes_done, self.bytes_total, files_done, files_total,
+                                    now - self.started, rate, final)
+        self.last_report = now
+        self.last_percent = progress.percent
+        self.callback(progress)
+
+
+class TransferStats:
+    """Contatori di un trasferimento di più file, aggiornati in parallelo dai worker"""
+
+    def __init__(self):
+        self.files = 0  # File completati
+        self.bytes = 0
+        self.dirs = 0
+        self.queued = 0  # File trovati finora e messi in coda
+        self.skipped = 0  # File invariati non trasferiti (sincronizzazione)
+        self.deleted = 0  # File e cartelle eliminati perché assenti nella sorgente
+        self.failed = []  # Percorsi non trasferiti
+        self.started = time.monotonic()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def add_file(self, size):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+
+    def add_failure(self, path):
+        with self.lock:
+            self.failed.append(path)
+
+    def stop(self):
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return max((self.finished or time.monotonic()) - self.started, 1e-6)
+
+    @property
+    def mb_per_s(self):
+        return self.bytes / self.elapsed / 1e6
+
+    @property
+    def files_per_s(self):
+        return self.files / self.elapsed
+
+    def summary(self):
+        text = (f"{self.files} file, {self.dirs} cartelle, {self.bytes} byte in {self.elapsed:.2f}s - "
+                f"{self.mb_per_s:.2f} MB/s, {self.files_per_s:.1f} file/s, {len(self.failed)} errori")
+        if self.skipped or self.deleted:
+            text += f", {self.skipped} invariati, {self.deleted} eliminati"
+        return text
+
+    def __bool__(self):
+        return not self.failed
+
+
+# --- Trasferimento delta ---
+class BlockSignatures:
+    """Hash BLAKE2b per blocco di un file, per riconoscere i blocchi cambiati dall'ultimo trasferimento"""
+
+    DIGEST_SIZE = 16
+
+    def __init__(self, block_size, digests=b''):
+        self.block_size = block_size
+        self.digests = bytearray(digests)  # DIGEST_SIZE byte per blocco, in ordine
+        self._pending = bytearray()
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state['block_size'], bytes.fromhex(state['digests']))
+
+    def to_state(self):
+        return {'block_size': self.block_size, 'digests': self.digests.hex()}
+
+    def __len__(self):
+        return len(self.digests) // self.DIGEST_SIZE
+
+    @classmethod
+    def digest(cls, block):
+        return hashlib.blake2b(block, digest_size=cls.DIGEST_SIZE).digest()
+
+    def get(self, index):
+        start = index * self.DIGEST_SIZE
+        return bytes(self.digests[start:start + self.DIGEST_SIZE]) if index < len(self) else None
+
+    def add(self, digest):
+        self.digests += digest
+
+    def update(self, data):
+        """Aggiunge dati in flusso continuo, a pezzi di dimensione qualsiasi"""
+        self._pending += data
+        while len(self._pending) >= self.block_size:
+            self.add(self.digest(bytes(self._pending[:self.block_size])))
+            del self._pending[:self.block_size]
+
+    def finish(self):
+        if self._pending:
+            self.add(self.digest(bytes(self._pending)))
+            self._pending.clear()
+        return self
+
+
+# --- Classe client SMB ottimizzata ---
+class SMBv1Client:
+    def __init__(self, pool_size=4):
+        self.conn = None  # Connessione della prima sessione
+        self.is_connected = False
+        self.current_share = None
+        self.timeout = 30
+        self.read_block_size = None  # None = massimo negoziato col server
+        self.read_queue_depth = 8  # Letture in volo per download
+        self.mmap_downloads = True  # Download SMB1 ricevuti direttamente in una mappatura del file locale
+        self.write_block_size = None  # None = massimo negoziato col server
+        self.mmap_uploads = True  # Upload letti da una mappatura del file locale, senza copie
+        self.write_queue_depth = 4  # Scritture in volo per upload
+        self.find_batch_size = 512  # Voci richieste per FIND_FIRST2/FIND_NEXT2
+        self.share_probe_timeout = 5  # Secondi di attesa per share provata (e per l'elenco srvsvc)
+        self.share_probe_depth = 16  # Prove di share in volo insieme
+        self.share_wordlist = None  # Nomi da provare se il server non elenca le share (None = COMMON_SHARES)
+        self.share_cache = {}  # "server|utente" -> share trovate, per tutta la vita del client
+        self.tree_stats = {'connects': 0, 'reused': 0, 'reconnects': 0}
+        self.server_key = None  # "ip:porta" del server connesso, per le chiavi di cache
+        self.transfer_retries = 5  # Nuovi tentativi dopo la perdita della sessione
+        self.retry_backoff = 1.0  # Attesa iniziale in secondi, raddoppiata a ogni tentativo
+        self.retry_backoff_max = 30.0
+        self.mtime_tolerance = 2.0  # Secondi: FAT e molti dispositivi salvano le date con risoluzione di 2 s
+        # Stato dei trasferimenti interrotti, per riprenderli dall'ultimo offset
+        self.resume_dir = os.path.join(os.path.expanduser('~'), '.cache', 'ssmbv1', 'resume')
+        # Firme dei blocchi dei file caricati in modalità delta
+        self.signature_dir = os.path.join(os.path.expanduser('~'), '.cache', 'ssmbv1', 'signatures')
+        self.delta_block_size = 256 * 1024
+        self.delta_stats = {'sent': 0, 'saved': 0}  # Byte inviati e risparmiati dagli upload delta
+        self.listing_cache = ListingCache()
+
+        # Pool di sessioni verso lo stesso server
+        self.pool_size = max(1, pool_size)
+        self.pool_health_interval = 15  # Secondi di inattività oltre cui verificare una sessione
+        self._login_args = None
+        self._sessions = []  # Tutte le sessioni aperte
+        self._idle = []  # Sessioni libere
+        self._opening = 0  # Sessioni in fase di login
+        self._bulk_in_use = 0  # Sessioni occupate da trasferimenti
+        self._pool_cond = threading.Condition()
+
+    def connect(self, server_name, server_ip, username='', password='', domain='', port=139):
+        """Connette al server SMB con timeout"""
+        if self.is_connected:
+            self.disconnect()
+        try:
+            logger.info(f"Connessione a {server_ip}, user={'<anonimo>' if not username else username}, port={port}")
+            self._login_args = (server_name, server_ip, username, password, domain, port)
+            self.server_key = f"{server_ip}:{port}"
+            session = self._open_session()
+            with self._pool_cond:
+                self._sessions = [session]
+                self._idle = [session]
+                self._bulk_in_use = 0
+                self.tree_stats = {'connects': 0, 'reused': 0, 'reconnects': 0}
+                self.conn = session.conn
+                self.is_connected = True
+            return True
+        except Exception as e:
+            logger.error(f"Errore connessione: {e}")
+            return False
+
+    def _open_session(self):
+        """Apre e autentica una nuova connessione con le credenziali di connect()"""
+        server_name, server_ip, username, password, domain, port = self._login_args
+        conn = SMBConnection(remoteName=server_name, remoteHost=server_ip, sess_port=port)
+        conn.setTimeout(self.timeout)
+        conn.login(username, password, domain, lmhash='', nthash='', ntlmFallback=True)
+        return SMBSession(conn)
+
+    def _checkout(self, bulk=False, prefer=None):
+        """Prende in uso esclusivo una sessione del pool, aprendone una nuova se c'è posto.
+
+        I trasferimenti (bulk) lasciano sempre libera una sessione per la navigazione.
+        Con prefer si attende una sessione specifica, se è ancora nel pool.
+        """
+        while True:
+            with self._pool_cond:
+                while True:
+                    if not self.is_connected:
+                        raise ConnectionError("Client SMB non connesso")
+                    if prefer is not None and prefer in self._sessions:
+                        if prefer in self._idle:
+                            self._idle.remove(prefer)
+                            session = prefer
+                            break
+                        self._pool_cond.wait()
+                        continue
+                    bulk_ok = not bulk or self._bulk_in_use < max(1, self.pool_size - 1)
+                    if bulk_ok and self._idle:
+                        session = self._idle.pop()
+                        break
+                    if bulk_ok and len(self._sessions) + self._opening < self.pool_size:
+                        session = None
+                        self._opening += 1
+                        break
+                    self._pool_cond.wait()
+                if bulk:
+                    self._bulk_in_use += 1
+
+            if session is None:
+                try:
+                    session = self._open_session()
+                finally:
+                    with self._pool_cond:
+                        self._opening -= 1
+                        if session is not None:
+                            self._sessions.append(session)
+                        elif bulk:
+                            self._bulk_in_use -= 1
+                        self._pool_cond.notify_all()
+                logger.info(f"Nuova sessione nel pool ({len(self._sessions)}/{self.pool_size})")
+                return session
+
+            idle_for = time.monotonic() - session.last_used
+            if not (session.suspect or idle_for > self.pool_health_interval) or session.is_healthy():
+                session.suspect = False
+                return session
+
+            # Sessione caduta: scartala e riprova con un'altra
+            self._discard(session, bulk)
+
+    def _checkin(self, session, bulk=False, error=None):
+        """Restituisce la sessione al pool"""
+        session.last_used = time.monotonic()
+        if error is not None and not isinstance(error, SMB_ERRORS):
+            session.suspect = True
+        with self._pool_cond:
+            if bulk:
+                self._bulk_in_use -= 1
+            keep = self.is_connected and session in self._sessions
+            if keep:
+                self._idle.append(session)
+            self._pool_cond.notify_all()
+        if not keep:
+            session.close()
+
+    def _discard(self, session, bulk=False):
+        session.close()
+        with self._pool_cond:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            if bulk:
+                self._bulk_in_use -= 1
+            if session.conn is self.conn:
+                self.conn = self._sessions[0].conn if self._sessions else None
+            self._pool_cond.notify_all()
+
+    @contextmanager
+    def _session(self, bulk=False, prefer=None):
+        """Sessione del pool in uso esclusivo per la durata del blocco"""
+        session = self._checkout(bulk, prefer)
+        error = None
+        try:
+            yield session
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._checkin(session, bulk, error)
+
+    def _count(self, key):
+        with self._pool_cond:
+            self.tree_stats[key] += 1
+
+    def list_shares(self, refresh=False):
+        """Lista le share disponibili: elenco srvsvc del server, altrimenti prova i nomi noti.
+
+        Il risultato resta in share_cache per server e utente; refresh lo rilegge.
+        """
+        if not self.is_connected:
+            return []
+        key = self._share_cache_key()
+        if not refresh and key in self.share_cache:
+            return list(self.share_cache[key])
+
+        shares = []
+        try:
+            with self._session() as session:
+                # Un dispositivo che non risponde su srvsvc non deve bloccare per tutto self.timeout
+                session.conn.setTimeout(self.share_probe_timeout)
+                try:
+                    share_list = session.conn.listShares()
+                except SMB_ERRORS:
+                    raise
+                except Exception:
+                    session.conn.close()  # Una risposta tardiva confonderebbe la richiesta successiva
+                    raise
+                finally:
+                    session.conn.setTimeout(self.timeout)
+            for share in share_list:
+                share_name = share['shi1_netname'][:-1]  # Rimuovi il null terminator
+                if share_name and not share_name.endswith('$'):  # Escludi share amministrative
+                    shares.append(share_name)
+        except Exception as e:
+            logger.error(f"Errore list_shares: {e}")
+            shares = self.try_common_shares()
+        if shares:
+            self.share_cache[key] = list(shares)
+        return shares
+
+    def _share_cache_key(self):
+        return f"{self.server_key}|{self._login_args[2] if self._login_args else ''}"
+
+    def try_common_shares(self, candidates=None):
+        """Prova a connettersi a share note: candidates, share_wordlist o COMMON_SHARES.
+
+        Su SMB1 le TREE_CONNECT partono tutte insieme e ognuna ha share_probe_timeout
+        secondi per rispondere: un nome che il server lascia senza risposta non rallenta
+        gli altri. Le TID delle share trovate restano alla sessione per select_share.
+        """
+        candidates = list(dict.fromkeys(candidates or self.share_wordlist or COMMON_SHARES))
+        available_shares = []
+        try:
+            with self._session() as session:
+                conn = session.conn
+                if conn.getDialect() == smb.SMB_DIALECT:
+                    pipeline = SMB1TreeProbePipeline(conn.getSMBServer(), self.share_probe_depth,
+                                                     self.share_probe_timeout)
+                    results = pipeline.probe(candidates)
+                    keep_trees = not pipeline.expired
+                    if pipeline.expired:
+                        logger.warning(f"Nessuna risposta entro {self.share_probe_timeout}s per: "
+                                       f"{', '.join(pipeline.expired)}")
+                        # Risposte tardive arriverebbero alla prossima richiesta: la sessione va scartata
+                        session.suspect = True
+                        conn.close()
+                else:
+                    results = self._probe_shares(conn, candidates)
+                    keep_trees = True
+                for share in candidates:
+                    tid = results.get(share)
+                    if tid is None:
+                        continue
+                    self._count('connects')
+                    if keep_trees:
+                        session.tree_ids.setdefault(share, tid)
+                    available_shares.append(share)
+                    logger.info(f"Share trovata: {share}")
+        except Exception as e:
+            logger.error(f"Errore ricerca share: {e}")
+        return available_shares
+
+    def _probe_shares(self, conn, candidates):
+        """Prove una alla volta, per i dialetti diversi da SMB1"""
+        results = {}
+        conn.setTimeout(self.share_probe_timeout)
+        try:
+            for share in candidates:
+                try:
+                    results[share] = conn.connectTree(share)
+                except SMB_ERRORS:
+                    results[share] = None
+        finally:
+            conn.setTimeout(self.timeout)
+        return results
+
+    def _tree(self, session, share):
+        """TID della share sulla sessione, riusata dalla cache o connessa alla prima richiesta"""
+        tid = session.tree_ids.get(share)
+        if tid is not None:
+            self._count('reused')
+            return tid
+        tid = session.conn.connectTree(share)
+        session.tree_ids[share] = tid
+        self._count('connects')
+        return tid
+
+    @staticmethod
+    def _error_code(error):
+        """Codice di stato di un errore SMB di impacket, None per gli altri errori"""
+        if hasattr(error, 'getErrorCode'):
+            return error.getErrorCode()
+        if hasattr(error, 'get_error_code'):
+            return error.get_error_code()
+        return None
+
+    @classmethod
+    def _is_invalid_tid(cls, error):
+        return cls._error_code(error) in INVALID_TID_ERRORS
+
+    def _on_tree(self, share, operation, bulk=False):
+        """Esegue operation(conn, tid) su una sessione del pool, riconnettendo la share se il server l'ha invalidata"""
+        with self._session(bulk) as session:
+            try:
+                return operation(session.conn, self._tree(session, share))
+            except Exception as e:
+                if not self._is_invalid_tid(e):
+                    raise
+                logger.warning(f"TID non valida per {share}, riconnessione: {e}")
+                session.tree_ids.pop(share, None)
+                self._count('reconnects')
+                return operation(session.conn, self._tree(session, share))
+
+    def select_share(self, share_name):
+        """Seleziona una share specifica"""
+        try:
+            with self._session() as session:
+                self._tree(session, share_name)
+            self.current_share = share_name
+            logger.info(f"Share selezionata: {share_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Share {share_name} non accessibile: {e}")
+            return False
+
+    @staticmethod
+    def _search_path(path, pattern="*"):
+        """Percorso di ricerca FIND_FIRST2 per una directory"""
+        if path == "\\" or path == "":
+            return pattern
+        path = path.replace('/', '\\')
+        if path.endswith('\\'):
+            return path + pattern
+        return path + "\\" + pattern
+
+    def _recv_trans2(self, server):
+        """Riceve una risposta TRANS2 anche se frammentata: (parametri, dati)"""
+        params = b''
+        data = b''
+        total_params = total_data = 1
+        while len(params) < total_params or len(data) < total_data:
+            resp = server.recvSMB()
+            resp.isValidAnswer(smb.SMB.SMB_COM_TRANSACTION2)
+            response = smb.SMBCommand(resp['Data'][0])
+            header = smb.SMBTransaction2Response_Parameters(response['Parameters'])
+            total_params = header['TotalParameterCount']
+            total_data = header['TotalDataCount']
+            # Gli offset partono dall'header SMB (55 byte prima dei dati con SetupCount 0)
+            start = header['ParameterOffset'] - 55
+            params += response['Data'][start:start + header['ParameterCount']]
+            start = header['DataOffset'] - 55
+            data += response['Data'][start:start + header['DataCount']]
+            if not header['ParameterCount'] and not header['DataCount']:
+                break
+        return params, data
+
+    def _find_batch(self, conn, tid, cursor, batch_size):
+        """Chiede al server il blocco successivo di voci (FIND_FIRST2 o FIND_NEXT2)"""
+        server = conn.getSMBServer()
+        flags2 = server.get_flags()[1]
+        unicode = flags2 & smb.SMB.FLAGS2_UNICODE
+        first = cursor.sid is None
+
+        if first:
+            request = smb.SMBFindFirst2_Parameters(flags2)
+            request['SearchAttributes'] = cursor.search_attributes
+            request['SearchCount'] = batch_size
+            request['Flags'] = smb.SMB_FIND_RETURN_RESUME_KEYS | smb.SMB_FIND_CLOSE_AT_EOS
+            request['InformationLevel'] = smb.SMB_FIND_FILE_DIRECTORY_INFO
+            request['SearchStorageType'] = 0
+            request['FileName'] = cursor.search_path.encode('utf-16le') if unicode else cursor.search_path
+            server.send_trans2(tid, smb.SMB.TRANS2_FIND_FIRST2, '\x00', request, '')
+        else:
+            request = smb.SMBFindNext2_Parameters(flags2)
+            request['SID'] = cursor.sid
+            request['SearchCount'] = batch_size
+            request['InformationLevel'] = smb.SMB_FIND_FILE_DIRECTORY_INFO
+            request['ResumeKey'] = cursor.resume_key
+            request['Flags'] = smb.SMB_FIND_RETURN_RESUME_KEYS | smb.SMB_FIND_CLOSE_AT_EOS
+            request['FileName'] = cursor.resume_name
+            server.send_trans2(tid, smb.SMB.TRANS2_FIND_NEXT2, '\x00', request, '')
+
+        params, data = self._recv_trans2(server)
+        if first:
+            response = smb.SMBFindFirst2Response_Parameters(params)
+            cursor.sid = response['SID']
+        else:
+            response = smb.SMBFindNext2Response_Parameters(params)
+
+        entries = parse_find_entries(data, response['SearchCount'])
+        if entries:
+            raw_name, cursor.resume_key = entries[-1][0], entries[-1][1]
+            cursor.resume_name = raw_name if unicode else raw_name.rstrip(b'\x00')
+        if response['EndOfSearch'] or not entries:
+            # Con SMB_FIND_CLOSE_AT_EOS il server ha già chiuso la ricerca
+            cursor.end_of_search = True
+            cursor.sid = None
+
+        encoding = 'utf-16le' if unicode else 'cp437'
+        return [(raw.decode(encoding, errors='replace').rstrip('\x00'), size, attribs, wtime)
+                for raw, _, size, attribs, wtime in entries]
+
+    def _find_close(self, conn, tid, sid):
+        """Chiude una ricerca lasciata aperta (SMB_COM_FIND_CLOSE2)"""
+        server = conn.getSMBServer()
+        packet = smb.NewSMBPacket()
+        packet['Tid'] = tid
+        find_close = smb.SMBCommand(smb.SMB.SMB_COM_FIND_CLOSE2)
+        find_close['Parameters'] = struct.pack('<H', sid)
+        find_close['Data'] = b''
+        packet.addCommand(find_close)
+        server.sendSMB(packet)
+        server.recvSMB().isValidAnswer(smb.SMB.SMB_COM_FIND_CLOSE2)
+
+    def close_cursor(self, cursor):
+        """Chiude sul server la ricerca associata a un cursore non esaurito"""
+        if cursor is None or cursor.sid is None or not self.is_connected:
+            return
+        sid, cursor.sid = cursor.sid, None
+        cursor.finished = True
+        try:
+            with self._session(prefer=cursor.session) as session:
+                if session is cursor.session:
+                    self._find_close(session.conn, self._tree(session, cursor.share), sid)
+        except Exception as e:
+            logger.debug(f"Errore chiusura ricerca: {e}")
+
+    def iter_files(self, path="\\", cursor=None, batch_size=None):
+        """Genera le voci della directory man mano che arrivano dal server.
+
+        Le richieste FIND_NEXT2 partono solo quando il consumatore chiede altre voci.
+        Se si passa un ListingCursor la ricerca resta aperta alla chiusura del
+        generatore, e una chiamata successiva con lo stesso cursore riprende da lì.
+        """
+        if not self.is_connected or not self.current_share:
+            return
+        keep_open = cursor is not None
+        cursor = cursor or ListingCursor(self.current_share, self._search_path(path))
+        if cursor.finished:
+            return
+        batch_size = batch_size or self.find_batch_size
+        logger.debug(f"Search path: '{cursor.search_path}'")
+
+        with self._session(prefer=cursor.session) as session:
+            if session is not cursor.session and cursor.sid is not None:
+                # La sessione della ricerca non esiste più: si riparte saltando le voci già viste
+                cursor.sid = None
+                cursor.pending.clear()
+                cursor.end_of_search = False
+            cursor.session = session
+            conn = session.conn
+
+            if conn.getDialect() != smb.SMB_DIALECT:
+                yield from self._iter_files_listpath(conn, cursor)
+                return
+
+            tid = self._tree(session, cursor.share)
+            skip = 0 if cursor.sid is not None or cursor.pending or cursor.end_of_search else cursor.returned
+            restarted = False
+            try:
+                while True:
+                    while cursor.pending:
+                        entry = cursor.pending.popleft()
+                        cursor.returned += 1
+                        yield entry
+                    if cursor.end_of_search:
+                        cursor.finished = True
+                        return
+
+                    try:
+                        batch = self._find_batch(conn, tid, cursor, batch_size)
+                    except SMB_ERRORS as e:
+                        if cursor.sid is None or cursor.returned == 0 or restarted:
+                            raise
+                        # Ricerca scaduta sul server: riparte da capo saltando le voci già restituite
+                        logger.warning(f"Ricerca scaduta, riavvio enumerazione: {e}")
+                        cursor.sid = None
+                        skip = cursor.returned
+                        restarted = True
+                        continue
+
+                    for name, size, attribs, wtime in batch:
+                        if name in ('.', '..'):
+                            continue
+                        if skip:
+                            skip -= 1
+                            continue
+                        cursor.pending.append({
+                            'filename': name,
+                            'is_directory': bool(attribs & smb.ATTR_DIRECTORY),
+                            'size': size,
+                            'mtime': filetime_to_unix(wtime)
+                        })
+            finally:
+                if not keep_open and cursor.sid is not None:
+                    try:
+                        self._find_close(conn, tid, cursor.sid)
+                    except Exception as e:
+                        logger.debug(f"Errore chiusura ricerca: {e}")
+                    cursor.sid = None
+
+    def _iter_files_listpath(self, conn, cursor):
+        """Enumerazione per dialetti diversi da SMB1: elenco completo, poi paginato"""
+        file_list = conn.listPath(cursor.share, cursor.search_path)
+        entries = [f for f in file_list if f.get_longname() not in ('.', '..')]
+        for f in entries[cursor.returned:]:
+            cursor.returned += 1
+            yield {
+                'filename': f.get_longname(),
+                'is_directory': bool(f.is_directory()),
+                'size': f.get_filesize(),
+                'mtime': f.get_mtime_epoch() or None,
+                'attributes': f.get_attributes()
+            }
+        cursor.finished = True
+
+    def list_files_page(self, path="\\", limit=1000, file_filter=None, cursor=None):
+        """Pagina di file con filtri: (file, cursore per la pagina successiva o None se finita)"""
+        if not self.is_connected or not self.current_share:
+            return [], None
+
+        files = []
+        cursor = cursor or ListingCursor(self.current_share, self._search_path(path))
+        # Non chiedere al server molte più voci di quante ne servano per la pagina
+        batch_size = max(16, min(self.find_batch_size, limit + 2))
+        try:
+            entries = self.iter_files(path, cursor=cursor, batch_size=batch_size)
+            try:
+                for entry in entries:
+                    # Applica filtro se specificato
+                    if file_filter == "folders" and not entry['is_directory']:
+                        continue
+                    elif file_filter == "files" and entry['is_directory']:
+                        continue
+                    files.append(entry)
+                    if len(files) >= limit:
+                        break
+            finally:
+                entries.close()
+
+            logger.info(f"Letti {cursor.returned} elementi da {cursor.search_path}")
+            return files, (None if cursor.finished else cursor)
+
+        except SMB_ERRORS as e:
+            logger.error(f"Errore SMB list_files: {e}")
+            return files, None
+        except Exception as e:
+            logger.error(f"Errore generico list_files: {e}")
+            return files, None
+
+    def list_files_paginated(self, path="\\", limit=1000, file_filter=None, cursor=None):
+        """Lista file con limite per performance e filtri"""
+        if cursor is not None:
+            return self.list_files_page(path, limit, file_filter, cursor)[0]
+        return [f for batch in self.iter_file_batches(path, limit, file_filter) for f in batch]
+
+    def list_directory(self, path="\\", share=None, directories_only=False):
+        """Voci di una directory (filename, is_directory, size, mtime, attributes) lette
+        in un'unica visita su una sessione del pool, senza passare dalla cache dei listing.
+
+        Con directories_only=True il server restituisce solo le sottocartelle. A differenza
+        di list_files_paginated gli errori SMB vengono propagati al chiamante.
+        """
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            raise ConnectionError("Non connesso o nessuna share selezionata")
+        search_path = self._search_path(path)
+        attributes = FIND_DIRECTORIES_ONLY if directories_only else FIND_SEARCH_ATTRIBUTES
+        return self._on_tree(share, lambda conn, tid: self._search(conn, tid, share, search_path, attributes),
+                             bulk=True)
+
+    def _listing_key(self, path, file_filter=None, share=None):
+        """Chiave della cache dei listing: (server, share, percorso normalizzato, filtro)"""
+        return (self.server_key, share or self.current_share, path.replace('/', '\\').strip('\\'), file_filter)
+
+    def invalidate_listing(self, path, share=None):
+        """Scarta dalla cache i listing della directory path"""
+        self.listing_cache.invalidate(*self._listing_key(path, share=share)[:3])
+
+    def _invalidate_parent(self, remote_path, share=None):
+        """Scarta il listing della directory che contiene remote_path"""
+        self.invalidate_listing(remote_path.replace('/', '\\').rstrip('\\').rsplit('\\', 1)[0], share)
+
+    def iter_file_batches(self, path="\\", limit=None, file_filter=None, batch_size=None, refresh=False):
+        """Genera liste di file filtrate, una per ogni risposta del server, fino a limit voci.
+
+        I listing letti per intero (o fino al limite) finiscono in listing_cache: una
+        nuova visita entro il ttl restituisce un unico blocco senza contattare il server.
+        Con refresh=True la cache di questa directory viene ignorata e sostituita.
+        """
+        if not self.is_connected or not self.current_share:
+            return
+        key = self._listing_key(path, file_filter)
+        if refresh:
+            self.invalidate_listing(path)
+        else:
+            cached = self.listing_cache.get(key, limit)
+            if cached is not None:
+                if cached:
+                    yield cached
+                return
+
+        if limit and not batch_size:
+            # Non chiedere al server molte più voci di quante ne servano
+            batch_size = max(16, min(self.find_batch_size, limit + 2))
+        cursor = ListingCursor(self.current_share, self._search_path(path))
+        entries = self.iter_files(path, cursor=cursor, batch_size=batch_size)
+        collected = []
+        batch = []
+        try:
+            for entry in entries:
+                if file_filter == "folders" and not entry['is_directory']:
+                    pass
+                elif file_filter == "files" and entry['is_directory']:
+                    pass
+                else:
+                    batch.append(entry)
+                    collected.append(entry)
+                    if limit and len(collected) >= limit:
+                        break
+                # Voci ricevute esaurite: la prossima richiede un round trip, consegna il blocco
+                if batch and not cursor.pending:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            logger.info(f"Letti {cursor.returned} elementi da {cursor.search_path}")
+            self.listing_cache.put(key, collected, cursor.finished)
+        except SMB_ERRORS as e:
+            logger.error(f"Errore SMB list_files: {e}")
+        except Exception as e:
+            logger.error(f"Errore generico list_files: {e}")
+        finally:
+            entries.close()
+            self.close_cursor(cursor)
+
+    def negotiated_read_size(self, conn=None):
+        """Dimensione massima di lettura negoziata col server (large read incluso)"""
+        conn = conn or self.conn
+        try:
+            max_read = conn.getIOCapabilities()['MaxReadSize']
+        except Exception:
+            max_read = 8192
+        max_read = min(max_read, 0xFFFF)
+        if self.read_block_size:
+            return max(1, min(self.read_block_size, max_read))
+        return max_read
+
+    def negotiated_write_size(self, conn=None):
+        """Dimensione massima di scrittura negoziata col server"""
+        conn = conn or self.conn
+        try:
+            max_write = conn.getIOCapabilities()['MaxWriteSize']
+        except Exception:
+            max_write = 4096
+        max_write = min(max_write, 0xFFFF)
+        if self.write_block_size:
+            return max(1, min(self.write_block_size, max_write))
+        return max_write
+
+    def _file_info(self, conn, tid, fid):
+        """(dimensione, LastWriteTime) di un file aperto"""
+        info_class = smb.SMB_QUERY_FILE_BASIC_INFO if conn.getDialect() == smb.SMB_DIALECT \
+            else smb3structs.SMB2_FILE_BASIC_INFO
+        basic = conn.queryInfo(tid, fid, fileInfoClass=info_class)
+        return self._file_size(conn, tid, fid), struct.unpack_from('<q', basic, 16)[0]
+
+    def _file_size(self, conn, tid, fid):
+        """Dimensione di un file aperto"""
+        return conn.queryInfo(tid, fid)['EndOfFile']
+
+    def _open_read(self, conn, tid, path):
+        """Apre un file in sola lettura: (fid, dimensione, LastWriteTime).
+
+        Su SMB1 dimensione e data arrivano nella risposta NT_CREATE_ANDX, senza query
+        successive: un round trip in meno per file, quello che conta sui file piccoli.
+        """
+        access = smb.FILE_READ_DATA | smb.FILE_READ_ATTRIBUTES
+        share_mode = smb.FILE_SHARE_READ | smb.FILE_SHARE_WRITE  # Il file può essere ancora in scrittura
+        if conn.getDialect() != smb.SMB_DIALECT:
+            fid = conn.openFile(tid, path, desiredAccess=access, shareMode=share_mode)
+            return (fid,) + self._file_info(conn, tid, fid)
+
+        server = conn.getSMBServer()
+        flags2 = server.get_flags()[1]
+        name = path.encode('utf-16le') if flags2 & smb.SMB.FLAGS2_UNICODE else path
+        nt_create = smb.SMBCommand(smb.SMB.SMB_COM_NT_CREATE_ANDX)
+        nt_create['Parameters'] = smb.SMBNtCreateAndX_Parameters()
+        nt_create['Parameters']['FileNameLength'] = len(name)
+        nt_create['Parameters']['CreateFlags'] = 0  # Niente oplock: non gestiamo le oplock break
+        nt_create['Parameters']['AccessMask'] = access
+        nt_create['Parameters']['ShareAccess'] = share_mode
+        nt_create['Parameters']['Disposition'] = smb.FILE_OPEN
+        nt_create['Parameters']['CreateOptions'] = smb.FILE_NON_DIRECTORY_FILE
+        nt_create['Parameters']['Impersonation'] = 2  # SecurityImpersonation
+        nt_create['Data'] = smb.SMBNtCreateAndX_Data(flags=flags2)
+        nt_create['Data']['FileName'] = name
+        if flags2 & smb.SMB.FLAGS2_UNICODE:
+            nt_create['Data']['Pad'] = 0x0
+        packet = smb.NewSMBPacket()
+        packet['Tid'] = tid
+        packet.addCommand(nt_create)
+        server.sendSMB(packet)
+        answer = server.recvSMB()
+        answer.isValidAnswer(smb.SMB.SMB_COM_NT_CREATE_ANDX)
+        params = smb.SMBNtCreateAndXResponse_Parameters(smb.SMBCommand(answer['Data'][0])['Parameters'])
+        return params['Fid'], params['EndOfFile'], params['LastWriteTime']
+
+    def _read_blocks(self, conn, tid, fid, file_size, block_size=None, queue_depth=None, start=0):
+        """Genera i dati del file da start in poi, in ordine, con più letture in volo su SMB1"""
+        block_size = block_size or self.negotiated_read_size(conn)
+        queue_depth = queue_depth or self.read_queue_depth
+
+        if conn.getDialect() == smb.SMB_DIALECT:
+            yield from SMB1ReadPipeline(conn.getSMBServer(), tid, fid, file_size, block_size, queue_depth, start)
+            return
+
+        # Dialetti successivi: letture sequenziali a blocchi grandi
+        offset = start
+        while offset < file_size:
+            data = conn.readFile(tid, fid, offset, min(block_size, file_size - offset))
+            if not data:
+                break
+            yield data
+            offset += len(data)
+
+    @staticmethod
+    def _preallocate(f, size):
+        """Porta il file a size byte riservando lo spazio su disco; False se il file system non lo consente.
+
+        Senza spazio riservato, un disco pieno durante la scrittura in una mappatura
+        terminerebbe il processo con SIGBUS invece di sollevare un errore.
+        """
+        f.truncate(size)
+        if not hasattr(os, 'posix_fallocate'):
+            return True  # Windows: estendere il file ne alloca già lo spazio
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return True
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            logger.debug(f"Preallocazione non supportata: {e}")
+            return False
+
+    def _receive_mapped(self, conn, tid, fid, part_path, file_size, offset, block_size, queue_depth, reporter,
+                        journal, state):
+        """Riceve un file SMB1 direttamente in una mappatura di part_path preallocato a file_size.
+
+        Ogni risposta READ_ANDX finisce al suo offset appena arriva, senza buffer di
+        riordino; il journal registra i byte contigui scritti. Restituisce quanti ne sono
+        stati scritti, None se il file system non supporta preallocazione o mmap.
+        """
+        with open(part_path, 'r+b' if offset else 'w+b') as f:
+            try:
+                if not self._preallocate(f, file_size):
+                    return None
+                mapping = mmap.mmap(f.fileno(), file_size)
+            except (ValueError, OverflowError) as e:
+                logger.debug(f"mmap non disponibile per {part_path}: {e}")
+                return None
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise
+                logger.debug(f"mmap non disponibile per {part_path}: {e}")
+                return None
+
+            done = offset
+            saved = time.monotonic()
+            view = memoryview(mapping)
+            pipeline = SMB1ReadPipeline(conn.getSMBServer(), tid, fid, file_size,
+                                        block_size or self.negotiated_read_size(conn),
+                                        queue_depth or self.read_queue_depth, offset)
+            blocks = pipeline.read_into(view)
+            try:
+                for done in blocks:
+                    reporter.update(done)
+                    if time.monotonic() - saved >= 5:
+                        self._save_journal(journal, dict(state, done=done))
+                        saved = time.monotonic()
+            finally:
+                blocks.close()
+                view.release()
+                mapping.close()
+                # Il file preallocato non dice quanto è stato scritto: lo dice il journal
+                self._save_journal(journal, dict(state, done=done))
+            if done < file_size:
+                f.truncate(done)  # Il file remoto si è accorciato durante la lettura
+        return done
+
+    def _block_writer(self, conn, tid, fid, queue_depth=None):
+        """Scrittore a blocchi: pipeline su SMB1, sequenziale altrimenti"""
+        if conn.getDialect() == smb.SMB_DIALECT:
+            return SMB1WritePipeline(conn.getSMBServer(), tid, fid, queue_depth or self.write_queue_depth)
+        return SequentialWriter(conn, tid, fid)
+
+    def _journal_path(self, direction, remote_path, local_path, directory=None, share=None):
+        """File di stato di un trasferimento, univoco per server, share e coppia di percorsi"""
+        key = f"{direction}|{self.server_key}|{share or self.current_share}|{remote_path}|{os.path.abspath(local_path)}"
+        return os.path.join(directory or self.resume_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    @staticmethod
+    def _load_journal(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_journal(path, state):
+        """Scrive lo stato in modo atomico; senza stato il trasferimento resta solo non riprendibile"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.debug(f"Stato di ripresa non salvato: {e}")
+
+    @staticmethod
+    def _drop_journal(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _with_retries(self, description, operation):
+        """Esegue operation ritentando dopo la perdita della sessione, con attesa esponenziale.
+
+        Gli errori SMB (file inesistente, accesso negato...) non vengono ritentati:
+        il server ha risposto e un nuovo tentativo avrebbe lo stesso esito.
+        """
+        for attempt in range(self.transfer_retries + 1):
+            try:
+                return operation()
+            except (TransferCancelled,) + SMB_ERRORS:
+                raise
+            except Exception as e:
+                if attempt == self.transfer_retries or not self.is_connected:
+                    raise
+                delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt)
+                logger.warning(f"{description}: {e} - nuovo tentativo tra {delay:.1f}s")
+                time.sleep(delay)
+
+    def download_file(self, remote_path, local_path, progress_callback=None, block_size=None, queue_depth=None,
+                      resume=True, preserve_mtime=False, share=None):
+        """Scarica un file dalla share corrente (o da share) con progresso.
+
+        I dati vanno in local_path + '.part', rinominato solo a download completo. Su SMB1
+        il .part viene preallocato e mappato in memoria: ogni risposta è copiata una sola
+        volta, al suo offset (con mmap_downloads=False, o se il file system non lo
+        consente, scrittura bufferizzata). Se la sessione cade, il download riparte
+        dall'ultimo byte scritto dopo un'attesa crescente. Un .part lasciato da un'esecuzione precedente viene ripreso se il file
+        remoto ha ancora la stessa dimensione e data di modifica (resume=False riparte da 0).
+        Con preserve_mtime il file locale prende la data di modifica di quello remoto.
+        progress_callback riceve un TransferProgress, al massimo 20 volte al secondo.
+        """
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return False
+        try:
+            remote_path = remote_path.replace('/', '\\')
+            if not remote_path.startswith('\\'):
+                remote_path = '\\' + remote_path
+            os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+            part_path = local_path + '.part'
+            journal = self._journal_path('get', remote_path, local_path, share=share)
+            check_journal = [resume]
+
+            def transfer(conn, tid):
+                # La dimensione serve per il progresso e per la finestra di letture
+                fid, file_size, mtime = self._open_read(conn, tid, remote_path)
+                try:
+                    offset = 0
+                    mapped = self.mmap_downloads and file_size > 0 and conn.getDialect() == smb.SMB_DIALECT
+                    state = self._load_journal(journal) if check_journal[0] else None
+                    if state and state.get('size') == file_size and state.get('mtime') == mtime \
+                            and os.path.exists(part_path):
+                        # Un .part ricevuto in mmap è già lungo quanto il file: vale 'done'
+                        offset = min(state.get('done', os.path.getsize(part_path)),
+                                     os.path.getsize(part_path), file_size)
+                        logger.info(f"Ripresa download {remote_path} da {offset} byte")
+                    state = {'remote': remote_path, 'size': file_size, 'mtime': mtime}
+                    if mapped:
+                        state['done'] = offset
+                    self._save_journal(journal, state)
+                    # I tentativi successivi ripartono comunque da quanto scritto
+                    check_journal[0] = True
+                    reporter = ProgressReporter(progress_callback, file_size, offset)
+
+                    if mapped:
+                        downloaded = self._receive_mapped(conn, tid, fid, part_path, file_size, offset, block_size,
+                                                          queue_depth, reporter, journal, state)
+                        if downloaded is not None:
+                            reporter.update(downloaded, final=True)
+                            return downloaded, mtime
+
+                    downloaded = offset
+                    with open(part_path, 'r+b' if offset else 'wb') as f:
+                        f.seek(offset)
+                        f.truncate()
+                        for data in self._read_blocks(conn, tid, fid, file_size, block_size, queue_depth, offset):
+                            f.write(data)
+                            downloaded += len(data)
+                            reporter.update(downloaded)
+                    reporter.update(downloaded, final=True)
+                    return downloaded, mtime
+                finally:
+                    conn.closeFile(tid, fid)
+
+            downloaded, mtime = self._with_retries(
+                f"Download {remote_path}",
+                lambda: self._on_tree(share, transfer, bulk=True))
+            if preserve_mtime and filetime_to_unix(mtime) is not None:
+                os.utime(part_path, (filetime_to_unix(mtime), filetime_to_unix(mtime)))
+            os.replace(part_path, local_path)
+            self._drop_journal(journal)
+            logger.info(f"File scaricato: {remote_path} -> {local_path} ({downloaded} byte)")
+            return True
+        except TransferCancelled as e:
+            logger.info(f"Download interrotto: {remote_path} ({e})")
+            return False
+        except Exception as e:
+            logger.error(f"Errore download_file: {e}")
+            return False
+
+    @staticmethod
+    def _remote_join(*parts):
+        """Percorso remoto assoluto dalle parti, con separatori normalizzati"""
+        parts = [p.replace('/', '\\').strip('\\') for p in parts]
+        return '\\' + '\\'.join(p for p in parts if p)
+
+    def _walk_remote(self, remote_root, errors=None, missing_ok=False):
+        """Visita in ampiezza l'albero remoto: genera (parti della directory relativa, voce).
+
+        Ogni cartella viene generata prima del suo contenuto. Le directory illeggibili
+        vengono registrate in errors e saltate; con missing_ok una radice inesistente
+        equivale a un albero vuoto.
+        """
+        pending = deque([()])
+        while pending:
+            rel = pending.popleft()
+            path = self._remote_join(remote_root, *rel)
+            try:
+                for entry in self.iter_files(path + '\\'):
+                    if entry['is_directory']:
+                        pending.append(rel + (entry['filename'],))
+                    yield rel, entry
+            except SMB_ERRORS as e:
+                if missing_ok and not rel and self._error_code(e) in NOT_FOUND_ERRORS:
+                    return
+                logger.error(f"Errore lettura directory {path}: {e}")
+                if errors is not None:
+                    errors.append(path)
+
+    def _search(self, conn, tid, share, search_path, attributes=FIND_SEARCH_ATTRIBUTES):
+        """Tutte le voci di una ricerca (search_path può contenere caratteri jolly); [] se nulla corrisponde"""
+        cursor = ListingCursor(share, search_path)
+        cursor.search_attributes = attributes
+        entries = []
+        try:
+            if conn.getDialect() != smb.SMB_DIALECT:
+                return list(self._iter_files_listpath(conn, cursor))
+            while not cursor.end_of_search:
+                for name, size, attribs, wtime in self._find_batch(conn, tid, cursor, self.find_batch_size):
+                    if name not in ('.', '..'):
+                        entries.append({
+                            'filename': name,
+                            'is_directory': bool(attribs & smb.ATTR_DIRECTORY),
+                            'size': size,
+                            'mtime': filetime_to_unix(wtime),
+                            'attributes': attribs
+                        })
+        except SMB_ERRORS as e:
+            # Nessuna corrispondenza, o cartella sparita durante la visita
+            if self._error_code(e) not in NOT_FOUND_ERRORS:
+                raise
+        finally:
+            if cursor.sid is not None:
+                try:
+                    self._find_close(conn, tid, cursor.sid)
+                except Exception as e:
+                    logger.debug(f"Errore chiusura ricerca: {e}")
+        return entries
+
+    @staticmethod
+    def _find_patterns(patterns):
+        """Lista di pattern da "*.cfg;*.ini" (anche con virgole) o da una lista"""
+        if isinstance(patterns, str):
+            patterns = patterns.replace(',', ';').split(';')
+        patterns = [p.strip() for p in patterns if p.strip()]
+        # Per SMB "*.*" vale anche per i nomi senza estensione
+        patterns = ['*' if p == '*.*' else p for p in patterns]
+        return ['*'] if not patterns or '*' in patterns else list(dict.fromkeys(patterns))
+
+    def find(self, path="\\", patterns="*", file_type="all", min_size=None, max_size=None, newer_than=None,
+             older_than=None, max_depth=None, workers=None, share=None):
+        """Cerca ricorsivamente sotto path le voci che corrispondono a patterns; le genera man mano.
+
+        I pattern (es. "*.cfg;*.ini") vanno nel percorso di FIND_FIRST2, così il server
+        restituisce solo i nomi corrispondenti; per scendere nelle sottocartelle basta
+        una seconda ricerca limitata alle directory. Le cartelle sono visitate da workers
+        thread (default pool_size - 1) su sessioni diverse del pool. Filtri: file_type
+        ("all", "files", "folders"), dimensione in byte (solo file) e data di modifica
+        (secondi Unix); max_depth 0 resta in path. Ogni voce ha anche 'path', il percorso
+        remoto completo. Le cartelle illeggibili sono registrate nel log e saltate;
+        chiudere il generatore ferma la ricerca.
+        """
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return
+        patterns = self._find_patterns(patterns)
+        match_all = patterns == ['*']
+        matchers = [p.lower() for p in patterns]
+
+        def wanted(entry):
+            if file_type == "folders" and not entry['is_directory']:
+                return False
+            if file_type == "files" and entry['is_directory']:
+                return False
+            if not match_all and not any(fnmatch.fnmatchcase(entry['filename'].lower(), p) for p in matchers):
+                return False  # Server che ignora il pattern
+            if not entry['is_directory']:
+                if min_size is not None and entry['size'] < min_size:
+                    return False
+                if max_size is not None and entry['size'] > max_size:
+                    return False
+            mtime = entry['mtime']
+            if newer_than is not None and (mtime is None or mtime < newer_than):
+                return False
+            if older_than is not None and (mtime is None or mtime > older_than):
+                return False
+            return True
+
+        def visit(conn, tid, directory, descend):
+            """(corrispondenze, sottocartelle) di una cartella"""
+            if match_all:
+                entries = self._search(conn, tid, share, self._search_path(directory))
+                return entries, [e for e in entries if e['is_directory']]
+            matches = []
+            for pattern in patterns:
+                matches += self._search(conn, tid, share, self._search_path(directory, pattern))
+            if not descend:
+                return matches, []
+            subdirs = self._search(conn, tid, share, self._search_path(directory), FIND_DIRECTORIES_ONLY)
+            return matches, [e for e in subdirs if e['is_directory']]
+
+        directories = Queue()  # (cartella, profondità)
+        results = Queue()
+        stop = threading.Event()
+
+        def worker():
+            while True:
+                item = directories.get()
+                try:
+                    if item is None:
+                        return
+                    if stop.is_set():
+                        continue
+                    directory, depth = item
+                    descend = max_depth is None or depth < max_depth
+                    try:
+                        matches, subdirs = self._on_tree(
+                            share, lambda conn, tid: visit(conn, tid, directory, descend), bulk=True)
+                    except Exception as e:
+                        logger.error(f"Errore ricerca in {directory}: {e}")
+                        continue
+                    for entry in matches:
+                        if wanted(entry):
+                            entry['path'] = self._remote_join(directory, entry['filename'])
+                            results.put(entry)
+                    if descend:
+                        for entry in subdirs:
+                            directories.put((self._remote_join(directory, entry['filename']), depth + 1))
+                finally:
+                    directories.task_done()
+
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(max(1, workers or self.pool_size - 1))]
+
+        def finish():
+            # Ogni sottocartella entra in coda prima che la sua cartella sia conclusa
+            directories.join()
+            for _ in threads:
+                directories.put(None)
+            results.put(None)
+
+        directories.put((self._remote_join(path), 0))
+        for thread in threads + [threading.Thread(target=finish, daemon=True)]:
+            thread.start()
+        try:
+            while True:
+                entry = results.get()
+                if entry is None:
+                    return
+                yield entry
+        finally:
+            stop.set()
+
+    def _unchanged(self, size, mtime, other_size, other_mtime):
+        """Vero se due file hanno la stessa dimensione e data di modifica, entro mtime_tolerance"""
+        if size != other_size or mtime is None or other_mtime is None:
+            return False
+        return abs(mtime - other_mtime) <= self.mtime_tolerance
+
+    def _transfer_pool(self, jobs, transfer, stats, workers=None, progress_callback=None):
+        """Esegue transfer(sorgente, destinazione) per ogni job con workers thread paralleli.
+
+        jobs viene consumato nel thread chiamante e può essere una visita ancora in
+        corso: i worker partono col primo job. transfer restituisce i byte trasferiti,
+        o None se il file è fallito. progress_callback riceve un TransferProgress con
+        file completati e file trovati finora.
+        """
+        queue = Queue()
+        reporter = ProgressReporter(progress_callback)
+        report_lock = threading.Lock()
+
+        def worker():
+            while True:
+                job = queue.get()
+                if job is None:
+                    return
+                # Un'eccezione non deve fermare il worker: i job rimasti in coda andrebbero persi
+                try:
+                    size = transfer(*job)
+                except Exception as e:
+                    logger.error(f"Errore trasferimento {job[0]}: {e}")
+                    size = None
+                if size is None:
+                    stats.add_failure(job[0])
+                else:
+                    stats.add_file(size)
+                try:
+                    with report_lock:
+                        reporter.update(stats.bytes, stats.files, stats.queued)
+                except Exception as e:
+                    logger.error(f"Errore callback di avanzamento: {e}")
+
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(max(1, workers or self.pool_size - 1))]
+        for thread in threads:
+            thread.start()
+        try:
+            for job in jobs:
+                queue.put(job)
+                stats.queued += 1
+        finally:
+            for _ in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+        reporter.update(stats.bytes, stats.files, stats.queued, final=True)
+
+    def download_directory(self, remote_path, local_dir, workers=None, progress_callback=None, sync=False,
+                           delete=False):
+        """Scarica ricorsivamente una directory remota dentro local_dir.
+
+        La visita accoda i file man mano che li trova e workers download paralleli
+        (default pool_size - 1, le sessioni disponibili per i trasferimenti) li
+        consumano subito, senza attendere la fine della visita. progress_callback
+        riceve un TransferProgress man mano che i file vengono completati. Restituisce il TransferStats, vero
+        se nessun file o directory è fallito.
+
+        Con sync i file locali con la stessa dimensione e data di modifica di quelli
+        remoti vengono saltati, e i file scaricati prendono la data remota, così la
+        sincronizzazione successiva li riconosce. Con delete vengono eliminati i file
+        e le cartelle locali assenti sul server, solo se tutto il resto è riuscito.
+        """
+        stats = TransferStats()
+        if not self.is_connected or not self.current_share:
+            stats.add_failure(remote_path)
+            return stats
+
+        root = remote_path.replace('/', '\\').strip('\\')
+        errors = []
+        seen = {os.path.abspath(local_dir)}  # Percorsi locali presenti anche sul server
+
+        def jobs():
+            os.makedirs(local_dir, exist_ok=True)
+            for rel, entry in self._walk_remote(root, errors):
+                local = os.path.join(local_dir, *rel, entry['filename'])
+                seen.add(os.path.abspath(local))
+                if entry['is_directory']:
+                    os.makedirs(local, exist_ok=True)
+                    stats.dirs += 1
+                    continue
+                if sync:
+                    try:
+                        st = os.stat(local)
+                        if self._unchanged(st.st_size, st.st_mtime, entry['size'], entry['mtime']):
+                            stats.skipped += 1
+                            continue
+                    except OSError:
+                        pass  # File nuovo
+                yield self._remote_join(root, *rel, entry['filename']), local
+
+        def transfer(remote, local):
+            return os.path.getsize(local) if self.download_file(remote, local, preserve_mtime=sync) else None
+
+        try:
+            self._transfer_pool(jobs(), transfer, stats, workers, progress_callback)
+        except Exception as e:
+            logger.error(f"Errore download_directory: {e}")
+            errors.append(remote_path)
+
+        for path in errors:
+            stats.add_failure(path)
+        if delete and stats:
+            self._delete_local_extras(local_dir, seen, stats)
+        stats.stop()
+        logger.info(f"Download {remote_path} -> {local_dir}: {stats.summary()}")
+        return stats
+
+    @staticmethod
+    def _delete_local_extras(local_dir, keep, stats):
+        """Elimina sotto local_dir i file e le cartelle non in keep (percorsi assoluti)"""
+        for current, dirs, names in os.walk(local_dir, topdown=False):
+            for name in names:
+                path = os.path.join(current, name)
+                if os.path.abspath(path) not in keep:
+                    try:
+                        os.remove(path)
+                        stats.deleted += 1
+                    except OSError as e:
+                        logger.error(f"Errore eliminazione {path}: {e}")
+                        stats.add_failure(path)
+            for name in dirs:
+                path = os.path.join(current, name)
+                if os.path.abspath(path) not in keep:
+                    try:
+                        os.rmdir(path)
+                        stats.deleted += 1
+                    except OSError as e:
+                        logger.error(f"Errore eliminazione {path}: {e}")
+                        stats.add_failure(path)
+
+    def _create_directories(self, conn, tid, share, paths):
+        """Crea più directory sulla TID: {percorso: True creata, False già presente, eccezione}"""
+        if conn.getDialect() == smb.SMB_DIALECT:
+            return SMB1DirectoryPipeline(conn.getSMBServer(), tid, self.write_queue_depth * 4).create(paths)
+        results = {}
+        for path in paths:
+            try:
+                conn.createDirectory(share, path)
+                results[path] = True
+            except smbconnection.SessionError as e:
+                results[path] = False if e.getErrorCode() in DIRECTORY_EXISTS_ERRORS else e
+        return results
+
+    def upload_directory(self, local_dir, remote_path, workers=None, progress_callback=None, sync=False,
+                         delete=False, delta=False):
+        """Carica ricorsivamente una directory locale in remote_path (creata se manca).
+
+        Prima crea lo scheletro delle cartelle remote in ampiezza: un livello alla volta,
+        con tutte le CREATE_DIRECTORY del livello in volo insieme, così costa un round
+        trip per livello e non per cartella. Le cartelle già presenti vengono saltate.
+        Poi carica i file con workers upload paralleli. Restituisce un TransferStats.
+
+        Con sync l'albero remoto viene letto prima: cartelle esistenti e file con la
+        stessa dimensione e data di modifica non vengono toccati, e i file caricati
+        prendono la data di modifica locale. Con delete vengono eliminati i file e le
+        cartelle remoti assenti in locale, solo se tutto il resto è riuscito. Con delta
+        i file vengono caricati come upload_file(delta=True).
+        """
+        stats = TransferStats()
+        if not self.is_connected or not self.current_share or not os.path.isdir(local_dir):
+            stats.add_failure(local_dir)
+            return stats
+
+        # Contenuto remoto attuale: percorso in minuscolo (SMB non distingue) -> (percorso, voce)
+        remote_index = {}
+        if sync or delete:
+            walk_errors = []
+            for rel, entry in self._walk_remote(remote_path, walk_errors, missing_ok=True):
+                path = self._remote_join(remote_path, *rel, entry['filename'])
+                remote_index[path.lower()] = (path, entry)
+            if walk_errors:
+                for path in walk_errors:
+                    stats.add_failure(path)
+                stats.stop()
+                return stats
+
+        root_parts = [p for p in remote_path.replace('/', '\\').split('\\') if p]
+        # Livello 0..n: la radice remota e i suoi antenati, poi le sottocartelle locali
+        levels = [[self._remote_join(*root_parts[:i + 1])] for i in range(len(root_parts))]
+        files = []
+        for current, dirs, names in os.walk(local_dir):
+            rel = os.path.relpath(current, local_dir)
+            parts = root_parts + ([] if rel == '.' else rel.split(os.sep))
+            while dirs and len(levels) <= len(parts):
+                levels.append([])
+            for name in dirs:
+                levels[len(parts)].append(self._remote_join(*parts, name))
+            for name in names:
+                files.append((os.path.join(current, name), self._remote_join(*parts, name)))
+        local_paths = {path.lower() for paths in levels for path in paths}
+        local_paths.update(remote.lower() for _, remote in files)
+
+        share = self.current_share
+        failed_dirs = set()
+        try:
+            for paths in levels:
+                # Le cartelle dentro una cartella non creata non vengono neanche tentate
+                todo = []
+                for path in paths:
+                    if path.lower() in remote_index:
+                        continue  # Già presente
+                    if path.rsplit('\\', 1)[0] in failed_dirs:
+                        failed_dirs.add(path)
+                    else:
+                        todo.append(path)
+                if not todo:
+                    continue
+                results = self._on_tree(share, lambda conn, tid: self._create_directories(conn, tid, share, todo))
+                for path, result in results.items():
+                    if result is True:
+                        stats.dirs += 1
+                        self._invalidate_parent(path)
+                    elif result is not False:
+                        logger.error(f"Errore creazione directory {path}: {result}")
+                        failed_dirs.add(path)
+                        stats.add_failure(path)
+        except Exception as e:
+            logger.error(f"Errore upload_directory: {e}")
+            stats.add_failure(remote_path)
+            stats.stop()
+            return stats
+
+        def jobs():
+            for local, remote in files:
+                if remote.rsplit('\\', 1)[0] in failed_dirs:
+                    stats.add_failure(local)
+                    continue
+                existing = remote_index.get(remote.lower())
+                if sync and existing and not existing[1]['is_directory']:
+                    st = os.stat(local)
+                    if self._unchanged(st.st_size, st.st_mtime, existing[1]['size'], existing[1]['mtime']):
+                        stats.skipped += 1
+                        continue
+                yield local, remote
+
+        def transfer(local, remote):
+            if self.upload_file(local, remote, preserve_mtime=sync, delta=delta):
+                return os.path.getsize(local)
+            return None
+
+        try:
+            self._transfer_pool(jobs(), transfer, stats, workers, progress_callback)
+        except Exception as e:
+            logger.error(f"Errore upload_directory: {e}")
+            stats.add_failure(local_dir)
+        if delete and stats:
+            extras = [value for key, value in remote_index.items() if key not in local_paths]
+            self._delete_remote(share, extras, stats)
+        stats.stop()
+        logger.info(f"Upload {local_dir} -> {remote_path}: {stats.summary()}")
+        return stats
+
+    def _delete_remote(self, share, entries, stats):
+        """Elimina i (percorso, voce) remoti: prima i file, poi le cartelle dalla più profonda"""
+        entries = sorted(entries, key=lambda item: (item[1]['is_directory'], -item[0].count('\\')))
+
+        def delete(conn, tid):
+            for path, entry in entries:
+                try:
+                    if entry['is_directory']:
+                        conn.deleteDirectory(share, path)
+                    else:
+                        conn.deleteFile(share, path)
+                    stats.deleted += 1
+                except SMB_ERRORS as e:
+                    logger.error(f"Errore eliminazione {path}: {e}")
+                    stats.add_failure(path)
+                self._invalidate_parent(path)
+
+        if entries:
+            try:
+                self._on_tree(share, delete)
+            except Exception as e:
+                logger.error(f"Errore eliminazione file remoti: {e}")
+                stats.add_failure(share)
+
+    def _set_write_time(self, conn, tid, fid, timestamp):
+        """Imposta la data di modifica di un file aperto; i campi a 0 restano invariati"""
+        info = smb.SMBSetFileBasicInfo()
+        info['CreationTime'] = 0
+        info['LastAccessTime'] = 0
+        info['LastWriteTime'] = unix_to_filetime(timestamp)
+        info['ChangeTime'] = 0
+        info['ExtFileAttributes'] = 0
+        if conn.getDialect() == smb.SMB_DIALECT:
+            conn.setInfo(tid, fid, smb.SMB_SET_FILE_BASIC_INFO, info)
+        else:
+            conn.setInfo(tid, fid, smb3structs.SMB2_FILE_BASIC_INFO, info.getData())
+
+    def _delta_upload(self, conn, tid, remote_path, local_path, stat, state, chunk_size, queue_depth,
+                      progress_callback):
+        """Riscrive sul server solo i blocchi cambiati dall'ultimo upload.
+
+        Restituisce (firme, byte inviati, data remota), o None se serve l'upload completo:
+
+        le firme salvate descrivono il file remoto solo se questo ha ancora la dimensione e
+        la data di modifica registrate allora, e il file locale non deve essersi accorciato
+        (non tutti i server troncano con SET_FILE_INFORMATION).
+        """
+        if not state or state.get('block_size') != self.delta_block_size:
+            return None
+        try:
+            fid = conn.openFile(tid, remote_path, desiredAccess=smb.FILE_READ_DATA | smb.FILE_WRITE_DATA |
+                                smb.FILE_READ_ATTRIBUTES | smb.FILE_WRITE_ATTRIBUTES,
+                                creationDisposition=smb.FILE_OPEN)
+        except SMB_ERRORS:
+            return None  # File remoto eliminato: upload completo
+        try:
+            remote_size, remote_mtime = self._file_info(conn, tid, fid)
+            if remote_size != state.get('size') or remote_mtime != state.get('mtime') or stat.st_size < remote_size:
+                logger.info(f"Firme non più valide per {remote_path}: upload completo")
+                return None
+
+            old = BlockSignatures.from_state(state)
+            new = BlockSignatures(self.delta_block_size)
+            writer = self._block_writer(conn, tid, fid, queue_depth)
+            reporter = ProgressReporter(progress_callback, stat.st_size)
+            offset = sent = 0
+            try:
+                with LocalFileSource(local_path, self.mmap_uploads) as source:
+                    for _, block in source.chunks(0, self.delta_block_size):
+                        digest = new.digest(block)
+                        if digest != old.get(len(new)):
+                            for start in range(0, len(block), chunk_size):
+                                writer.write(offset + start, block[start:start + chunk_size])
+                            sent += len(block)
+                        new.add(digest)
+                        offset += len(block)
+                        reporter.update(offset)
+                    writer.flush()  # Prima di chiudere la mappatura: i reinvii usano i suoi blocchi
+            except Exception:
+                writer.abort()
+                raise
+            reporter.update(offset, final=True)
+            self._set_write_time(conn, tid, fid, stat.st_mtime)
+            # La data va riletta: il server può arrotondarla
+            return new, sent, self._file_info(conn, tid, fid)[1]
+        finally:
+            conn.closeFile(tid, fid)
+
+    def _resume_offset(self, conn, tid, fid, local_path, local_size, check_bytes=4096):
+        """Byte già presenti sul server, se la coda del file remoto coincide col file locale; altrimenti 0"""
+        remote_size = self._file_size(conn, tid, fid)
+        if remote_size == 0 or remote_size > local_size:
+            return 0
+        start = max(0, remote_size - check_bytes)
+        remote_tail = b''.join(self._read_blocks(conn, tid, fid, remote_size, start=start))
+        with open(local_path, 'rb') as f:
+            f.seek(start)
+            local_tail = f.read(remote_size - start)
+        return remote_size if remote_tail == local_tail else 0
+
+    def upload_file(self, local_path, remote_path, progress_callback=None, block_size=None, queue_depth=None,
+                    resume=True, preserve_mtime=False, delta=False, share=None):
+        """Carica un file sulla share corrente (o su share) a blocchi, con progresso.
+
+        Se la sessione cade, l'upload riparte dopo un'attesa crescente dai byte già
+        presenti sul server. Lo stesso vale per un upload interrotto in un'esecuzione
+        precedente, se il file locale ha ancora dimensione e data di modifica di allora
+        e la coda del file remoto coincide con quella locale. Con preserve_mtime il file
+        remoto prende la data di modifica di quello locale.
+
+        Con delta viene salvato un indice di firme per blocco (delta_block_size) e negli
+        upload successivi dello stesso file si riscrivono solo i blocchi cambiati, se nel
+        frattempo nessun altro ha modificato il file remoto. I byte inviati e risparmiati
+        si accumulano in delta_stats. progress_callback riceve un TransferProgress, al
+        massimo 20 volte al secondo.
+        """
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return False
+        try:
+            remote_path = remote_path.replace('/', '\\')
+            if not remote_path.startswith('\\'):
+                remote_path = '\\' + remote_path
+
+            stat = os.stat(local_path)
+            file_size = stat.st_size
+            journal = self._journal_path('put', remote_path, local_path, share=share)
+            check_journal = [resume]
+            signature_path = self._journal_path('delta', remote_path, local_path, self.signature_dir, share)
+            preserve_mtime = preserve_mtime or delta  # Le firme valgono finché la data remota non cambia
+
+            def open_remote(conn, tid):
+                """(fid, offset di partenza): riapre il file parziale se riprendibile, altrimenti lo ricrea"""
+                state = self._load_journal(journal) if check_journal[0] else None
+                check_journal[0] = True
+                if state and state.get('size') == file_size and state.get('mtime') == stat.st_mtime_ns:
+                    try:
+                        fid = conn.openFile(tid, remote_path, desiredAccess=smb.FILE_READ_DATA | smb.FILE_WRITE_DATA |
+                                            smb.FILE_WRITE_ATTRIBUTES, creationDisposition=smb.FILE_OPEN)
+                    except SMB_ERRORS:
+                        fid = None  # Il file parziale non esiste più
+                    if fid is not None:
+                        offset = self._resume_offset(conn, tid, fid, local_path, file_size)
+                        if offset:
+                            logger.info(f"Ripresa upload {remote_path} da {offset} byte")
+                            return fid, offset
+                        conn.closeFile(tid, fid)
+                self._save_journal(journal, {'local': os.path.abspath(local_path), 'size': file_size,
+                                             'mtime': stat.st_mtime_ns})
+                # Crea il file remoto
+                return conn.createFile(tid, remote_path), 0
+
+            def transfer(conn, tid):
+                chunk_size = block_size or self.negotiated_write_size(conn)
+                if delta:
+                    result = self._delta_upload(conn, tid, remote_path, local_path, stat,
+                                                self._load_journal(signature_path), chunk_size, queue_depth,
+                                                progress_callback)
+                    if result is not None:
+                        return result
+                fid, start = open_remote(conn, tid)
+                try:
+                    writer = self._block_writer(conn, tid, fid, queue_depth)
+                    signatures = BlockSignatures(self.delta_block_size) if delta else None
+                    reporter = ProgressReporter(progress_callback, file_size, start)
+
+                    # Invia il file locale a blocchi
+                    try:
+                        with LocalFileSource(local_path, self.mmap_uploads) as source:
+                            if signatures is not None:
+                                for _, data in source.chunks(0, chunk_size, start):
+                                    signatures.update(data)
+                            for offset, data in source.chunks(start, chunk_size):
+                                writer.write(offset, data)
+                                if signatures is not None:
+                                    signatures.update(data)
+
+                                # Progresso sui byte confermati dal server
+                                reporter.update(start + writer.acked)
+                            writer.flush()  # Prima di chiudere la mappatura: i reinvii usano i suoi blocchi
+                    except Exception:
+                        writer.abort()
+                        raise
+                    if preserve_mtime:
+                        try:
+                            self._set_write_time(conn, tid, fid, stat.st_mtime)
+                        except SMB_ERRORS as e:
+                            logger.warning(f"Data di modifica non impostata su {remote_path}: {e}")
+
+                    reporter.update(start + writer.acked, final=True)
+                    if signatures is not None:
+                        return signatures.finish(), start + writer.acked, self._file_info(conn, tid, fid)[1]
+                    return start + writer.acked
+                finally:
+                    # Chiudi il file
+                    conn.closeFile(tid, fid)
+
+            try:
+                uploaded = self._with_retries(
+                    f"Upload {remote_path}",
+                    lambda: self._on_tree(share, transfer, bulk=True))
+            finally:
+                # Anche un upload interrotto può aver creato il file
+                self._invalidate_parent(remote_path, share)
+            self._drop_journal(journal)
+            if delta:
+                signatures, uploaded, remote_mtime = uploaded
+                self._save_journal(signature_path, dict(signatures.to_state(), size=file_size, mtime=remote_mtime))
+                with self._pool_cond:
+                    self.delta_stats['sent'] += uploaded
+                    self.delta_stats['saved'] += file_size - uploaded
+                logger.info(f"File caricato (delta): {local_path} -> {remote_path} - {uploaded} byte inviati, "
+                            f"{file_size - uploaded} risparmiati")
+                return True
+            logger.info(f"File caricato: {local_path} -> {remote_path} ({uploaded} byte)")
+            return True
+        except TransferCancelled as e:
+            logger.info(f"Upload interrotto: {local_path} ({e})")
+            return False
+        except Exception as e:
+            logger.error(f"Errore upload_file: {e}")
+            return False
+
+    def _create_directory(self, conn, tid, share, path):
+        """Crea una directory sulla TID già connessa (SMB_COM_CREATE_DIRECTORY su SMB1)"""
+        if conn.getDialect() != smb.SMB_DIALECT:
+            conn.createDirectory(share, path)
+            return
+        server = conn.getSMBServer()
+        flags2 = server.get_flags()[1]
+        packet = smb.NewSMBPacket()
+        packet['Tid'] = tid
+        create_dir = smb.SMBCommand(smb.SMB.SMB_COM_CREATE_DIRECTORY)
+        create_dir['Data'] = smb.SMBCreateDirectory_Data(flags=flags2)
+        create_dir['Data']['DirectoryName'] = path.encode('utf-16le') if flags2 & smb.SMB.FLAGS2_UNICODE else path
+        packet.addCommand(create_dir)
+        server.sendSMB(packet)
+        server.recvSMB().isValidAnswer(smb.SMB.SMB_COM_CREATE_DIRECTORY)
+
+    def create_directory(self, path):
+        """Crea una nuova directory"""
+        if not self.is_connected or not self.current_share:
+            return False
+        try:
+            path = path.replace('/', '\\')
+            if not path.startswith('\\'):
+                path = '\\' + path
+
+            share = self.current_share
+            self._on_tree(share, lambda conn, tid: self._create_directory(conn, tid, share, path))
+            self._invalidate_parent(path)
+
+            logger.info(f"Directory creata: {path}")
+            return True
+        except Exception as e:
+            logger.error(f"Errore create_directory: {e}")
+            return False
+
+    def delete_file(self, path, share=None):
+        """Elimina un file dalla share corrente (o da share)"""
+        share = share or self.current_share
+        if not self.is_connected or not share:
+            return False
+        try:
+            path = self._remote_join(path)
+            self._on_tree(share, lambda conn, tid: conn.deleteFile(share, path))
+            self._invalidate_parent(path, share)
+            logger.info(f"File eliminato: {path}")
+            return True
+        except Exception as e:
+            logger.error(f"Errore delete_file: {e}")
+            return False
+
+    def disconnect(self):
+        """Disconnette in modo sicuro"""
+        with self._pool_cond:
+            idle, self._idle = self._idle, []
+            self._sessions = []
+            self.is_connected = False
+            self.current_share = None
+            self._pool_cond.notify_all()
+
+        if self.conn:
+            try:
+                stats = self.tree_stats
+                logger.info(f"Tree connect: {stats['connects']} eseguiti, {stats['reused']} risparmiati, "
+                            f"{stats['reconnects']} riconnessioni")
+                if self.delta_stats['sent'] or self.delta_stats['saved']:
+                    logger.info(f"Upload delta: {self.delta_stats['sent']} byte inviati, "
+                                f"{self.delta_stats['saved']} risparmiati")
+                cache = self.listing_cache.stats
+                logger.info(f"Cache listing: {cache['hits']} hit, {cache['misses']} miss, "
+                            f"{cache['evictions']} eliminati, {cache['invalidations']} invalidati")
+                self.listing_cache.clear()
+                # Le sessioni in uso vengono chiuse al rilascio
+                for session in idle:
+                    session.close()
+                logger.info("Disconnessione effettuata")
+            except Exception as e:
+                logger.error(f"Errore durante la disconnessione: {e}")
+            finally:
+                self.conn = None
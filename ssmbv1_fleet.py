@@ -0,0 +1,257 @@
+"""Esegue la stessa operazione su molti server SMBv1 insieme, da un file di inventario.
+
+L'inventario è un CSV con intestazione: colonne ip e name obbligatorie, poi
+user, password, domain, port, share, path facoltative (vuote = valori della riga
+di comando). I risultati escono su stdout come JSON lines, uno per host, man mano
+che gli host finiscono; i log vanno su stderr.
+
+Esempi:
+    python ssmbv1_fleet.py inventario.csv shares
+    python ssmbv1_fleet.py inventario.csv --share CONFIG ls \\etc
+    python ssmbv1_fleet.py inventario.csv --share CONFIG get \\etc\\device.cfg -o "configs/{name}/{file}"
+    python ssmbv1_fleet.py inventario.csv --concurrency 64 --host-timeout 30 put ./firmware.bin \\update\\
+
+Codici di uscita: 0 tutti gli host riusciti, 1 almeno un host fallito, 2 argomenti non validi.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('SMBClient')
+
+
+class FleetHost:
+    """Una riga dell'inventario"""
+
+    def __init__(self, ip, name, user='', password='', domain='', port=139, share=None, path=None):
+        self.ip = ip
+        self.name = name
+        self.user = user
+        self.password = password
+        self.domain = domain
+        self.port = port
+        self.share = share
+        self.path = path
+
+
+def load_inventory(path, defaults=None):
+    """FleetHost dal CSV; i campi vuoti prendono i valori di defaults"""
+    defaults = defaults or {}
+    hosts = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            if not row.get('ip') or row['ip'].startswith('#'):
+                continue
+            if not row.get('name'):
+                raise ValueError(f"Riga {line}: manca il nome NetBIOS di {row['ip']}")
+            values = dict(defaults)
+            values.update({key: value for key, value in row.items() if value and key in
+                           ('user', 'password', 'domain', 'port', 'share', 'path')})
+            try:
+                values['port'] = int(values.get('port') or 139)
+            except ValueError:
+                raise ValueError(f"Riga {line}: porta non valida: {values['port']}") from None
+            hosts.append(FleetHost(row['ip'], row['name'], **values))
+    return hosts
+
+
+# --- Operazioni: coroutine (client, host, args) -> risultato serializzabile in JSON ---
+async def op_shares(client, host, args):
+    shares = await client.list_shares()
+    if not shares:
+        raise IOError("Nessuna share trovata")
+    return shares
+
+
+async def op_ls(client, host, args):
+    files = []
+    entries = client.iter_files(host.path or "\\")
+    try:
+        async for entry in entries:
+            files.append(entry)
+            if args.limit and len(files) >= args.limit:
+                break
+    finally:
+        await entries.aclose()
+    files.sort(key=lambda f: (not f['is_directory'], f['filename'].lower()))
+    return files
+
+
+def output_path(host, args):
+    """Percorso locale del file scaricato da host secondo il modello args.output"""
+    file_name = os.path.basename((host.path or "").replace('\\', '/'))
+    return args.output.format(ip=host.ip, port=host.port, name=host.name, share=host.share, file=file_name)
+
+
+async def op_get(client, host, args):
+    if not host.path:
+        raise ValueError("Percorso remoto mancante")
+    local_path = output_path(host, args)
+    if not await client.download_file(host.path, local_path):
+        raise IOError(client.last_error or "Download fallito")
+    return {'remote': host.path, 'local': local_path, 'bytes': os.path.getsize(local_path)}
+
+
+async def op_put(client, host, args):
+    remote_path = host.path or os.path.basename(args.local)
+    if remote_path.endswith(('\\', '/')):
+        remote_path += os.path.basename(args.local)
+    if not await client.upload_file(args.local, remote_path):
+        raise IOError(client.last_error or "Upload fallito")
+    return {'local': args.local, 'remote': remote_path, 'bytes': os.path.getsize(args.local)}
+
+
+OPERATIONS = {
+    'shares': op_shares,
+    'ls': op_ls,
+    'get': op_get,
+    'put': op_put,
+}
+
+
+async def run_host(host, operation, args):
+    """Connette ed esegue operation entro args.host_timeout secondi, poi disconnette: un record per l'host"""
+    from ssmbv1_async import AsyncSMBv1Client
+
+    client = AsyncSMBv1Client()
+    client.timeout = args.timeout
+
+    async def run():
+        if not await client.connect(host.name, host.ip, host.user, host.password, host.domain, host.port):
+            raise ConnectionError(client.last_error or "Connessione fallita")
+        if operation is not op_shares:
+            if not host.share:
+                raise ValueError("Share mancante")
+            if not await client.select_share(host.share):
+                raise IOError(client.last_error or f"Share {host.share} non accessibile")
+        return await operation(client, host, args)
+
+    record = {'ip': host.ip, 'name': host.name, 'command': args.command}
+    start = time.monotonic()
+    try:
+        record['result'] = await asyncio.wait_for(run(), args.host_timeout)
+        record['ok'] = True
+    except asyncio.TimeoutError:
+        record.update(ok=False, error=f"Timeout dopo {args.host_timeout}s")
+    except Exception as e:
+        record.update(ok=False, error=str(e) or type(e).__name__)
+    finally:
+        try:
+            await asyncio.wait_for(client.disconnect(), min(args.timeout, 5))
+        except Exception as e:
+            logger.debug(f"Errore disconnessione {host.ip}: {e}")
+    record['elapsed'] = round(time.monotonic() - start, 3)
+    return record
+
+
+async def run_fleet(hosts, operation, args, output=None):
+    """Esegue operation su tutti gli host, al massimo args.concurrency insieme.
+
+    Scrive una riga JSON per host su output appena l'host finisce; restituisce
+    (riusciti, falliti).
+    """
+    output = output or sys.stdout
+    # I login passano da impacket nei thread dell'executor: ne servono quanti gli host in parallelo
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    asyncio.get_running_loop().set_default_executor(executor)
+    slots = asyncio.Semaphore(args.concurrency)
+    counts = {True: 0, False: 0}
+
+    async def limited(host):
+        async with slots:
+            record = await run_host(host, operation, args)
+        counts[record['ok']] += 1
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+
+    try:
+        await asyncio.gather(*(limited(host) for host in hosts))
+    finally:
+        executor.shutdown(wait=False)  # Login scaduti ancora in corso: terminano da soli
+    return counts[True], counts[False]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Operazioni SMBv1 su molti server insieme")
+    parser.add_argument('inventory', help="CSV con colonne ip,name[,user,password,domain,port,share,path]")
+    parser.add_argument('--user', default='', help="Utente per le righe senza (vuoto = connessione anonima)")
+    parser.add_argument('--password', default=os.environ.get('SMB_PASSWORD', ''))
+    parser.add_argument('--domain', default='')
+    parser.add_argument('--port', type=int, default=139)
+    parser.add_argument('--share', help="Share per le righe senza")
+    parser.add_argument('--concurrency', type=int, default=32, help="Host elaborati insieme (default: 32)")
+    parser.add_argument('--host-timeout', type=float, default=120,
+                        help="Secondi massimi per host, connessione inclusa (default: 120)")
+    parser.add_argument('--timeout', type=float, default=30, help="Timeout delle singole richieste in secondi")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="-v info, -vv debug")
+
+    commands = parser.add_subparsers(dest='command', metavar='comando')
+    commands.required = True
+    commands.add_parser('shares', help="Elenca le share di ogni host")
+
+    ls = commands.add_parser('ls', help="Elenca una directory su ogni host")
+    ls.add_argument('path', nargs='?', help="Directory remota (default: colonna path, poi la root)")
+    ls.add_argument('--limit', type=int, default=0, help="Numero massimo di voci per host (0 = nessun limite)")
+
+    get = commands.add_parser('get', help="Scarica lo stesso file da ogni host")
+    get.add_argument('remote', nargs='?', help="File remoto (default: colonna path)")
+    get.add_argument('-o', '--output', default="{ip}_{port}/{share}/{file}",
+                     help="Percorso locale con {ip}, {port}, {name}, {share}, {file} "
+                          "(default: {ip}_{port}/{share}/{file})")
+
+    put = commands.add_parser('put', help="Carica lo stesso file su ogni host")
+    put.add_argument('local')
+    put.add_argument('remote', nargs='?', help="Percorso remoto (default: colonna path, poi il nome del file)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency deve essere almeno 1")
+    if args.command == 'put' and not os.path.isfile(args.local):
+        parser.error(f"File locale non trovato: {args.local}")
+
+    level = logging.WARNING if not args.verbose else logging.INFO if args.verbose == 1 else logging.DEBUG
+    logging.basicConfig(level=level, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    defaults = {'user': args.user, 'password': args.password, 'domain': args.domain, 'port': args.port,
+                'share': args.share}
+    try:
+        hosts = load_inventory(args.inventory, defaults)
+    except (OSError, ValueError) as e:
+        parser.error(f"Inventario non valido: {e}")
+    # Il percorso sulla riga di comando vale per tutti gli host
+    path = getattr(args, 'path', None) or getattr(args, 'remote', None)
+    for host in hosts:
+        host.path = path or host.path
+    if args.command == 'get':
+        # Due host che scrivono sullo stesso file si sovrascriverebbero a vicenda
+        seen = {}
+        for host in hosts:
+            try:
+                local_path = os.path.normpath(output_path(host, args))
+            except (KeyError, IndexError, ValueError) as e:
+                parser.error(f"Modello -o non valido: {e}")
+            if local_path in seen:
+                parser.error(f"{seen[local_path]} e {host.name} scriverebbero entrambi su {local_path}: "
+                             f"aggiungere a -o {{ip}}, {{port}}, {{share}} o {{name}}")
+            seen[local_path] = host.name
+
+    start = time.monotonic()
+    ok, failed = asyncio.run(run_fleet(hosts, OPERATIONS[args.command], args))
+    print(f"{len(hosts)} host in {time.monotonic() - start:.1f}s: {ok} riusciti, {failed} falliti", file=sys.stderr)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
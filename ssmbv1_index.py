@@ -0,0 +1,347 @@
+"""Indice locale dei metadati delle share remote, per cercare anche quando il server è lento o spento.
+
+MetadataIndex salva in SQLite percorso, dimensione, data di modifica e attributi
+di ogni voce, per server e share. IndexCrawler lo riempie in un thread in
+background e lo aggiorna in modo incrementale: una cartella con la stessa data di
+modifica dell'ultima lettura non viene rielencata, basta una ricerca delle sole
+sottocartelle per scendere. Ogni voce ricorda quando è stata letta (indexed_at).
+
+Esempio:
+    index = MetadataIndex()
+    IndexCrawler(client, index).start()
+    for entry in index.search("*.cfg"):
+        print(entry['server'], entry['share'], entry['path'], entry['indexed_at'])
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from queue import Queue
+
+logger = logging.getLogger('SMBClient')
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'ssmbv1', 'index.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shares (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL,
+    share TEXT NOT NULL,
+    crawl_started REAL,
+    crawl_finished REAL,
+    UNIQUE (server, share)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    share_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    parent TEXT,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_directory INTEGER NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    attributes INTEGER,
+    listed_mtime REAL,
+    indexed_at REAL NOT NULL,
+    UNIQUE (share_id, key)
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (share_id, parent);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name);
+"""
+# key, parent e name sono in minuscolo (SMB non distingue maiuscole e minuscole);
+# listed_mtime è la data di modifica della cartella quando è stata elencata l'ultima volta.
+# Tabella con rowid: la ricerca per sottostringa scorre la tabella in ordine, molto più
+# veloce che saltare da un indice all'altro; i pattern con un prefisso usano entries_name
+
+
+def normalize_path(path):
+    """Percorso remoto nella forma \\cartella\\file, root = \\"""
+    path = (path or "").replace('/', '\\').strip('\\')
+    return "\\" + path
+
+
+def _parent(path):
+    return normalize_path(path.rsplit('\\', 1)[0]) if path != "\\" else None
+
+
+def _subtree_range(key):
+    """Limiti (inclusivo, esclusivo) delle chiavi sotto la cartella key: ']' segue '\\'"""
+    prefix = key.rstrip('\\')
+    return prefix + '\\', prefix + ']'
+
+
+class MetadataIndex:
+    """Indice SQLite delle voci remote; utilizzabile da più thread insieme"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()  # Una scrittura alla volta
+        with self._lock, self._db() as db:
+            db.executescript(SCHEMA)
+
+    def _db(self):
+        """Connessione del thread corrente: in WAL le letture non aspettano le scritture del crawler"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._connections.append(db)
+        return db
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            try:
+                db.close()
+            except sqlite3.Error as e:
+                logger.debug(f"Errore chiusura indice: {e}")
+        self._local = threading.local()
+
+    def share_id(self, server, share):
+        """Id della share nell'indice, creata se manca"""
+        with self._lock, self._db() as db:
+            db.execute("INSERT OR IGNORE INTO shares (server, share) VALUES (?, ?)", (server, share))
+            return db.execute("SELECT id FROM shares WHERE server = ? AND share = ?", (server, share)).fetchone()[0]
+
+    def begin_crawl(self, share_id):
+        with self._lock, self._db() as db:
+            db.execute("UPDATE shares SET crawl_started = ? WHERE id = ?", (time.time(), share_id))
+
+    def end_crawl(self, share_id):
+        """Registra una scansione completa della share"""
+        with self._lock, self._db() as db:
+            db.execute("UPDATE shares SET crawl_finished = ? WHERE id = ?", (time.time(), share_id))
+
+    def listed_state(self, share_id, directory):
+        """(data di modifica della cartella all'ultima lettura, istante della lettura); (None, None) se mai elencata"""
+        row = self._db().execute("SELECT listed_mtime, indexed_at FROM entries WHERE share_id = ? AND key = ?",
+                                 (share_id, normalize_path(directory).lower())).fetchone()
+        return tuple(row) if row and row[0] is not None else (None, None)
+
+    def replace_directory(self, share_id, directory, mtime, entries):
+        """Sostituisce il contenuto indicizzato della cartella con entries (voci di un listing completo).
+
+        Le voci sparite vengono eliminate con tutto il loro sottoalbero; mtime è la
+        data di modifica della cartella letta dal listing del padre (None se ignota).
+        """
+        now = time.time()
+        directory = normalize_path(directory)
+        parent_key = directory.lower()
+        rows = {}
+        for entry in entries:
+            path = normalize_path(directory + "\\" + entry['filename'])
+            key = path.lower()
+            rows[key] = (share_id, key, parent_key, path, entry['filename'].lower(), int(entry['is_directory']),
+                         entry['size'], entry['mtime'], entry.get('attributes'), now)
+
+        with self._lock, self._db() as db:
+            old = dict(db.execute("SELECT key, is_directory FROM entries WHERE share_id = ? AND parent = ?",
+                                  (share_id, parent_key)))
+            for key, was_directory in old.items():
+                if key in rows and (rows[key][5] or not was_directory):
+                    continue
+                if key not in rows:
+                    db.execute("DELETE FROM entries WHERE share_id = ? AND key = ?", (share_id, key))
+                if was_directory:
+                    db.execute("DELETE FROM entries WHERE share_id = ? AND key >= ? AND key < ?",
+                               (share_id, *_subtree_range(key)))
+            db.executemany(
+                "INSERT INTO entries (share_id, key, parent, path, name, is_directory, size, mtime, attributes, "
+                "indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (share_id, key) DO UPDATE SET "
+                "path = excluded.path, is_directory = excluded.is_directory, size = excluded.size, "
+                "mtime = excluded.mtime, attributes = excluded.attributes, indexed_at = excluded.indexed_at",
+                rows.values())
+            db.execute(
+                "INSERT INTO entries (share_id, key, parent, path, name, is_directory, size, mtime, listed_mtime, "
+                "indexed_at) VALUES (?, ?, ?, ?, ?, 1, 0, ?, ?, ?) ON CONFLICT (share_id, key) DO UPDATE SET "
+                "listed_mtime = excluded.listed_mtime, indexed_at = excluded.indexed_at, "
+                "mtime = coalesce(excluded.mtime, entries.mtime)",
+                (share_id, parent_key, (_parent(directory) or '').lower() or None, directory,
+                 directory.rsplit('\\', 1)[-1].lower(), mtime, mtime, now))
+
+    def search(self, text, server=None, share=None, path=None, file_type="all", limit=1000):
+        """Voci indicizzate il cui nome contiene text, o corrisponde se text ha * o ?.
+
+        Con un \\ in text si cerca nel percorso completo invece che nel nome. Non
+        distingue maiuscole e minuscole; path limita la ricerca a un sottoalbero.
+        Oltre limit voci si ottiene un sottoinsieme qualsiasi, ordinato per percorso.
+        Ogni voce ha server, share, path, filename, is_directory, size, mtime,
+        attributes e indexed_at (secondi Unix della lettura dal server).
+        """
+        text = text.lower()
+        column = "e.key" if '\\' in text else "e.name"
+        if '*' in text or '?' in text:
+            where, params = [f"{column} GLOB ?"], [text]
+        else:
+            where, params = [f"instr({column}, ?) > 0"], [text]
+        if server:
+            where.append("s.server = ?")
+            params.append(server)
+        if share:
+            where.append("s.share = ? COLLATE NOCASE")
+            params.append(share)
+        if path and normalize_path(path) != "\\":
+            where.append("e.key >= ? AND e.key < ?")
+            params += _subtree_range(normalize_path(path).lower())
+        if file_type == "files":
+            where.append("e.is_directory = 0")
+        elif file_type == "folders":
+            where.append("e.is_directory = 1")
+        where.append("e.key != '\\'")
+        sql = (f"SELECT s.server, s.share, e.path, e.is_directory, e.size, e.mtime, e.attributes, e.indexed_at "
+               f"FROM entries e JOIN shares s ON s.id = e.share_id WHERE {' AND '.join(where)}")
+        if limit:
+            sql += f" LIMIT {int(limit)}"  # Senza ORDER BY la scansione si ferma alla voce numero limit
+        entries = [{
+            'server': row[0],
+            'share': row[1],
+            'path': row[2],
+            'filename': row[2].rsplit('\\', 1)[-1],
+            'is_directory': bool(row[3]),
+            'size': row[4],
+            'mtime': row[5],
+            'attributes': row[6],
+            'indexed_at': row[7]
+        } for row in self._db().execute(sql, params)]
+        entries.sort(key=lambda e: (e['server'], e['share'], e['path'].lower()))
+        return entries
+
+    def status(self, server=None, share=None):
+        """Stato delle share indicizzate: voci, ultima scansione completa, letture più vecchia e più recente"""
+        where, params = [], []
+        if server:
+            where.append("s.server = ?")
+            params.append(server)
+        if share:
+            where.append("s.share = ? COLLATE NOCASE")
+            params.append(share)
+        sql = ("SELECT s.server, s.share, s.crawl_started, s.crawl_finished, count(e.key), "
+               "min(e.indexed_at), max(e.indexed_at) FROM shares s LEFT JOIN entries e ON e.share_id = s.id "
+               f"{'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY s.id ORDER BY s.server, s.share")
+        return [{
+            'server': row[0],
+            'share': row[1],
+            'crawl_started': row[2],
+            'crawl_finished': row[3],
+            'entries': max(0, row[4] - 1),  # Senza la root
+            'oldest': row[5],
+            'newest': row[6]
+        } for row in self._db().execute(sql, params)]
+
+
+class IndexCrawler:
+    """Visita una share e aggiorna il MetadataIndex, in un thread in background o con run().
+
+    Una cartella viene rielencata solo se la sua data di modifica è cambiata
+    dall'ultima lettura (o con full=True): creare, eliminare o rinominare voci
+    cambia la data della cartella, modificare un file che contiene no, quindi
+    dimensione e data dei file di cartelle invariate si aggiornano solo con full.
+    Le date hanno risoluzione di 1-2 s: una cartella modificata a meno di
+    client.mtime_tolerance secondi dalla lettura viene comunque rielencata.
+    """
+
+    def __init__(self, client, index, share=None, workers=None, full=False):
+        self.client = client
+        self.index = index
+        self.share = share or client.current_share
+        self.workers = max(1, workers or client.pool_size - 1)
+        self.full = full
+        self.stats = {'listed': 0, 'unchanged': 0, 'entries': 0, 'errors': 0}
+        self.complete = False
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Avvia la visita in un thread in background"""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Ferma la visita alla fine delle cartelle in corso; l'indice resta coerente"""
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Attende la fine della visita in background; True se è finita"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    def _add(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _visit(self, share_id, directory, mtime):
+        """Aggiorna una cartella nell'indice: (percorso, data di modifica) delle sottocartelle"""
+        client = self.client
+        listed_mtime, listed_at = self.index.listed_state(share_id, directory)
+        if not self.full and mtime is not None and listed_mtime == mtime and \
+                listed_at - mtime > client.mtime_tolerance:
+            # Contenuto invariato: servono solo le sottocartelle, con le loro date attuali
+            entries = client.list_directory(directory, self.share, directories_only=True)
+            self._add('unchanged')
+        else:
+            entries = client.list_directory(directory, self.share)
+            self.index.replace_directory(share_id, directory, mtime, entries)
+            self._add('listed')
+            self._add('entries', len(entries))
+        return [(normalize_path(directory + "\\" + e['filename']), e['mtime']) for e in entries if e['is_directory']]
+
+    def run(self):
+        """Visita la share; True se è stata indicizzata tutta senza errori"""
+        if not self.client.is_connected or not self.share:
+            logger.error("Indicizzazione: nessuna share selezionata")
+            return False
+        share_id = self.index.share_id(self.client.server_key, self.share)
+        self.index.begin_crawl(share_id)
+        start = time.monotonic()
+        directories = Queue()  # (cartella, data di modifica dal listing del padre)
+
+        def worker():
+            while True:
+                item = directories.get()
+                try:
+                    if item is None:
+                        return
+                    if self._stop.is_set():
+                        continue
+                    directory, mtime = item
+                    try:
+                        for subdir in self._visit(share_id, directory, mtime):
+                            directories.put(subdir)
+                    except Exception as e:
+                        logger.error(f"Errore indicizzazione di {directory}: {e}")
+                        self._add('errors')
+                finally:
+                    directories.task_done()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        directories.put(("\\", None))
+        for thread in threads:
+            thread.start()
+        directories.join()
+        for _ in threads:
+            directories.put(None)
+        for thread in threads:
+            thread.join()
+
+        self.complete = not self._stop.is_set() and not self.stats['errors']
+        if self.complete:
+            self.index.end_crawl(share_id)
+        logger.info(f"Indice {self.client.server_key}/{self.share}: {self.stats['listed']} cartelle lette, "
+                    f"{self.stats['unchanged']} invariate, {self.stats['errors']} errori "
+                    f"in {time.monotonic() - start:.1f}s")
+        return self.complete
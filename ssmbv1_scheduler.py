@@ -0,0 +1,292 @@
+"""Coda dei trasferimenti: priorità, limiti di concorrenza, pausa e annullamento.
+
+Il TransferScheduler esegue download e upload di singoli file per conto di uno o
+più SMBv1Client: al massimo max_running insieme, e per ogni server al massimo
+max_per_server (default: le sessioni del pool riservate ai trasferimenti).
+A parità di priorità i file piccoli passano davanti a quelli grandi.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from ssmbv1_client import TransferCancelled
+
+logger = logging.getLogger('SMBClient')
+
+# Stati di un job
+QUEUED = "In coda"
+RUNNING = "In corso"
+PAUSED = "In pausa"
+DONE = "Completato"
+FAILED = "Errore"
+CANCELLED = "Annullato"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class TransferJob:
+    """Un download o upload in coda, con progresso e velocità"""
+
+    def __init__(self, job_id, client, kind, remote_path, local_path, share, size, priority, options):
+        self.id = job_id
+        self.client = client
+        # Fissato alla creazione: se il client si riconnette altrove il job resta contato sul suo server
+        self.server = client.server_key
+        self.kind = kind  # 'download' o 'upload'
+        self.remote_path = remote_path
+        self.local_path = local_path
+        self.share = share
+        self.size = size or 0
+        self.priority = priority
+        self.options = options  # Argomenti aggiuntivi per download_file/upload_file
+        self.state = QUEUED
+        self.bytes_done = 0
+        self.last_progress = None  # Ultimo TransferProgress ricevuto dal client
+        self.run_started = None  # Istante di avvio dell'esecuzione corrente
+        self.active_time = 0.0  # Secondi di esecuzione delle esecuzioni concluse
+        self.finished = None
+        self.stop_request = None  # PAUSED o CANCELLED richiesto durante l'esecuzione
+
+    @property
+    def name(self):
+        path = self.remote_path if self.kind == 'download' else self.local_path
+        return os.path.basename(path.replace('\\', '/'))
+
+    @property
+    def progress(self):
+        """Percentuale completata"""
+        if self.state == DONE:
+            return 100.0
+        return self.bytes_done / self.size * 100 if self.size else 0.0
+
+    @property
+    def rate(self):
+        """Byte al secondo dell'esecuzione corrente"""
+        if self.state != RUNNING or self.last_progress is None:
+            return 0.0
+        return self.last_progress.rate
+
+    @property
+    def eta(self):
+        """Secondi stimati alla fine, None se non stimabili"""
+        if self.state != RUNNING or self.last_progress is None:
+            return None
+        return self.last_progress.eta
+
+    def on_progress(self, progress):
+        """progress_callback passato al client: aggiorna il progresso e interrompe su richiesta"""
+        if self.stop_request:
+            raise TransferCancelled(self.stop_request)
+        self.last_progress = progress
+        self.bytes_done = progress.bytes_done
+        if progress.bytes_total:
+            self.size = progress.bytes_total  # Dimensione reale, anche se non nota all'accodamento
+
+
+class TransferScheduler:
+    """Esegue i TransferJob in ordine di priorità entro i limiti di concorrenza"""
+
+    def __init__(self, max_running=3, max_per_server=None, on_change=None):
+        self.max_running = max_running
+        self.max_per_server = max_per_server  # None: pool_size - 1 del client
+        self.on_change = on_change  # Chiamata (dal thread del job) a ogni cambio di stato
+        self._jobs = {}  # id -> job, in ordine di inserimento
+        self._pending = []  # heap di (priorità, dimensione, sequenza, job)
+        self._running = {}  # server -> set di job in esecuzione
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def submit(self, client, kind, remote_path, local_path, size=None, priority=0, **options):
+        """Accoda un trasferimento; priority più bassa passa prima. Restituisce il TransferJob"""
+        if kind not in ('download', 'upload'):
+            raise ValueError(f"Tipo di trasferimento non valido: {kind}")
+        if size is None and kind == 'upload':
+            size = os.path.getsize(local_path)
+        with self._cond:
+            job = TransferJob(next(self._ids), client, kind, remote_path, local_path, client.current_share,
+                              size, priority, options)
+            self._jobs[job.id] = job
+            self._push(job)
+            self._dispatch()
+        self._changed(job)
+        return job
+
+    def jobs(self):
+        """Copia della lista dei job, in ordine di inserimento"""
+        with self._cond:
+            return list(self._jobs.values())
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def pause(self, job_id):
+        """Mette in pausa un job in coda o in corso; quello in corso si ferma al blocco successivo"""
+        return self._stop(job_id, PAUSED)
+
+    def cancel(self, job_id):
+        """Annulla un job ed elimina il file parziale: il .part locale dei download, il file
+        remoto degli upload già avviati (un upload mai partito non tocca il server)"""
+        return self._stop(job_id, CANCELLED)
+
+    def resume(self, job_id):
+        """Rimette in coda un job in pausa: riprende dai byte già trasferiti"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state != PAUSED:
+                return False
+            job.state = QUEUED
+            self._push(job)
+            self._dispatch()
+        self._changed(job)
+        return True
+
+    def retry(self, job_id):
+        """Rimette in coda un job fallito o annullato"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state not in (FAILED, CANCELLED):
+                return False
+            job.state = PAUSED
+        return self.resume(job_id)
+
+    def clear_finished(self):
+        """Toglie dalla lista i job conclusi"""
+        with self._cond:
+            for job_id in [i for i, job in self._jobs.items() if job.state in FINISHED_STATES]:
+                del self._jobs[job_id]
+
+    def stats(self):
+        """Totali della coda: job per stato, byte trasferiti e velocità complessiva"""
+        with self._cond:
+            jobs = list(self._jobs.values())
+        counts = {state: 0 for state in (QUEUED, RUNNING, PAUSED, DONE, FAILED, CANCELLED)}
+        for job in jobs:
+            counts[job.state] += 1
+        active = [job for job in jobs if job.state in (QUEUED, RUNNING, PAUSED)]
+        return {
+            'counts': counts,
+            'rate': sum(job.rate for job in jobs if job.state == RUNNING),
+            'bytes_done': sum(job.bytes_done for job in active),
+            'bytes_total': sum(job.size for job in active),
+        }
+
+    def wait(self, timeout=None):
+        """Attende che non ci siano job in coda o in corso; False allo scadere di timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while any(job.state in (QUEUED, RUNNING) for job in self._jobs.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self):
+        """Mette in pausa tutti i job attivi, ad esempio prima di disconnettersi: ripresi, continuano da dove erano"""
+        for job in self.jobs():
+            if job.state in (QUEUED, RUNNING, PAUSED):
+                self._stop(job.id, PAUSED)
+
+    # --- Interni ---
+    def _push(self, job):
+        heapq.heappush(self._pending, (job.priority, job.size, next(self._seq), job))
+
+    def _running_count(self):
+        return sum(len(jobs) for jobs in self._running.values())
+
+    def _server_limit(self, job):
+        if self.max_per_server:
+            return self.max_per_server
+        return max(1, job.client.pool_size - 1)
+
+    def _dispatch(self):
+        """Avvia i job in attesa finché i limiti lo consentono (con il lock acquisito)"""
+        deferred = []
+        while self._pending and self._running_count() < self.max_running:
+            entry = heapq.heappop(self._pending)
+            job = entry[3]
+            if job.state != QUEUED:
+                continue  # Messo in pausa o annullato mentre era in coda
+            running = self._running.setdefault(job.server, set())
+            if len(running) >= self._server_limit(job):
+                deferred.append(entry)
+                continue
+            running.add(job)
+            job.state = RUNNING
+            job.stop_request = None
+            job.run_started = time.monotonic()
+            job.last_progress = None
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        for entry in deferred:
+            heapq.heappush(self._pending, entry)
+
+    def _run(self, job):
+        self._changed(job)
+        try:
+            if job.kind == 'download':
+                ok = job.client.download_file(job.remote_path, job.local_path, job.on_progress,
+                                              share=job.share, **job.options)
+            else:
+                ok = job.client.upload_file(job.local_path, job.remote_path, job.on_progress,
+                                            share=job.share, **job.options)
+        except Exception as e:
+            logger.error(f"Errore trasferimento {job.name}: {e}")
+            ok = False
+
+        state = DONE if ok else job.stop_request or FAILED
+        if state == CANCELLED:
+            self._discard_partial(job)
+        with self._cond:
+            self._running[job.server].discard(job)
+            job.active_time += time.monotonic() - job.run_started
+            job.run_started = None
+            job.state = state
+            if ok:
+                job.bytes_done = job.size
+            if state in FINISHED_STATES:
+                job.finished = time.monotonic()
+            self._dispatch()
+            self._cond.notify_all()
+        self._changed(job)
+
+    def _stop(self, job_id, state):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state in FINISHED_STATES:
+                return False
+            if job.state == RUNNING:
+                job.stop_request = state  # Il thread del job aggiorna lo stato all'uscita
+                return True
+            if job.state == state:
+                return True
+            job.state = state
+            if state == CANCELLED:
+                job.finished = time.monotonic()
+            self._cond.notify_all()
+        if state == CANCELLED:
+            self._discard_partial(job)
+        self._changed(job)
+        return True
+
+    @staticmethod
+    def _discard_partial(job):
+        if job.kind == 'download':
+            try:
+                os.remove(job.local_path + '.part')
+            except OSError:
+                pass
+        elif job.run_started is not None or job.active_time:
+            # Richiede il server: fuori dal thread chiamante, che può essere quello della GUI
+            logger.info(f"Upload annullato, eliminazione del file remoto parziale {job.remote_path}")
+            threading.Thread(target=job.client.delete_file, args=(job.remote_path, job.share), daemon=True).start()
+
+    def _changed(self, job):
+        if self.on_change:
+            try:
+                self.on_change(job)
+            except Exception as e:
+                logger.error(f"Errore notifica coda trasferimenti: {e}")